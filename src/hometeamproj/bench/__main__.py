@@ -0,0 +1,161 @@
+"""
+Benchmark suite entrypoint.
+
+    python -m hometeamproj.bench --resolutions 640x360,1280x720 --movers 2,16
+    python -m hometeamproj.bench --compare bench_baseline.json
+    python -m hometeamproj.bench --stages "" --startup spawn,forkserver
+
+Generates deterministic synthetic clips, benchmarks every stage in isolation
+plus the end-to-end pipeline, and writes the results as JSON. With
+--compare, runs that lose more than --tolerance fps (or gain that much p99
+latency) against the baseline file are reported and the exit status is 1.
+With --startup, also times `python -m hometeamproj.main` from launch to the
+first frame written, per start method, on the first resolution and density.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+from hometeamproj.bench.stages import STAGES, bench_config, run_benchmark
+from hometeamproj.bench.startup import measure_startup
+from hometeamproj.bench.synthetic import clip_name, generate_clip
+from hometeamproj.config import PipelineConfig
+
+
+DEFAULT_CONFIG = Path(__file__).resolve().parents[1] / "config.ini"
+
+
+def _parse_resolutions(value: str) -> list:
+    resolutions = []
+    for item in value.split(","):
+        w, h = item.lower().split("x")
+        resolutions.append((int(w), int(h)))
+    return resolutions
+
+
+def _parse_ints(value: str) -> list:
+    return [int(v) for v in value.split(",") if v]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HomeTeam pipeline benchmarks")
+    parser.add_argument("--config", default=str(DEFAULT_CONFIG), help="Base config.ini")
+    parser.add_argument("--resolutions", type=_parse_resolutions, default="640x360,1280x720")
+    parser.add_argument("--movers", type=_parse_ints, default="2,16", help="Motion densities (moving objects)")
+    parser.add_argument("--fps", type=float, default=30.0, help="Synthetic clip frame rate")
+    parser.add_argument("--seconds", type=float, default=4.0, help="Synthetic clip length")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Subset of {','.join(STAGES)}")
+    parser.add_argument("--clips-dir", default=".cache/bench_clips", help="Where synthetic clips are kept")
+    parser.add_argument("--output", default="bench_results.json", help="Results file (JSON)")
+    parser.add_argument("--compare", default=None, help="Baseline results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    parser.add_argument("--startup", default="", help="Start methods to time to first frame, e.g. spawn,forkserver")
+    parser.add_argument("--startup-runs", type=int, default=3, help="Launches per start method (median is reported)")
+    return parser.parse_args(argv)
+
+
+def _key(result: dict) -> tuple:
+    case = result["case"]
+    return (case["width"], case["height"], case["movers"], result["stage"])
+
+
+def compare(current: list, baseline: list, tolerance: float) -> list:
+    """Human-readable regressions of `current` against `baseline`."""
+    previous = {_key(r): r for r in baseline}
+    regressions = []
+    for result in current:
+        old = previous.get(_key(result))
+        if old is None:
+            continue
+        name = "{}x{} m{} {}".format(*_key(result))
+
+        if old["fps"] and result["fps"] < old["fps"] * (1.0 - tolerance):
+            regressions.append(f"{name}: fps {old['fps']:.1f} -> {result['fps']:.1f}")
+        if old.get("p99_ms") and result.get("p99_ms") and result["p99_ms"] > old["p99_ms"] * (1.0 + tolerance):
+            regressions.append(f"{name}: p99 {old['p99_ms']:.2f}ms -> {result['p99_ms']:.2f}ms")
+    return regressions
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    base_config = PipelineConfig.from_file(args.config)
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    def clip_for(width, height, movers):
+        return generate_clip(
+            os.path.join(args.clips_dir, clip_name(width, height, movers, args.fps, args.seconds)),
+            width=width,
+            height=height,
+            fps=args.fps,
+            seconds=args.seconds,
+            movers=movers,
+        )
+
+    results = []
+    for width, height in args.resolutions:
+        for movers in args.movers:
+            if not stages:
+                continue
+            clip = clip_for(width, height, movers)
+            config = bench_config(base_config, width, height)
+
+            for stage in stages:
+                result = run_benchmark(stage, clip, config)
+                entry = {"case": {"width": width, "height": height, "movers": movers}, **result.to_dict()}
+                results.append(entry)
+
+                p99 = f"{result.p99_ms:.2f}ms" if result.p99_ms is not None else "-"
+                print(
+                    f"bench {width}x{height} m{movers} {stage:<9} {result.fps:8.1f} fps  "
+                    f"p99 {p99:>9}  rss {result.peak_rss_mb:7.1f} MB  ipc {result.ipc_bytes}"
+                )
+
+    startup = []
+    methods = [m.strip() for m in args.startup.split(",") if m.strip()]
+    if methods:
+        (width, height), movers = args.resolutions[0], args.movers[0]
+        clip = clip_for(width, height, movers)
+        for method in methods:
+            result = measure_startup(clip, args.config, width, height, method, runs=args.startup_runs)
+            startup.append({"case": {"width": width, "height": height, "movers": movers}, **result.to_dict()})
+            first = f"{result.first_frame_s:.2f}s" if result.first_frame_s is not None else "-"
+            print(
+                f"bench startup {width}x{height} {method:<10} first frame {first:>7}  "
+                f"exit {result.total_s:.2f}s  (median of {result.runs})"
+            )
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "clip": {"fps": args.fps, "seconds": args.seconds},
+        "config": asdict(base_config),
+        "results": results,
+        "startup": startup,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"bench: wrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            return 1
+        print("bench: no regressions against", args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
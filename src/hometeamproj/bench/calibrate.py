@@ -0,0 +1,353 @@
+# bench/calibrate.py
+"""
+Hardware calibration: `python -m hometeamproj.main --mode calibrate`.
+
+Profiles each stage in-process on a sample clip (the first [calibrate]
+sample_seconds of --input) on the current machine and writes a tuned copy
+of the config to <output>/config.ini. Starting from the per-frame cost of
+every stage, it picks:
+
+- detection scale and workers: the largest scale, up to [detection] scale,
+  whose detector cost the remaining cores can absorb at the target fps;
+- encode threads: enough to keep up with the writer's JPEG stills (video
+  frames are written by one thread, so without stills one is enough);
+- queue sizes, ring slots and writes in flight, in frames: about
+  latency_budget of buffering at the target fps, shrunk to fit the memory
+  limit after the stage processes' own footprint.
+
+The target fps defaults to real time ([processing] target_fps); the CPU
+and memory limits default to what the container (cgroup) allows. The
+measurements are recorded in a [calibration] section of the tuned file,
+which PipelineConfig.from_file ignores.
+"""
+
+import configparser
+import math
+import multiprocessing as mp
+import os
+import tempfile
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+
+import cv2
+
+from hometeamproj.bench.stages import _frames, _peak_rss_mb, _run_stage, bench_config
+from hometeamproj.config import PipelineConfig
+
+
+# Plan for stages running at this fraction of their measured speed
+HEADROOM = 1.25
+
+# Share of the memory limit that frames and stage processes may use
+MEMORY_FRACTION = 0.8
+
+MIN_QUEUE_SIZE = 4
+MAX_QUEUE_SIZE = 256
+
+
+@dataclass
+class StageCosts:
+    """Measured seconds of CPU per processed frame, per stage."""
+
+    frames: int
+    reader: float
+    detector: dict  # detection scale -> seconds per frame
+    viewport: float
+    writer: float  # with one encode thread
+    process_rss_mb: float  # footprint of one idle stage process
+
+
+@dataclass
+class CalibrationPlan:
+    target_fps: float
+    cpus: int
+    memory_mb: float
+    detection_scale: float
+    detection_workers: int
+    encode_threads: int
+    queue_max_size: int
+    ring_slots: int
+    max_inflight_writes: int
+    expected_fps: float
+    expected_memory_mb: float
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _read_first_line(path: str) -> str:
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return ""
+
+
+def available_cpus() -> int:
+    """Cores this process may use: affinity mask, capped by a cgroup CPU quota (ECS task cpu)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = _read_first_line("/sys/fs/cgroup/cpu.max").split()  # cgroup v2: "<quota> <period>"
+    if len(quota) != 2:
+        quota = [
+            _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"),  # cgroup v1
+            _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us"),
+        ]
+    try:
+        limit, period = int(quota[0]), int(quota[1])
+    except ValueError:
+        return max(1, cpus)  # "max" or no cgroup: unlimited
+    if limit > 0 and period > 0:
+        cpus = min(cpus, math.ceil(limit / period))
+    return max(1, cpus)
+
+
+def available_memory_mb() -> float:
+    """Memory this process may use: the cgroup limit if there is one, else physical memory."""
+    total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") if hasattr(os, "sysconf") else 0
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        value = _read_first_line(path)
+        if value.isdigit() and (total <= 0 or int(value) < total):
+            total = int(value)
+    return total / (1024 * 1024)
+
+
+def _idle_stage_rss(results):
+    from hometeamproj.main import PRELOAD_MODULES
+    import importlib
+
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    results.put(_peak_rss_mb())
+
+
+def measure_process_rss() -> float:
+    """Peak RSS (MB) of a fresh process with the stage modules imported."""
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_idle_stage_rss, args=(results,))
+    proc.start()
+    rss = results.get()
+    proc.join()
+    return rss
+
+
+def detection_scales(config: PipelineConfig) -> list:
+    """Candidate detection scales, from [detection] scale halving down to min_detection_scale."""
+    scale = min(1.0, float(config.detection_scale))
+    floor = min(scale, float(config.min_detection_scale))
+    scales = []
+    while scale >= floor - 1e-9:
+        scales.append(round(scale, 4))
+        scale /= 2.0
+    return scales
+
+
+def profile_stages(clip: str, config: PipelineConfig, sample_frames: int) -> StageCosts:
+    """Time every stage in-process on the first sample_frames source frames of clip."""
+    from hometeamproj.pipeline.detector import DetectionProcess
+    from hometeamproj.pipeline.frame_reader import FrameReaderProcess
+    from hometeamproj.pipeline.output_writer import OutputWriterProcess
+    from hometeamproj.pipeline.viewport_worker import ViewportCalculatorProcess
+
+    config = replace(config, detection_workers=1, adaptive_enabled=False, realtime_pacing=False)
+
+    _, frames_q, read_s = _run_stage(
+        lambda _in, out: FrameReaderProcess(clip, out, config, end_frame=sample_frames), [], config
+    )
+    frames = _frames(frames_q)
+    n = len(frames)
+    if n == 0:
+        raise RuntimeError(f"calibrate: no frames read from {clip}")
+    print(f"Calibrate: reader {1000 * read_s / n:.1f} ms/frame over {n} frames")
+
+    detector = {}
+    detections = None
+    for scale in detection_scales(config):
+        scaled = replace(config, detection_scale=scale)
+        _, det_q, seconds = _run_stage(lambda in_q, out: DetectionProcess(in_q, out, scaled), frames, scaled)
+        detector[scale] = seconds / n
+        detections = detections or _frames(det_q)
+        print(f"Calibrate: detector at scale {scale:g} {1000 * seconds / n:.1f} ms/frame")
+
+    _, vp_q, vp_s = _run_stage(
+        lambda in_q, out: ViewportCalculatorProcess(in_q, out, config), detections, config
+    )
+    print(f"Calibrate: viewport {1000 * vp_s / n:.1f} ms/frame")
+
+    single = replace(config, encode_threads=1)
+    with tempfile.TemporaryDirectory(prefix="calibrate_writer_") as output_dir:
+        _, _, write_s = _run_stage(
+            lambda in_q, _out: OutputWriterProcess(in_q, output_dir, single), _frames(vp_q), single
+        )
+    print(f"Calibrate: writer {1000 * write_s / n:.1f} ms/frame with one encode thread")
+
+    return StageCosts(
+        frames=n,
+        reader=read_s / n,
+        detector=detector,
+        viewport=vp_s / n,
+        writer=write_s / n,
+        process_rss_mb=measure_process_rss(),
+    )
+
+
+def _in_flight_detection(workers: int, chunk_size: int) -> int:
+    """Frames the detection stage holds besides its queues (see create_detection_stage)."""
+    return 2 if workers <= 1 else chunk_size * (workers * 3 + 1)
+
+
+def plan_calibration(
+    config: PipelineConfig, costs: StageCosts, target_fps: float, cpus: int, memory_mb: float
+) -> CalibrationPlan:
+    """Size workers, threads and buffers so every stage keeps up with target_fps within the limits."""
+    from hometeamproj.pipeline.writer_engine import resolve_output_profile
+
+    def need(seconds: float) -> float:
+        # Cores kept busy by a stage costing `seconds` per frame at target_fps
+        return target_fps * seconds * HEADROOM
+
+    # JPEG stills are the only work the encode thread pool parallelises
+    profile = resolve_output_profile(config.output_profile)
+    stills = profile.viewport_stills or profile.overlay_stills
+    encode_threads = max(1, min(cpus, math.ceil(need(costs.writer)))) if stills else 1
+    writer_cores = need(costs.writer)
+
+    # Largest scale whose workers fit next to the other stages
+    others = need(costs.reader) + need(costs.viewport) + writer_cores
+    spare = max(1.0, cpus - others)
+    scales = sorted(costs.detector, reverse=True)
+    scale = scales[-1]
+    for candidate in scales:
+        if need(costs.detector[candidate]) <= spare:
+            scale = candidate
+            break
+    workers = max(1, min(math.ceil(need(costs.detector[scale])), int(spare)))
+
+    writer_fps = encode_threads / costs.writer if stills else 1.0 / costs.writer
+    expected_fps = min(
+        1.0 / costs.reader,
+        1.0 / costs.viewport if costs.viewport > 0 else float("inf"),
+        workers / costs.detector[scale],
+        writer_fps,
+        cpus / (costs.reader + costs.detector[scale] + costs.viewport + costs.writer),
+    )
+
+    # Buffering: about latency_budget of frames across the three queues
+    frame_mb = config.frame_resize_width * config.frame_resize_height * 3 / (1024 * 1024)
+    shared_memory = str(config.frame_transport).lower() in ("shared_memory", "shm")
+    processes = 4 + workers + (2 if workers > 1 else 0)  # parent, reader, viewport, writer + detection
+    in_flight = _in_flight_detection(workers, int(config.detection_chunk_size))
+    budget = memory_mb * MEMORY_FRACTION - processes * costs.process_rss_mb
+
+    def frames_mb(queue_size: int, inflight_writes: int) -> float:
+        # Writer jobs hold the overlay (full frame) and the crop
+        frames = 3 * queue_size + in_flight + 4 + 2 * inflight_writes
+        if not shared_memory:
+            frames += 3 * queue_size  # pickled copies in the queue feeder threads
+        return frames * frame_mb
+
+    queue_size = max(MIN_QUEUE_SIZE, min(MAX_QUEUE_SIZE, math.ceil(target_fps * config.latency_budget / 3)))
+    inflight_writes = max(4, 2 * encode_threads)
+    while frames_mb(queue_size, inflight_writes) > budget and queue_size > MIN_QUEUE_SIZE:
+        queue_size -= 1
+    while frames_mb(queue_size, inflight_writes) > budget and inflight_writes > 1:
+        inflight_writes -= 1
+    if frames_mb(queue_size, inflight_writes) > budget:
+        print(
+            f"Calibrate: {memory_mb:.0f} MB is not enough for {processes} stage processes "
+            f"(~{processes * costs.process_rss_mb:.0f} MB) plus minimal buffering of "
+            f"{config.frame_resize_width}x{config.frame_resize_height} frames; lower frame_resize_* or add memory"
+        )
+
+    if expected_fps < target_fps:
+        print(
+            f"Calibrate: target {target_fps:g} fps is out of reach on {cpus} cores, "
+            f"expect about {expected_fps:.1f} fps"
+        )
+
+    return CalibrationPlan(
+        target_fps=target_fps,
+        cpus=cpus,
+        memory_mb=memory_mb,
+        detection_scale=scale,
+        detection_workers=workers,
+        encode_threads=encode_threads,
+        queue_max_size=queue_size,
+        ring_slots=3 * queue_size + in_flight + 4,
+        max_inflight_writes=inflight_writes,
+        expected_fps=expected_fps,
+        expected_memory_mb=processes * costs.process_rss_mb + frames_mb(queue_size, inflight_writes),
+    )
+
+
+def write_tuned_config(base_config: str, path: str, plan: CalibrationPlan, costs: StageCosts) -> str:
+    """Copy base_config with the plan's settings applied; returns path."""
+    parser = configparser.ConfigParser()
+    parser.read(base_config)
+    settings = {
+        ("queues", "max_size"): plan.queue_max_size,
+        ("transport", "ring_slots"): plan.ring_slots,
+        ("detection", "scale"): f"{plan.detection_scale:g}",
+        ("detection", "workers"): plan.detection_workers,
+        ("output", "encode_threads"): plan.encode_threads,
+        ("output", "max_inflight"): plan.max_inflight_writes,
+        ("batch", "cpu_budget"): plan.cpus,
+    }
+    for (section, key), value in settings.items():
+        if not parser.has_section(section):
+            parser.add_section(section)
+        parser.set(section, key, str(value))
+
+    if parser.has_section("calibration"):
+        parser.remove_section("calibration")
+    parser.add_section("calibration")
+    measured = {
+        "target_fps": f"{plan.target_fps:g}",
+        "expected_fps": f"{plan.expected_fps:.1f}",
+        "cpus": plan.cpus,
+        "memory_mb": f"{plan.memory_mb:.0f}",
+        "expected_memory_mb": f"{plan.expected_memory_mb:.0f}",
+        "sample_frames": costs.frames,
+        "reader_ms": f"{1000 * costs.reader:.2f}",
+        "viewport_ms": f"{1000 * costs.viewport:.2f}",
+        "writer_ms": f"{1000 * costs.writer:.2f}",
+        "process_rss_mb": f"{costs.process_rss_mb:.0f}",
+    }
+    for scale, seconds in sorted(costs.detector.items(), reverse=True):
+        measured[f"detector_ms_scale_{scale:g}"] = f"{1000 * seconds:.2f}"
+    for key, value in measured.items():
+        parser.set("calibration", key, str(value))
+
+    with open(path, "w") as f:
+        parser.write(f)
+    return path
+
+
+def run_calibration(config: PipelineConfig, config_path: str, clip: str, output_dir: str) -> str:
+    """Profile the stages on clip, plan for the [calibrate] targets and write <output_dir>/config.ini."""
+    cap = cv2.VideoCapture(clip)
+    video_fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0.0
+    cap.release()
+    video_fps = video_fps if video_fps and video_fps > 0 else 30.0
+    sample_frames = max(1, int(float(config.calibrate_sample_seconds) * video_fps))
+
+    target_fps = float(config.calibrate_target_fps) or float(config.target_fps)
+    cpus = available_cpus()
+    memory_mb = float(config.calibrate_memory_mb) or available_memory_mb()
+    print(f"Calibrate: targeting {target_fps:g} fps on {cpus} cores within {memory_mb:.0f} MB")
+
+    costs = profile_stages(clip, bench_config(config, config.frame_resize_width, config.frame_resize_height), sample_frames)
+    plan = plan_calibration(config, costs, target_fps, cpus, memory_mb)
+
+    path = write_tuned_config(config_path, str(Path(output_dir) / "config.ini"), plan, costs)
+    print(
+        f"Calibrate: detection scale {plan.detection_scale:g} x{plan.detection_workers} workers, "
+        f"{plan.encode_threads} encode threads, queues of {plan.queue_max_size} frames, "
+        f"{plan.ring_slots} ring slots; expect ~{plan.expected_fps:.1f} fps and ~{plan.expected_memory_mb:.0f} MB"
+    )
+    print(f"Calibrate: wrote {path}")
+    return path
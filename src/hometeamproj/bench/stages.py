@@ -0,0 +1,245 @@
+# bench/stages.py
+"""
+Per-stage and end-to-end benchmarks.
+
+Each stage's run() is driven in-process between recording queues, so the
+stage is measured in isolation on pre-computed inputs. Every benchmark runs
+in a fresh spawned process so peak RSS belongs to that benchmark alone.
+"""
+
+import multiprocessing as mp
+import os
+import pickle
+import queue
+import resource
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, replace
+from typing import Optional
+
+import numpy as np
+
+from hometeamproj.config import PipelineConfig
+
+
+STAGES = ("reader", "detector", "viewport", "writer", "e2e")
+
+
+@dataclass
+class StageResult:
+    """Benchmark numbers for one stage on one clip (None = not measured)."""
+
+    stage: str
+    frames_in: int
+    frames_out: int
+    seconds: float
+    fps: float
+    p50_ms: Optional[float]
+    p99_ms: Optional[float]
+    peak_rss_mb: float
+    ipc_bytes: Optional[int]
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class RecordingQueue:
+    """
+    In-process stand-in for a multiprocessing.Queue.
+
+    Timestamps every get/put by frame_id and counts the bytes each put would
+    have pickled onto a real queue with the configured frame transport.
+    """
+
+    def __init__(self, items=(), shared_memory: bool = False):
+        self._q = queue.Queue()
+        for item in items:
+            self._q.put(item)
+        self.shared_memory = shared_memory
+        self.get_times = {}
+        self.put_times = {}
+        self.items = []
+        self.ipc_bytes = 0
+
+    def get(self, block=True, timeout=None):
+        item = self._q.get(block, timeout)
+        if item is not None:
+            self.get_times[item.frame_id] = time.perf_counter()
+        return item
+
+    def put(self, item, block=True, timeout=None):
+        if item is not None:
+            self.put_times[item.frame_id] = time.perf_counter()
+            payload = item
+            if self.shared_memory and getattr(item, "frame", None) is not None:
+                # With a shared-memory ring only the slot index crosses the queue
+                payload = replace(item, frame=None, slot=0)
+            self.ipc_bytes += len(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+        self.items.append(item)
+
+    def qsize(self):
+        return self._q.qsize()
+
+
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    rss = max(rss, children)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _percentiles(latencies) -> tuple:
+    if len(latencies) == 0:
+        return None, None
+    ms = np.asarray(latencies, dtype=np.float64) * 1000.0
+    return float(np.percentile(ms, 50)), float(np.percentile(ms, 99))
+
+
+def _shared_memory(config: PipelineConfig) -> bool:
+    return str(getattr(config, "frame_transport", "queue")).lower() in ("shared_memory", "shm")
+
+
+def _inputs(items):
+    return list(items) + ([None] if not items or items[-1] is not None else [])
+
+
+def _run_stage(stage_factory, inputs, config: PipelineConfig):
+    """Run one stage's run() in-process; returns (in_queue, out_queue, seconds)."""
+    in_q = RecordingQueue(_inputs(inputs))
+    out_q = RecordingQueue(shared_memory=_shared_memory(config))
+    stage = stage_factory(in_q, out_q)
+
+    start = time.perf_counter()
+    stage.run()
+    return in_q, out_q, time.perf_counter() - start
+
+
+def _read(clip: str, config: PipelineConfig):
+    from hometeamproj.pipeline.frame_reader import FrameReaderProcess
+    return _run_stage(lambda _in, out: FrameReaderProcess(clip, out, config), [], config)
+
+
+def _detect(frames, config: PipelineConfig):
+    from hometeamproj.pipeline.detector import DetectionProcess
+    return _run_stage(lambda in_q, out: DetectionProcess(in_q, out, config), frames, config)
+
+
+def _viewport(detections, config: PipelineConfig):
+    from hometeamproj.pipeline.viewport_worker import ViewportCalculatorProcess
+    return _run_stage(lambda in_q, out: ViewportCalculatorProcess(in_q, out, config), detections, config)
+
+
+def _write(viewports, config: PipelineConfig, output_dir: str):
+    from hometeamproj.pipeline.output_writer import OutputWriterProcess
+    return _run_stage(lambda in_q, _out: OutputWriterProcess(in_q, output_dir, config), viewports, config)
+
+
+def _frames(q: RecordingQueue) -> list:
+    return [item for item in q.items if item is not None]
+
+
+def _bench_stage(stage: str, clip: str, config: PipelineConfig, output_dir: str) -> dict:
+    """Runs inside a fresh process: prepare upstream inputs, then time `stage`."""
+    if stage == "reader":
+        in_q, out_q, seconds = _read(clip, config)
+        # Per-frame cost: interval between successive outputs
+        puts = sorted(out_q.put_times.values())
+        latencies = np.diff(puts) if len(puts) > 1 else []
+    else:
+        _, frames_q, _ = _read(clip, config)
+        if stage == "detector":
+            in_q, out_q, seconds = _detect(_frames(frames_q), config)
+        else:
+            _, det_q, _ = _detect(_frames(frames_q), config)
+            if stage == "viewport":
+                in_q, out_q, seconds = _viewport(_frames(det_q), config)
+            else:
+                _, vp_q, _ = _viewport(_frames(det_q), config)
+                in_q, out_q, seconds = _write(_frames(vp_q), config, output_dir)
+
+        if stage == "writer":
+            # No output queue: per-frame service time between successive gets
+            gets = sorted(in_q.get_times.values())
+            latencies = np.diff(gets) if len(gets) > 1 else []
+        else:
+            latencies = [out_q.put_times[i] - in_q.get_times[i] for i in out_q.put_times if i in in_q.get_times]
+
+    frames_in = len(in_q.get_times)
+    frames_out = frames_in if stage == "writer" else len(out_q.put_times)
+    p50, p99 = _percentiles(latencies)
+    return StageResult(
+        stage=stage,
+        frames_in=frames_in,
+        frames_out=frames_out,
+        seconds=seconds,
+        fps=frames_out / seconds if seconds > 0 else 0.0,
+        p50_ms=p50,
+        p99_ms=p99,
+        peak_rss_mb=_peak_rss_mb(),
+        ipc_bytes=None if stage == "writer" else out_q.ipc_bytes,
+    ).to_dict()
+
+
+def _bench_end_to_end(clip: str, config: PipelineConfig, output_dir: str) -> dict:
+    """Runs inside a fresh process: the full multi-process streaming pipeline."""
+    import cv2
+    from pathlib import Path
+    from hometeamproj.main import run_streaming
+
+    start = time.perf_counter()
+    run_streaming(config, Path(clip), Path(output_dir))
+    seconds = time.perf_counter() - start
+
+    cap = cv2.VideoCapture(os.path.join(output_dir, "output_viewport.mp4"))
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    cap.release()
+
+    return StageResult(
+        stage="e2e",
+        frames_in=frames,
+        frames_out=frames,
+        seconds=seconds,
+        fps=frames / seconds if seconds > 0 else 0.0,
+        # Per-frame latency and IPC volume are only observable per stage
+        p50_ms=None,
+        p99_ms=None,
+        peak_rss_mb=_peak_rss_mb(),
+        ipc_bytes=None,
+    ).to_dict()
+
+
+def _dispatch(stage: str, clip: str, config: PipelineConfig, output_dir: str) -> dict:
+    if stage == "e2e":
+        return _bench_end_to_end(clip, config, output_dir)
+    return _bench_stage(stage, clip, config, output_dir)
+
+
+def bench_config(config: PipelineConfig, width: int, height: int) -> PipelineConfig:
+    """Benchmark copy of config: frames at the clip's resolution, no detection cache."""
+    return replace(config, frame_resize_width=width, frame_resize_height=height, detection_cache_enabled=False)
+
+
+def _child(results, stage, clip, config, output_dir):
+    try:
+        results.put(_dispatch(stage, clip, config, output_dir))
+    except BaseException as e:
+        results.put(e)
+        raise
+
+
+def run_benchmark(stage: str, clip: str, config: PipelineConfig) -> StageResult:
+    """Benchmark one stage on one clip in a fresh spawned process."""
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory(prefix=f"bench_{stage}_") as output_dir:
+        results = ctx.Queue()
+        # Not a Pool: pool workers are daemonic and the e2e run starts children
+        proc = ctx.Process(target=_child, args=(results, stage, clip, config, output_dir))
+        proc.start()
+        result = results.get()
+        proc.join()
+
+    if isinstance(result, BaseException):
+        raise RuntimeError(f"benchmark {stage} failed on {clip}") from result
+    return StageResult(**result)
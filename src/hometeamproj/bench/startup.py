@@ -0,0 +1,100 @@
+# bench/startup.py
+"""
+Startup benchmark.
+
+Launches `python -m hometeamproj.main` on a clip exactly as a user would and
+times how long it takes until the writer receives its first frame, once
+per multiprocessing start method. This covers interpreter start-up, imports
+in the parent and in every stage process, and the pipeline filling up.
+"""
+
+import configparser
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+
+# Printed by OutputWriterProcess for every frame it handles
+FIRST_FRAME_MARKER = "OutputWriterProcess: got frame"
+
+SRC_DIR = Path(__file__).resolve().parents[2]
+
+
+@dataclass
+class StartupResult:
+    """Median (and best) seconds to first frame and to exit over `runs` launches."""
+
+    start_method: str
+    runs: int
+    first_frame_s: Optional[float]
+    first_frame_min_s: Optional[float]
+    total_s: float
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def startup_config(base_config: str, path: str, width: int, height: int, start_method: str) -> str:
+    """Write a copy of base_config for the clip's resolution and start method; returns path."""
+    parser = configparser.ConfigParser()
+    parser.read(base_config)
+    for section in ("processing", "cache"):
+        if not parser.has_section(section):
+            parser.add_section(section)
+    parser.set("processing", "frame_resize_width", str(width))
+    parser.set("processing", "frame_resize_height", str(height))
+    parser.set("processing", "start_method", start_method)
+    parser.set("cache", "enabled", "false")
+    with open(path, "w") as f:
+        parser.write(f)
+    return path
+
+
+def _launch(config_path: str, clip: str, output_dir: str) -> tuple:
+    """One run: (seconds to first frame or None, seconds to exit)."""
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(SRC_DIR), env.get("PYTHONPATH", "")) if p)
+    cmd = [
+        sys.executable, "-m", "hometeamproj.main",
+        "--config", config_path, "--input", clip, "--output", output_dir, "--mode", "stream",
+    ]
+
+    start = time.perf_counter()
+    first_frame = None
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+    for line in proc.stdout:
+        if first_frame is None and FIRST_FRAME_MARKER in line:
+            first_frame = time.perf_counter() - start
+    proc.wait()
+    total = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"startup benchmark run exited with status {proc.returncode}: {' '.join(cmd)}")
+    return first_frame, total
+
+
+def measure_startup(
+    clip: str, base_config: str, width: int, height: int, start_method: str, runs: int = 3
+) -> StartupResult:
+    """Launch the pipeline `runs` times with start_method and summarise the timings."""
+    firsts, totals = [], []
+    with tempfile.TemporaryDirectory(prefix=f"bench_startup_{start_method}_") as tmp:
+        config_path = startup_config(base_config, os.path.join(tmp, "config.ini"), width, height, start_method)
+        for i in range(max(1, runs)):
+            first, total = _launch(config_path, clip, os.path.join(tmp, f"run{i}"))
+            totals.append(total)
+            if first is not None:
+                firsts.append(first)
+
+    return StartupResult(
+        start_method=start_method,
+        runs=len(totals),
+        first_frame_s=statistics.median(firsts) if firsts else None,
+        first_frame_min_s=min(firsts) if firsts else None,
+        total_s=statistics.median(totals),
+    )
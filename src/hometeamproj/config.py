@@ -26,37 +26,126 @@ class PipelineConfig:
     target_fps: int
     frame_resize_width: int
     frame_resize_height: int
+    decode_mode: str = "auto"  # read | grab | seek | auto
+    seek_min_skip: int = 60  # auto mode: seek instead of grab from this skip interval
+    buffer_pool: bool = True  # reuse per-frame buffers (OpenCV dst=) instead of allocating them
+    start_method: str = "auto"  # auto | forkserver | spawn | fork
+
+    # Queue memory budget, in MB of buffered frames (0 = only max_size items)
+    queue_max_mb: float = 0.0  # per queue
+    queue_total_mb: float = 0.0  # all queues together; also caps the shared memory ring
+    queue_policy: str = "block"  # block | drop when a put does not fit the budget
+    queue_reorder_window: int = 0  # frames a stage queue holds back waiting for a missing one
+
+    # Transport settings
+    frame_transport: str = "queue"  # "queue" (pickled frames) or "shared_memory"
+    ring_slots: int = 32
+
+    # Detection runs on a proxy downscaled by this factor (1.0 = full frame)
+    detection_scale: float = 1.0
+
+    # Motion backend: contours (findContours), blocks (NumPy block grid) or
+    # motion_vectors (codec motion vectors via PyAV, offline detection pass only)
+    detection_backend: str = "contours"
+    block_size: int = 32  # blocks backend: grid cell size in full-frame pixels
+    block_min_fill: float = 0.1  # fraction of a cell that must change for it to count
+    detection_heatmap: bool = False  # blocks backend: also emit a motion heatmap for the viewport
+    mv_min_magnitude: float = 1.0  # motion_vectors backend: shortest vector that counts as motion, output pixels
+
+    # Viewport-guided detection windows (stream, live and batch modes, single detector process)
+    roi_enabled: bool = False
+    roi_padding: float = 0.1  # window margin on each side, as a fraction of the viewports' size
+    roi_full_scan_interval: int = 30  # frames between full-frame scans
+    roi_lost_frames: int = 3  # empty windows after motion before a full scan
+    roi_max_lag: float = 1.0  # seconds the viewport feedback may trail the detector
+
+    # Persistent detection cache
+    detection_cache_enabled: bool = False
+    detection_cache_dir: str = ".cache/detections"
+
+    # Detection worker pool
+    detection_workers: int = 1
+    detection_chunk_size: int = 8
+
+    # Multiple viewports per frame
+    viewport_count: int = 1  # motion-cluster viewports, main action first
+    viewport_wide: bool = False  # extra wide shot following all motion
+    wide_width: int = 0  # 0 = twice viewport_width (capped at the frame)
+    wide_height: int = 0
+
+    # Output settings
+    output_profile: str = "debug"  # viewport | stills | debug
+    encode_threads: int = 4
+    max_inflight_writes: int = 16
+    video_backend: str = "opencv"  # opencv (mp4v) | ffmpeg (piped to an ffmpeg subprocess)
+    ffmpeg_codec: str = "libx264"
+    ffmpeg_preset: str = "veryfast"
+    ffmpeg_crf: int = 23
+    ffmpeg_threads: int = 0  # 0 = ffmpeg default
+    output_segment: str = "none"  # none | hls (ffmpeg backend only)
+    segment_seconds: float = 2.0
+    segment_type: str = "fmp4"  # fmp4 | mpegts
+
+    # Metrics (Prometheus text file and/or HTTP endpoint)
+    metrics_enabled: bool = False
+    metrics_file: str = "metrics.prom"  # relative paths land in the output dir
+    metrics_http_port: int = 0  # 0 = no HTTP endpoint
+    metrics_interval: float = 1.0
+
+    # Adaptive backpressure (streaming mode)
+    adaptive_enabled: bool = False
+    latency_budget: float = 2.0  # seconds, decode to written output
+    adaptive_high_water: float = 0.75  # queue occupancy that counts as overload
+    adaptive_low_water: float = 0.25  # occupancy below which quality is restored
+    adaptive_cooldown: float = 2.0  # seconds between adjustments
+    min_detection_scale: float = 0.125
+    min_target_fps: float = 1.0
+    realtime_pacing: bool = True  # release file frames at source speed, like a live feed
+
+    # Batch mode (many clips through warm, reused stage processes)
+    batch_lanes: int = 0  # concurrent pipelines; 0 = as many as batch_cpu_budget allows
+    batch_cpu_budget: int = 0  # cores to use; 0 = all
+
+    # Sharded mode (one long clip split into parallel time ranges)
+    shard_count: int = 0  # 0 = one per core
+    shard_warmup_seconds: float = 4.0  # overlap read before each shard to prime detection/viewport state
+    shard_min_seconds: float = 30.0  # shorter clips get fewer shards
+
+    # Checkpoint and resume (stream mode)
+    checkpoint_enabled: bool = False
+    checkpoint_interval: float = 30.0  # seconds of source video between checkpoints
+
+    # Calibration (--mode calibrate)
+    calibrate_target_fps: float = 0.0  # frames/s to sustain; 0 = target_fps (real time)
+    calibrate_memory_mb: int = 0  # 0 = the container's (cgroup) or the machine's memory
+    calibrate_sample_seconds: float = 10.0  # how much of the sample clip to profile
+
+    # Profiling (or --profile)
+    profiling_enabled: bool = False
+    profiling_dir: str = "profiles"  # relative paths land in the output dir
+    profiling_sort: str = "cumulative"  # pstats sort key for the <stage>_<pid>.txt listing
+
+    # Live mode
+    live_source: str = "auto"  # auto | pipe | ffmpeg | file
+    live_width: int = 0  # raw pipe frame size; 0 = frame_resize_*
+    live_height: int = 0
+    live_fps: float = 30.0  # source clock for raw pipes and ffmpeg
+    live_poll_interval: float = 0.05  # growing file: wait between polls
+    live_idle_timeout: float = 5.0  # growing file: end of stream after this long without new frames
+    ffmpeg_bin: str = "ffmpeg"  # also used by the ffmpeg video backend
+    ffmpeg_input_args: str = ""  # e.g. "-re" to replay a file in real time
+    live_latency_log: str = "latency.csv"  # per-frame glass-to-output latency, in the output dir
 
     @classmethod
     def from_file(cls, config_path: str) -> "PipelineConfig":
         """
-        Load configuration from INI file.
-
-        TODO: Implement configuration loading from INI file.
-        Create a config.ini file with sections like:
-        [queues]
-        max_size = 100
-        timeout = 5.0
-
-        [detection]
-        threshold = 25.0
-        min_motion_area = 100
-        gaussian_blur_size = 5
-
-        [viewport]
-        width = 720
-        height = 480
-        smoothing_window_size = 5
-        smoothing_alpha = 0.3
-
-        [processing]
-        target_fps = 5
-        frame_resize_width = 1280
-        frame_resize_height = 720
-
-        Use configparser.ConfigParser() to read the file.
-        Parse values and return PipelineConfig instance.
-        Handle missing config file by using default values.
+        Load configuration from an INI file.
+
+        Every option is optional: a missing section, key or file falls back
+        to the default given next to it below, so PipelineConfig.from_file
+        on a path that does not exist yields the built-in defaults. Byte
+        budgets, the detection proxy, the detection cache, shared memory,
+        metrics, adaptive control and ROI detection default to off.
         """
         parser = configparser.ConfigParser()
         if Path(config_path).exists():
@@ -66,6 +155,10 @@ class PipelineConfig:
               return parser.getint(section,keys,fallback=default)
         def get_float(section,key,default) -> float:
               return parser.getfloat(section,key,fallback=default)
+        def get_str(section,key,default) -> str:
+              return parser.get(section,key,fallback=default).strip()
+        def get_bool(section,key,default) -> bool:
+              return parser.getboolean(section,key,fallback=default)
         
         return cls(
             queue_max_size=get_int("queues", "max_size", 50),
@@ -77,14 +170,84 @@ class PipelineConfig:
             viewport_height=get_int("viewport", "height", 480),
             smoothing_window_size=get_int("viewport", "smoothing_window_size", 5),
             smoothing_alpha=get_float("viewport", "smoothing_alpha", 0.3),
+            viewport_count=get_int("viewport", "count", 1),
+            viewport_wide=get_bool("viewport", "wide", False),
+            wide_width=get_int("viewport", "wide_width", 0),
+            wide_height=get_int("viewport", "wide_height", 0),
             target_fps=get_int("processing", "target_fps", 5),
             frame_resize_width=get_int("processing", "frame_resize_width", 1280),
             frame_resize_height=get_int("processing", "frame_resize_height", 720),
+            decode_mode=get_str("processing", "decode_mode", "auto"),
+            seek_min_skip=get_int("processing", "seek_min_skip", 60),
+            buffer_pool=get_bool("processing", "buffer_pool", True),
+            start_method=get_str("processing", "start_method", "auto"),
+            queue_max_mb=get_float("queues", "max_mb", 0.0),
+            queue_total_mb=get_float("queues", "total_mb", 0.0),
+            queue_policy=get_str("queues", "policy", "block"),
+            queue_reorder_window=get_int("queues", "reorder_window", 0),
+            frame_transport=get_str("transport", "mode", "queue"),
+            ring_slots=get_int("transport", "ring_slots", 32),
+            output_profile=get_str("output", "profile", "debug"),
+            encode_threads=get_int("output", "encode_threads", 4),
+            max_inflight_writes=get_int("output", "max_inflight", 16),
+            video_backend=get_str("output", "video_backend", "opencv"),
+            ffmpeg_codec=get_str("output", "ffmpeg_codec", "libx264"),
+            ffmpeg_preset=get_str("output", "ffmpeg_preset", "veryfast"),
+            ffmpeg_crf=get_int("output", "ffmpeg_crf", 23),
+            ffmpeg_threads=get_int("output", "ffmpeg_threads", 0),
+            output_segment=get_str("output", "segment", "none"),
+            segment_seconds=get_float("output", "segment_seconds", 2.0),
+            segment_type=get_str("output", "segment_type", "fmp4"),
+            detection_scale=get_float("detection", "scale", 1.0),
+            detection_backend=get_str("detection", "backend", "contours"),
+            block_size=get_int("detection", "block_size", 32),
+            block_min_fill=get_float("detection", "block_min_fill", 0.1),
+            detection_heatmap=get_bool("detection", "heatmap", False),
+            mv_min_magnitude=get_float("detection", "mv_min_magnitude", 1.0),
+            roi_enabled=get_bool("roi", "enabled", False),
+            roi_padding=get_float("roi", "padding", 0.1),
+            roi_full_scan_interval=get_int("roi", "full_scan_interval", 30),
+            roi_lost_frames=get_int("roi", "lost_frames", 3),
+            roi_max_lag=get_float("roi", "max_lag", 1.0),
+            detection_cache_enabled=get_bool("cache", "enabled", False),
+            detection_cache_dir=get_str("cache", "dir", ".cache/detections"),
+            detection_workers=get_int("detection", "workers", 1),
+            detection_chunk_size=get_int("detection", "chunk_size", 8),
+            metrics_enabled=get_bool("metrics", "enabled", False),
+            metrics_file=get_str("metrics", "file", "metrics.prom"),
+            metrics_http_port=get_int("metrics", "http_port", 0),
+            metrics_interval=get_float("metrics", "interval", 1.0),
+            adaptive_enabled=get_bool("adaptive", "enabled", False),
+            latency_budget=get_float("adaptive", "latency_budget", 2.0),
+            adaptive_high_water=get_float("adaptive", "high_water", 0.75),
+            adaptive_low_water=get_float("adaptive", "low_water", 0.25),
+            adaptive_cooldown=get_float("adaptive", "cooldown", 2.0),
+            min_detection_scale=get_float("adaptive", "min_detection_scale", 0.125),
+            min_target_fps=get_float("adaptive", "min_target_fps", 1.0),
+            realtime_pacing=get_bool("adaptive", "realtime_pacing", True),
+            batch_lanes=get_int("batch", "lanes", 0),
+            batch_cpu_budget=get_int("batch", "cpu_budget", 0),
+            shard_count=get_int("shards", "count", 0),
+            shard_warmup_seconds=get_float("shards", "warmup_seconds", 4.0),
+            shard_min_seconds=get_float("shards", "min_seconds", 30.0),
+            checkpoint_enabled=get_bool("checkpoint", "enabled", False),
+            checkpoint_interval=get_float("checkpoint", "interval", 30.0),
+            calibrate_target_fps=get_float("calibrate", "target_fps", 0.0),
+            calibrate_memory_mb=get_int("calibrate", "memory_mb", 0),
+            calibrate_sample_seconds=get_float("calibrate", "sample_seconds", 10.0),
+            profiling_enabled=get_bool("profiling", "enabled", False),
+            profiling_dir=get_str("profiling", "dir", "profiles"),
+            profiling_sort=get_str("profiling", "sort", "cumulative"),
+            live_source=get_str("live", "source", "auto"),
+            live_width=get_int("live", "width", 0),
+            live_height=get_int("live", "height", 0),
+            live_fps=get_float("live", "fps", 30.0),
+            live_poll_interval=get_float("live", "poll_interval", 0.05),
+            live_idle_timeout=get_float("live", "idle_timeout", 5.0),
+            ffmpeg_bin=get_str("live", "ffmpeg", "ffmpeg"),
+            ffmpeg_input_args=get_str("live", "ffmpeg_input_args", ""),
+            live_latency_log=get_str("live", "latency_log", "latency.csv"),
         )
 
     def __str__(self):
         return f"PipelineConfig(queue_size={self.queue_max_size}, viewport={self.viewport_width}x{self.viewport_height})"
-    
-
-# if __name__ == "__main__":
-#      print(PipelineConfig.from_file("/Users/bakr/Desktop/HoemTeam Project /HOMETEAMPROJ/src/hometeamproj/config.ini"))
@@ -2,77 +2,253 @@
 Main entrypoint for the HomeTeam viewport tracking pipeline.
 """
 
+import argparse
 import multiprocessing as mp
+import sys
+from dataclasses import replace
 from pathlib import Path
 
 from .config import PipelineConfig
-from .pipeline.queue_manager import QueueManager
-from .pipeline.frame_reader import FrameReaderProcess
-from .pipeline.detector import DetectionProcess
-from .pipeline.viewport_worker import ViewportCalculatorProcess
-from .pipeline.output_writer import OutputWriterProcess
 
+# Pipeline modules are imported where they are used: spawned children
+# re-import this module, and should only pay for the stages they run.
 
-def main():
 
-    mp.set_start_method("spawn", force=True)
+DEFAULT_CONFIG = Path(__file__).parent / "config.ini"
+DEFAULT_VIDEO = Path(__file__).parent / "pipeline" / "sample_video_clip.mp4"
+DEFAULT_OUTPUT = Path(__file__).resolve().parents[2] / "output"
 
+# Imported once by the forkserver; stage processes are forked from it with
+# cv2, NumPy and the stage code already loaded
+PRELOAD_MODULES = [
+    "hometeamproj.pipeline.frame_reader",
+    "hometeamproj.pipeline.live_reader",
+    "hometeamproj.pipeline.detector_pool",
+    "hometeamproj.pipeline.viewport_worker",
+    "hometeamproj.pipeline.output_writer",
+    "hometeamproj.pipeline.offline",
+    "hometeamproj.pipeline.profiling",
+    "hometeamproj.pipeline.roi",
+]
 
-    config_path = Path(__file__).parent / "config.ini"
-    config = PipelineConfig.from_file(str(config_path))
 
+def configure_start_method(config: PipelineConfig) -> str:
+    """
+    Set the multiprocessing start method from [processing] start_method.
 
-    queues = QueueManager(config)
+    auto picks forkserver on Linux and spawn elsewhere: forking a process
+    that has loaded macOS system frameworks (which cv2 links) is unsafe.
+    """
+    method = str(getattr(config, "start_method", "auto")).lower()
+    available = mp.get_all_start_methods()
+    if method == "auto":
+        method = "forkserver" if sys.platform.startswith("linux") and "forkserver" in available else "spawn"
+    if method not in available:
+        print(f"configure_start_method: start method '{method}' not available here, using spawn")
+        method = "spawn"
+    if method == "forkserver":
+        mp.set_forkserver_preload(PRELOAD_MODULES)
+    mp.set_start_method(method, force=True)
+    return method
 
 
-    video_path = Path(__file__).parent / "pipeline" / "sample_video_clip.mp4"
-    if not video_path.exists():
-        raise FileNotFoundError(f"Video not found: {video_path}")
+def run_streaming(config: PipelineConfig, video_path: Path, output_dir: Path, live: bool = False):
+    """
+    Run the four streaming stages as separate processes until the clip ends.
+    With live=True the input is a live source (see pipeline/live_reader.py).
+    """
+    from .pipeline.backpressure import BackpressureController, PipelineControls
+    from .pipeline.checkpoint import Checkpointer
+    from .pipeline.detection_cache import CachedDetectionProcess, DetectionCache, DetectionRecorder, uncacheable_reason
+    from .pipeline.detector_pool import create_detection_stage
+    from .pipeline.frame_reader import FrameReaderProcess
+    from .pipeline.live_reader import LiveFrameReaderProcess
+    from .pipeline.metrics import MetricsCollector, stage_metrics
+    from .pipeline.output_writer import OutputWriterProcess
+    from .pipeline.profiling import profile_stages
+    from .pipeline.queue_manager import QueueManager
+    from .pipeline.roi import ViewportFeedback
+    from .pipeline.viewport_worker import ViewportCalculatorProcess
 
+    queues = QueueManager(config)
+    collector = None
+    if config.metrics_enabled or config.adaptive_enabled:
+        collector = MetricsCollector(config, queues, str(output_dir), export=config.metrics_enabled)
 
-    output_dir = Path(__file__).resolve().parents[2] / "output"
-    output_dir.mkdir(parents=True, exist_ok=True)
+    # Adaptive backpressure: stages read these knobs, the controller moves them
+    controls = controller = None
+    if config.adaptive_enabled:
+        controls = PipelineControls(config)
+        controller = BackpressureController(config, controls)
+        collector.add_listener(controller)
 
 
-    frame_reader = FrameReaderProcess(
-        input_video=str(video_path),
-        output_queue=queues.raw_frames_queue,
-        config=config,
-    )
+    # A live feed cannot be sought back into, so it is never checkpointed
+    checkpointer = None if live else Checkpointer.for_run(str(output_dir), str(video_path), config)
+    resume = checkpointer.resume if checkpointer is not None else None
 
-    detector = DetectionProcess(
-        input_queue=queues.raw_frames_queue,
-        output_queue=queues.detections_queue,
-        config=config,
+    reader_class = LiveFrameReaderProcess if live else FrameReaderProcess
+    reader_args = {} if resume is None else {"start_frame": resume.frame_id}
+    frame_reader = reader_class(
+        str(video_path),
+        queues.raw_frames_queue,
+        config,
+        transport=queues.frame_transport,
+        metrics=stage_metrics(collector, "reader"),
+        controls=controls,
+        **reader_args,
     )
 
+    # A live feed has no finished file to key the detection cache on
+    use_cache = config.detection_cache_enabled and not live
+    if use_cache and uncacheable_reason(config):
+        print(f"Detection cache: not used for this run, {uncacheable_reason(config)}")
+        use_cache = False
+    cache = DetectionCache.for_video(str(video_path), config) if use_cache else None
+    recorder = None
+    # The viewport stage tells the detector where to look ([roi])
+    feedback = None
+
+    if cache is not None and cache.exists():
+        print(f"Using cached detections {cache.key}")
+        detection_stage = [
+            CachedDetectionProcess(
+                input_queue=queues.raw_frames_queue,
+                output_queue=queues.detections_queue,
+                config=config,
+                detections=cache.load(),
+                transport=queues.frame_transport,
+                metrics=stage_metrics(collector, "detector"),
+            )
+        ]
+    else:
+        feedback = ViewportFeedback() if config.roi_enabled else None
+        detection_stage = create_detection_stage(
+            input_queue=queues.raw_frames_queue,
+            output_queue=queues.detections_queue,
+            config=config,
+            transport=queues.frame_transport,
+            collector=collector,
+            controls=controls,
+            queues=queues,
+            feedback=feedback,
+        )
+        if cache is not None and resume is None:
+            # A resumed run only sees the rest of the clip
+            recorder = DetectionRecorder(cache)
+
     viewport_calculator = ViewportCalculatorProcess(
         input_queue=queues.detections_queue,
         output_queue=queues.viewport_queue,
         config=config,
+        transport=queues.frame_transport,
+        recorder=recorder,
+        metrics=stage_metrics(collector, "viewport"),
+        feedback=feedback,
+        checkpoint_interval=config.checkpoint_interval if checkpointer is not None else 0.0,
+        resume=resume,
     )
 
     output_writer = OutputWriterProcess(
         input_queue=queues.viewport_queue,
         output_dir=str(output_dir),
         config=config,
+        transport=queues.frame_transport,
+        metrics=stage_metrics(collector, "writer"),
+        controls=controls,
+        latency_log=str(output_dir / config.live_latency_log) if live and config.live_latency_log else None,
+        checkpointer=checkpointer,
     )
 
-    processes = [
+    processes = profile_stages([
         frame_reader,
-        detector,
+        *detection_stage,
         viewport_calculator,
         output_writer,
-    ]
+    ], config, str(output_dir))
 
 
     print("Starting HomeTeam viewport tracking pipeline...")
+    if collector is not None:
+        collector.start()
     for p in processes:
         p.start()
 
 
-    for p in processes:
-        p.join()
+    try:
+        for p in processes:
+            p.join()
+        if checkpointer is not None and all(p.exitcode == 0 for p in processes):
+            checkpointer.finish()
+    finally:
+        if collector is not None:
+            collector.stop()
+        if controller is not None:
+            print(controller.summary())
+        queues.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HomeTeam viewport tracking pipeline")
+    parser.add_argument("--config", default=str(DEFAULT_CONFIG), help="Path to config.ini")
+    parser.add_argument(
+        "--input", default=str(DEFAULT_VIDEO), help="Input video file (batch mode: directory or manifest of clips)"
+    )
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT), help="Output directory")
+    parser.add_argument(
+        "--mode",
+        choices=("stream", "offline", "batch", "live", "sharded", "calibrate"),
+        default="stream",
+        help=(
+            "stream: causal per-frame pipeline; offline: detect whole clip, then smooth and render; "
+            "batch: stream many clips through warm, reused stage workers; "
+            "live: named pipe, ffmpeg URL or growing file, paced at the source clock; "
+            "sharded: split one long clip into time ranges processed in parallel; "
+            "calibrate: profile the stages on this machine and write a tuned config.ini to the output directory"
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile every stage process (as [profiling] enabled); profiles go to <output>/profiles",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+
+    args = parse_args(argv)
+    config = PipelineConfig.from_file(args.config)
+    if args.profile:
+        config = replace(config, profiling_enabled=True)
+    print(f"Using {configure_start_method(config)} start method")
+
+
+    video_path = Path(args.input)
+    if not video_path.exists() and not (args.mode == "live" and "://" in args.input):
+        raise FileNotFoundError(f"Video not found: {video_path}")
+
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if args.mode == "calibrate":
+        from .bench.calibrate import run_calibration
+        run_calibration(config, args.config, str(video_path), str(output_dir))
+        return
+    elif args.mode == "live":
+        run_streaming(config, video_path, output_dir, live=True)
+    elif args.mode == "sharded":
+        from .pipeline.sharded import run_sharded
+        run_sharded(config, str(video_path), str(output_dir))
+    elif args.mode == "batch":
+        from .pipeline.batch import run_batch
+        run_batch(config, str(video_path), str(output_dir))
+    elif args.mode == "offline":
+        from .pipeline.offline import run_offline
+        run_offline(config, str(video_path), str(output_dir))
+    else:
+        run_streaming(config, video_path, output_dir)
 
     print("Pipeline finished successfully.")
 
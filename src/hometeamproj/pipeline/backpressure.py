@@ -0,0 +1,259 @@
+# pipeline/backpressure.py
+"""
+Adaptive backpressure for real-time operation.
+
+PipelineControls holds the knobs that can change while the pipeline runs
+(detection scale, effective target fps, output profile level) in shared
+memory, so stage processes pick up new values on their next frame.
+
+BackpressureController runs in the parent as a MetricsCollector listener. It
+watches queue occupancy, per-stage processing load and the end-to-end
+latency reported by the writer. Under overload it steps down a knob of the
+bottleneck stage; once the pipeline has been calm for a cooldown period the
+most recent step is undone. Every adjustment is logged with the frame_id the
+reader had reached.
+"""
+
+import multiprocessing
+import time
+from dataclasses import dataclass
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.writer_engine import degrade_output_profile
+
+
+# Queue -> the stage consuming it (a full queue means that stage is behind)
+QUEUE_CONSUMERS = (("viewport", "writer"), ("detections", "viewport"), ("raw_frames", "detector"))
+
+# Knobs tried, in order, when a stage is the bottleneck
+STAGE_KNOBS = {
+    "reader": ("target_fps",),
+    "detector": ("detection_scale", "target_fps"),
+    "viewport": ("target_fps",),
+    "writer": ("output_level", "target_fps"),
+}
+
+FPS_STEP = 0.75  # target_fps multiplier per step down
+
+
+class PipelineControls:
+    """Runtime-adjustable settings shared between the controller and the stages."""
+
+    def __init__(self, config: PipelineConfig):
+        # Single writer per value, so no locks: readers just see the latest value
+        self._detection_scale = multiprocessing.Value("d", float(config.detection_scale), lock=False)
+        self._target_fps = multiprocessing.Value("d", float(config.target_fps), lock=False)
+        self._output_level = multiprocessing.Value("i", 0, lock=False)
+        self._frame_id = multiprocessing.Value("q", -1, lock=False)
+
+    @property
+    def detection_scale(self) -> float:
+        return self._detection_scale.value
+
+    @detection_scale.setter
+    def detection_scale(self, value: float):
+        self._detection_scale.value = float(value)
+
+    @property
+    def target_fps(self) -> float:
+        return self._target_fps.value
+
+    @target_fps.setter
+    def target_fps(self, value: float):
+        self._target_fps.value = float(value)
+
+    @property
+    def output_level(self) -> int:
+        """Steps down PROFILE_LADDER from the configured output profile."""
+        return self._output_level.value
+
+    @output_level.setter
+    def output_level(self, value: int):
+        self._output_level.value = int(value)
+
+    @property
+    def frame_id(self) -> int:
+        """Latest frame_id emitted by the reader."""
+        return self._frame_id.value
+
+    @frame_id.setter
+    def frame_id(self, value: int):
+        self._frame_id.value = int(value)
+
+
+def is_stale(item, latency_budget: float) -> bool:
+    """True when an item has already spent longer than the budget in the pipeline."""
+    created_at = getattr(item, "created_at", 0.0)
+    return latency_budget > 0 and created_at > 0 and time.time() - created_at > latency_budget
+
+
+@dataclass
+class Adjustment:
+    """One controller step, kept so it can be undone later."""
+
+    frame_id: int
+    knob: str
+    old: float
+    new: float
+    reason: str
+    action: str = "lowered"  # or "restored"
+
+
+class BackpressureController:
+    """Steps pipeline quality down under overload and back up when load drops."""
+
+    def __init__(self, config: PipelineConfig, controls: PipelineControls):
+        self.config = config
+        self.controls = controls
+        self.capacity = max(1, int(config.queue_max_size))
+        self.capacity_bytes = float(getattr(config, "queue_max_mb", 0)) * 1024 * 1024  # 0 = items only
+        self.latency_budget = float(config.latency_budget)
+        self.high_water = float(config.adaptive_high_water)
+        self.low_water = float(config.adaptive_low_water)
+        self.cooldown = float(config.adaptive_cooldown)
+        self.min_detection_scale = float(config.min_detection_scale)
+        self.min_target_fps = max(1.0, float(config.min_target_fps))
+
+        self.applied = []  # steps currently in effect, most recent last
+        self.adjustments = []  # every change, including restores
+        self._last_change = 0.0
+        self._calm_since = None
+        self._processing = {}  # stage -> (total, count) at the previous tick
+        self._exhausted = False
+
+    def __call__(self, collector):
+        self.update(collector)
+
+    # --- measurements -----------------------------------------------------
+
+    def _stage_load(self, stages: dict) -> dict:
+        """Share of the frame interval each stage spent processing since the last tick."""
+        interval = 1.0 / max(self.controls.target_fps, 1e-6)
+        load = {}
+        for stage, agg in stages.items():
+            h = agg["histograms"].get("processing")
+            if h is None:
+                continue
+            total, count = self._processing.get(stage, (0.0, 0))
+            self._processing[stage] = (h.total, h.count)
+            if h.count > count:
+                mean = (h.total - total) / (h.count - count)
+                load[stage] = mean / interval / max(1, agg["processes"])
+        return load
+
+    def _bottleneck(self, congested: list, load: dict) -> str:
+        # Full queues back up upstream, so the most downstream one points at the culprit
+        for queue_name, stage in QUEUE_CONSUMERS:
+            if queue_name in congested:
+                return stage
+        if load:
+            return max(load, key=load.get).split("_")[0]
+        return "reader"
+
+    # --- knobs ------------------------------------------------------------
+
+    def _degraded(self, knob: str):
+        """Next lower value for a knob, or None when it is already at its floor."""
+        if knob == "detection_scale":
+            old = self.controls.detection_scale
+            new = max(self.min_detection_scale, old / 2.0)
+        elif knob == "target_fps":
+            old = self.controls.target_fps
+            new = max(self.min_target_fps, round(old * FPS_STEP, 2))
+        else:
+            old = self.controls.output_level
+            base = self.config.output_profile
+            # Higher level = cheaper profile
+            if degrade_output_profile(base, old + 1) == degrade_output_profile(base, old):
+                return None
+            return old + 1
+        return new if new < old else None
+
+    def _set(self, knob: str, value):
+        setattr(self.controls, knob, value)
+        self._last_change = time.monotonic()
+
+    def _describe(self, knob: str, value) -> str:
+        if knob == "output_level":
+            return degrade_output_profile(self.config.output_profile, int(value))
+        if knob == "detection_scale":
+            return f"{value:.3f}"
+        return f"{value:.2f}"
+
+    def _log(self, adjustment: Adjustment):
+        self.adjustments.append(adjustment)
+        print(
+            f"BackpressureController: frame {adjustment.frame_id}: {adjustment.action} {adjustment.knob} "
+            f"{self._describe(adjustment.knob, adjustment.old)} -> {self._describe(adjustment.knob, adjustment.new)} "
+            f"({adjustment.reason})"
+        )
+
+    def _step_down(self, stage: str, reason: str):
+        for knob in STAGE_KNOBS.get(stage, ("target_fps",)):
+            new = self._degraded(knob)
+            if new is None:
+                continue
+            old = getattr(self.controls, knob)
+            self._set(knob, new)
+            step = Adjustment(self.controls.frame_id, knob, old, new, f"{stage} bottleneck: {reason}")
+            self.applied.append(step)
+            self._log(step)
+            self._exhausted = False
+            return
+
+        if not self._exhausted:
+            print(f"BackpressureController: frame {self.controls.frame_id}: nothing left to lower for {stage} ({reason})")
+            self._exhausted = True
+
+    def _restore(self, reason: str):
+        step = self.applied.pop()
+        self._set(step.knob, step.old)
+        self._log(Adjustment(self.controls.frame_id, step.knob, step.new, step.old, reason, action="restored"))
+
+    # --- control loop -----------------------------------------------------
+
+    def update(self, collector):
+        now = time.monotonic()
+        stages = collector.stages()
+        load = self._stage_load(stages)
+        occupancy = {name: depth / self.capacity for name, (depth, _) in collector.queue_depths().items()}
+        if self.capacity_bytes:
+            # A queue is as full as the tighter of its two bounds
+            for name, (buffered, _) in collector.queue_bytes().items():
+                if name in occupancy:
+                    occupancy[name] = max(occupancy[name], buffered / self.capacity_bytes)
+        latency = stages.get("writer", {}).get("gauges", {}).get("latency_s")
+
+        congested = [name for name, occ in occupancy.items() if occ >= self.high_water]
+        over_budget = latency is not None and latency > self.latency_budget
+
+        if congested or over_budget:
+            self._calm_since = None
+            if now - self._last_change < self.cooldown:
+                return
+            reasons = [f"{name} {occupancy[name]:.0%} full" for name in congested]
+            if over_budget:
+                reasons.append(f"latency {latency:.2f}s > {self.latency_budget:.2f}s")
+            self._step_down(self._bottleneck(congested, load), ", ".join(reasons))
+            return
+
+        calm = max(occupancy.values(), default=0.0) <= self.low_water and (
+            latency is None or latency <= self.latency_budget / 2
+        )
+        if not calm:
+            self._calm_since = None
+            return
+
+        if self._calm_since is None:
+            self._calm_since = now
+        if self.applied and now - self._calm_since >= self.cooldown and now - self._last_change >= self.cooldown:
+            latency_text = "-" if latency is None else f"{latency:.2f}s"
+            self._restore(f"load dropped: queues <= {self.low_water:.0%}, latency {latency_text}")
+
+    def summary(self) -> str:
+        lowered = sum(1 for a in self.adjustments if a.action == "lowered")
+        return (
+            f"BackpressureController: {len(self.adjustments)} adjustments ({lowered} step-downs), "
+            f"final detection_scale={self.controls.detection_scale:.3f}, target_fps={self.controls.target_fps:.2f}, "
+            f"output_profile={degrade_output_profile(self.config.output_profile, self.controls.output_level)}"
+        )
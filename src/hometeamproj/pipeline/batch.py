@@ -0,0 +1,204 @@
+# pipeline/batch.py
+"""
+Multi-clip batch runner.
+
+Starting a pipeline costs a spawned interpreter per stage, each re-importing
+cv2 and NumPy, which dominates on short clips. In batch mode that cost is
+paid once per lane: a lane is a full streaming pipeline (its own queues and
+frame transport) whose stage processes stay alive across clips. All lane
+readers pull ClipJobs from one shared job queue, and every clip travels
+through its lane bracketed by ClipMarkers, on which stages reset per-clip
+state and the writer switches output directories. Lanes run concurrently up
+to the configured CPU budget.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from queue import Empty
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.detector_pool import create_detection_stage
+from hometeamproj.pipeline.frame_reader import FrameReaderProcess
+from hometeamproj.pipeline.metrics import MetricsCollector, stage_metrics
+from hometeamproj.pipeline.output_writer import OutputWriterProcess
+from hometeamproj.pipeline.profiling import profile_stages
+from hometeamproj.pipeline.queue_manager import QueueManager
+from hometeamproj.pipeline.roi import ViewportFeedback
+from hometeamproj.pipeline.viewport_worker import ViewportCalculatorProcess
+
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi", ".m4v")
+
+
+@dataclass
+class ClipJob:
+    """One clip to process and where its outputs go."""
+
+    clip_id: str
+    video_path: str
+    output_dir: str
+
+
+def discover_clips(source: str) -> list:
+    """
+    Clip paths from a directory (its video files, sorted) or a manifest file
+    (one path per line, '#' comments; relative paths are relative to the
+    manifest).
+    """
+    source = Path(source)
+    if source.is_dir():
+        return sorted(str(p) for p in source.iterdir() if p.suffix.lower() in VIDEO_EXTENSIONS)
+
+    clips = []
+    for line in source.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        path = Path(line)
+        clips.append(str(path if path.is_absolute() else source.parent / path))
+    return clips
+
+
+def plan_jobs(clips: list, output_root: str) -> list:
+    """ClipJobs with one output directory per clip, named after the file."""
+    jobs = []
+    seen = {}
+    for clip in clips:
+        stem = Path(clip).stem
+        seen[stem] = seen.get(stem, 0) + 1
+        clip_id = stem if seen[stem] == 1 else f"{stem}_{seen[stem]}"
+        jobs.append(ClipJob(clip_id=clip_id, video_path=clip, output_dir=os.path.join(output_root, clip_id)))
+    return jobs
+
+
+def lane_cpus(config: PipelineConfig) -> int:
+    """Roughly how many cores one lane keeps busy: reader, detector worker(s) and writer."""
+    return 2 + max(1, int(config.detection_workers))
+
+
+def lane_count(config: PipelineConfig, jobs: int) -> int:
+    """Lanes to run: [batch] lanes if set, otherwise as many as fit the CPU budget."""
+    lanes = int(config.batch_lanes)
+    if lanes <= 0:
+        budget = int(config.batch_cpu_budget) or os.cpu_count() or 1
+        lanes = max(1, budget // lane_cpus(config))
+    return max(1, min(lanes, jobs))
+
+
+class Lane:
+    """One warm pipeline whose stage processes are reused for every clip it picks up."""
+
+    def __init__(self, index: int, config: PipelineConfig, job_queue, results_queue, collector=None, output_root: str = "."):
+        self.index = index
+        self.queues = QueueManager(config)
+        transport = self.queues.frame_transport
+        feedback = ViewportFeedback() if config.roi_enabled else None
+
+        self.processes = profile_stages([
+            FrameReaderProcess(
+                None, self.queues.raw_frames_queue, config,
+                transport=transport, metrics=stage_metrics(collector, "reader"), job_queue=job_queue,
+            ),
+            *create_detection_stage(
+                self.queues.raw_frames_queue, self.queues.detections_queue, config,
+                transport=transport, collector=collector, queues=self.queues, feedback=feedback,
+            ),
+            ViewportCalculatorProcess(
+                self.queues.detections_queue, self.queues.viewport_queue, config,
+                transport=transport, metrics=stage_metrics(collector, "viewport"), feedback=feedback,
+            ),
+            OutputWriterProcess(
+                self.queues.viewport_queue, None, config,
+                transport=transport, metrics=stage_metrics(collector, "writer"), results_queue=results_queue,
+            ),
+        ], config, output_root)
+
+    def start(self):
+        for p in self.processes:
+            p.start()
+
+    def is_alive(self) -> bool:
+        return any(p.is_alive() for p in self.processes)
+
+    def join(self):
+        for p in self.processes:
+            p.join()
+
+    def close(self):
+        self.queues.close()
+
+
+def run_batch(config: PipelineConfig, source: str, output_root: str) -> dict:
+    """Process every clip in a directory or manifest; returns the batch summary."""
+    jobs = plan_jobs(discover_clips(source), output_root)
+    if not jobs:
+        print(f"Batch: no clips found in {source}")
+        return {"clips": []}
+
+    lanes_wanted = lane_count(config, len(jobs))
+    print(f"Batch: {len(jobs)} clips on {lanes_wanted} lanes (~{lane_cpus(config)} cores each)")
+
+    job_queue = multiprocessing.Queue()
+    results_queue = multiprocessing.Queue()
+    for job in jobs:
+        job_queue.put(job)
+    for _ in range(lanes_wanted):
+        job_queue.put(None)  # One stop per lane reader
+
+    collector = MetricsCollector(config, None, output_root) if config.metrics_enabled else None
+
+    started = time.time()
+    lanes = []
+    results = []
+    try:
+        lanes = [Lane(i, config, job_queue, results_queue, collector, output_root) for i in range(lanes_wanted)]
+        if collector is not None:
+            collector.start()
+        for lane in lanes:
+            lane.start()
+
+        while len(results) < len(jobs):
+            try:
+                summary = results_queue.get(timeout=config.queue_timeout)
+            except Empty:
+                if not any(lane.is_alive() for lane in lanes):
+                    print("Batch: all lanes exited before every clip reported")
+                    break
+                continue
+            results.append(summary)
+            error = summary.get("reader", {}).get("error")
+            status = f"ERROR {error}" if error else f"{summary['frames_written']} frames in {summary['seconds']:.1f}s"
+            print(f"Batch: [{len(results)}/{len(jobs)}] {summary['clip_id']}: {status}")
+
+        for lane in lanes:
+            lane.join()
+    finally:
+        if collector is not None:
+            collector.stop()
+        for lane in lanes:
+            lane.close()
+
+    seconds = time.time() - started
+    done = {r["clip_id"] for r in results}
+    summary = {
+        "source": str(source),
+        "lanes": lanes_wanted,
+        "seconds": round(seconds, 3),
+        "clips_per_hour": round(len(results) / seconds * 3600, 1) if seconds > 0 else 0.0,
+        "frames_written": sum(r["frames_written"] for r in results),
+        "failed": sorted(r["clip_id"] for r in results if r.get("reader", {}).get("error")),
+        "missing": [job.clip_id for job in jobs if job.clip_id not in done],
+        "clips": results,
+    }
+    os.makedirs(output_root, exist_ok=True)
+    with open(os.path.join(output_root, "batch_summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    print(
+        f"Batch: {len(results)}/{len(jobs)} clips, {summary['frames_written']} frames in {seconds:.1f}s "
+        f"({summary['clips_per_hour']} clips/hour)"
+    )
+    return summary
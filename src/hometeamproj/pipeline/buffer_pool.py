@@ -0,0 +1,134 @@
+# pipeline/buffer_pool.py
+"""
+Per-process pool of reusable NumPy arrays.
+
+Stages hand pooled arrays to OpenCV as dst= outputs (and to NumPy as out=)
+instead of allocating fresh ones for every frame. Two kinds of buffer:
+
+- scratch(name, shape): one array per name, overwritten on every call.
+  For temporaries that never leave the stage (gray, blur, masks).
+- acquire(shape, users) / release(array): a free list for arrays handed to
+  other threads (the writer's encode jobs). An array goes back on the free
+  list once each of its `users` has released it.
+
+Arrays that go onto a multiprocessing.Queue are pickled later by the
+queue's feeder thread, so they must never come from the pool.
+
+Occupancy and reuse counts are published as StageMetrics gauges.
+"""
+
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+
+class BufferPool:
+    """Reusable arrays for one process; disabled pools just allocate."""
+
+    def __init__(self, metrics=None, enabled: bool = True):
+        self.metrics = metrics
+        self.enabled = enabled
+        self._scratch = {}
+        self._free = defaultdict(list)  # (shape, dtype) -> arrays ready for reuse
+        self._users = {}  # id(array) -> outstanding releases, for leased arrays
+        self._lock = threading.Lock()  # release() runs on encoder threads
+
+        self.buffers = 0
+        self.bytes = 0
+        self.reused = 0
+        self.allocated = 0
+        self._report()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _report(self):
+        if self.metrics is None:
+            return
+        self.metrics.set_gauge("pool_buffers", self.buffers)
+        self.metrics.set_gauge("pool_bytes", self.bytes)
+        self.metrics.set_gauge("pool_in_use", len(self._users))
+        self.metrics.set_gauge("pool_reused", self.reused)
+        self.metrics.set_gauge("pool_allocated", self.allocated)
+
+    def _allocate(self, shape, dtype, zero: bool = False) -> np.ndarray:
+        array = np.zeros(shape, dtype=dtype) if zero else np.empty(shape, dtype=dtype)
+        self.allocated += 1
+        if self.enabled:
+            self.buffers += 1
+            self.bytes += array.nbytes
+        return array
+
+    def _forget(self, array: np.ndarray):
+        self.buffers -= 1
+        self.bytes -= array.nbytes
+
+    def scratch(self, name: str, shape, dtype=np.uint8, zero: bool = False) -> np.ndarray:
+        """
+        The stage-local array called `name`, reallocated only when shape or
+        dtype change. zero=True zero-fills it when it is (re)allocated, for
+        callers that rely on parts they never write staying zero.
+        """
+        shape = tuple(int(v) for v in shape)
+        dtype = np.dtype(dtype)
+        if not self.enabled:
+            array = self._allocate(shape, dtype, zero)
+            self._report()
+            return array
+
+        array = self._scratch.get(name)
+        if array is not None and array.shape == shape and array.dtype == dtype:
+            self.reused += 1
+        else:
+            if array is not None:
+                self._forget(array)
+            array = self._scratch[name] = self._allocate(shape, dtype, zero)
+        self._report()
+        return array
+
+    def swap(self, a: str, b: str):
+        """Exchange two scratch arrays, e.g. to keep this frame's blur as the next frame's previous."""
+        if self.enabled:
+            self._scratch[a], self._scratch[b] = self._scratch.get(b), self._scratch.get(a)
+
+    def acquire(self, shape, dtype=np.uint8, users: int = 1) -> np.ndarray:
+        """A free array of this shape, leased until release() has been called `users` times."""
+        shape = tuple(int(v) for v in shape)
+        dtype = np.dtype(dtype)
+        if not self.enabled:
+            array = self._allocate(shape, dtype)
+            self._report()
+            return array
+
+        with self._lock:
+            free = self._free[(shape, dtype.str)]
+            if free:
+                array = free.pop()
+                self.reused += 1
+            else:
+                array = self._allocate(shape, dtype)
+            self._users[id(array)] = max(1, int(users))
+            self._report()
+        return array
+
+    def release(self, array: np.ndarray):
+        """Return one use of a leased array; the last release puts it back on the free list."""
+        if not self.enabled:
+            return
+        with self._lock:
+            left = self._users.get(id(array))
+            if left is None:
+                return
+            if left > 1:
+                self._users[id(array)] = left - 1
+                return
+            del self._users[id(array)]
+            self._free[(array.shape, array.dtype.str)].append(array)
+            self._report()
@@ -0,0 +1,145 @@
+# pipeline/checkpoint.py
+"""
+Checkpoint and resume for streaming runs ([checkpoint] enabled).
+
+Every `interval` seconds of source video, ViewportCalculatorProcess attaches
+a snapshot of its tracking state to one ViewportData. When
+OutputWriterProcess has written that frame it flushes the engine (pending
+stills, and the current video part file is finished) and records in
+<output>/checkpoint.json:
+
+- frame_id: the last frame whose outputs are all on disk
+- part: the video part number to continue with
+- viewport: the viewport trackers' state after that frame
+- video / config: fingerprints of the input and settings
+
+A restart with the same input, output directory and config resumes: the
+reader seeks to frame_id (re-reading that frame primes the detector's
+previous frame), the viewport stage restores its trackers and skips frames
+already written, and the writer continues with the next part. When the run
+finishes, the parts are joined into output_<name>.mp4 and the checkpoint
+is removed.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.writer_engine import concat_videos
+
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+# Settings that may change between a run and its resume without changing the output
+VOLATILE_FIELDS = (
+    "metrics_enabled",
+    "metrics_file",
+    "metrics_http_port",
+    "metrics_interval",
+    "start_method",
+    "detection_cache_enabled",
+    "detection_cache_dir",
+    "checkpoint_interval",
+    "profiling_enabled",
+    "profiling_dir",
+    "profiling_sort",
+)
+
+_PART = re.compile(r"^output_(?P<name>.+)\.part(?P<part>\d+)\.mp4$")
+
+
+def video_fingerprint(video_path: str) -> dict:
+    """Cheap identity of the input file: path, size and modification time."""
+    st = os.stat(video_path)
+    return {"path": os.path.abspath(video_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def config_fingerprint(config: PipelineConfig) -> str:
+    settings = {k: v for k, v in asdict(config).items() if k not in VOLATILE_FIELDS}
+    payload = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+@dataclass
+class Checkpoint:
+    """Progress of one streaming run, as of the last flushed frame."""
+
+    frame_id: int
+    part: int
+    viewport: dict = field(default_factory=dict)
+    video: dict = field(default_factory=dict)
+    config: str = ""
+
+
+class Checkpointer:
+    """Reads and writes <output_dir>/checkpoint.json for one input and config."""
+
+    def __init__(self, output_dir: str, video_path: str, config: PipelineConfig):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, CHECKPOINT_FILE)
+        self.config = config
+        self.video = video_fingerprint(video_path)
+        self.config_key = config_fingerprint(config)
+        self.resume = self._load()
+
+    @classmethod
+    def for_run(cls, output_dir: str, video_path: str, config: PipelineConfig) -> Optional["Checkpointer"]:
+        """A Checkpointer when [checkpoint] is enabled and the output can be written in parts."""
+        if not getattr(config, "checkpoint_enabled", False):
+            return None
+        if str(config.output_segment).lower() not in ("", "none"):
+            print("Checkpointer: segmented (HLS) output cannot be resumed, checkpoints disabled")
+            return None
+        return cls(output_dir, video_path, config)
+
+    @property
+    def start_part(self) -> int:
+        return self.resume.part if self.resume is not None else 0
+
+    def _load(self) -> Optional[Checkpoint]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as f:
+                checkpoint = Checkpoint(**json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Checkpointer: ignoring unreadable {self.path}: {e}")
+            return None
+        if checkpoint.video != self.video or checkpoint.config != self.config_key:
+            print("Checkpointer: checkpoint is for another input or config, starting from the beginning")
+            return None
+        print(f"Checkpointer: resuming after frame {checkpoint.frame_id} (video part {checkpoint.part})")
+        return checkpoint
+
+    def save(self, frame_id: int, part: int, viewport: dict):
+        """Atomically record that everything up to frame_id has been written."""
+        checkpoint = Checkpoint(frame_id=frame_id, part=part, viewport=viewport, video=self.video, config=self.config_key)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(asdict(checkpoint), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def finish(self):
+        """Join the video parts into output_<name>.mp4 and drop the checkpoint."""
+        parts = {}
+        for path in glob.glob(os.path.join(glob.escape(self.output_dir), "output_*.part*.mp4")):
+            match = _PART.match(os.path.basename(path))
+            if match:
+                parts.setdefault(match["name"], []).append((int(match["part"]), path))
+
+        for name, numbered in parts.items():
+            paths = [path for _, path in sorted(numbered)]
+            concat_videos(paths, os.path.join(self.output_dir, f"output_{name}.mp4"), self.config)
+            for path in paths:
+                os.remove(path)
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        print(f"Checkpointer: joined {sum(len(v) for v in parts.values())} video parts")
@@ -0,0 +1,100 @@
+# pipeline/delivery.py
+"""
+Exactly-once, ordered delivery on the stage queues.
+
+The frame source stamps every frame it emits with `seq`, counting up from 0
+per clip, including frames it then fails to queue. Detection and viewport
+stages copy the seq onto what they derive from a frame, like frame_id and
+timestamp. Each stage queue (raw_frames, detections, viewport) keeps a
+SequenceTracker on its consumer side, so get() hands every frame to the
+consuming stage once and in seq order:
+
+- duplicate: a seq that was already delivered (or is waiting) is dropped
+  and its shared-memory reference released; so is a frame arriving after
+  the tracker gave up waiting for it.
+- gap: frames lost upstream (a producer's Full timeout, a stale drop, an
+  error) are counted as missing once the tracker stops waiting for them.
+- reorder: a frame ahead of the next expected seq waits until the missing
+  ones arrive or more than [queues] reorder_window frames are waiting. Every
+  queue has a single producer today, so the window defaults to 0 and a gap
+  is reported as soon as a later frame shows up.
+
+A queue's sequence starts at the first seq it sees, since the detector
+never emits a clip's first frame (it only primes the differencing). Items
+without a seq (sentinels, ClipMarkers) release everything still waiting; a
+ClipMarker or sentinel also starts a new sequence.
+"""
+
+
+class SequenceTracker:
+    """Consumer-side dedup, gap detection and bounded reordering for one queue."""
+
+    def __init__(self, name: str, window: int = 0, transport=None):
+        self.name = name
+        self.window = max(0, int(window))
+        self.transport = transport  # releases the slot of a dropped duplicate
+        self.delivered = 0
+        self.duplicates = 0
+        self.missing = 0  # frames never received
+        self.gaps = 0  # runs of missing frames
+        self.max_waiting = 0
+        self.reset()
+
+    def reset(self):
+        """Start a new sequence (next clip)."""
+        self._next = None  # set by the sequence's first frame
+        self._waiting = {}
+
+    def accept(self, item) -> list:
+        """Items that are now deliverable, in order, after receiving `item`."""
+        seq = getattr(item, "seq", None)
+        if seq is None:
+            ready = self.flush()
+            if item is None or hasattr(item, "clip_id"):
+                if item is None:
+                    print(self.summary())
+                self.reset()
+            return ready + [item]
+
+        if self._next is None:
+            self._next = seq
+        if seq < self._next or seq in self._waiting:
+            self.duplicates += 1
+            if self.transport is not None:
+                self.transport.release(item)
+            return []
+
+        self._waiting[seq] = item
+        if self._next not in self._waiting and len(self._waiting) > self.window:
+            self._skip_to(min(self._waiting))
+        ready = self._drain()
+        self.max_waiting = max(self.max_waiting, len(self._waiting))
+        return ready
+
+    def flush(self) -> list:
+        """Everything still waiting, in order; the frames between them count as missing."""
+        ready = []
+        while self._waiting:
+            self._skip_to(min(self._waiting))
+            ready += self._drain()
+        return ready
+
+    def _skip_to(self, seq: int):
+        if seq > self._next:
+            self.missing += seq - self._next
+            self.gaps += 1
+            self._next = seq
+
+    def _drain(self) -> list:
+        ready = []
+        while self._next in self._waiting:
+            ready.append(self._waiting.pop(self._next))
+            self._next += 1
+        self.delivered += len(ready)
+        return ready
+
+    def summary(self) -> str:
+        return (
+            f"SequenceTracker[{self.name}]: {self.delivered} frames delivered, {self.duplicates} duplicate or late frames dropped, "
+            f"{self.missing} missing in {self.gaps} gaps, at most {self.max_waiting} waiting"
+        )
@@ -0,0 +1,273 @@
+# pipeline/detection_cache.py
+"""
+Persistent cache of DetectionProcess output.
+
+Detections (frame_id, timestamp, motion boxes) are stored one row per box in
+a Parquet file named by a key built from the video's content hash and every
+setting that changes detection results, as the run resolves them: the
+backend actually used (motion_vectors falls back to contours outside
+offline mode or without PyAV) and the reader's decode mode (seeking can
+land on other frames than grab/read). Tuning viewport parameters then
+replays the cached detections instead of re-running motion detection.
+
+Only complete, reproducible runs are cached: a run whose detector input
+lost frames is not saved, and stream runs whose detections depend on
+runtime state (adaptive backpressure, [roi] windows) or need data the cache
+does not store (motion heatmaps) neither replay nor record.
+
+Parquet needs pyarrow or fastparquet; without either the cache falls back to
+a gzipped CSV with the same columns. pandas is only imported when a cache is
+actually saved or loaded, so importing this module stays cheap.
+"""
+
+import hashlib
+import json
+import os
+from multiprocessing import Process
+from queue import Empty, Full
+from typing import Optional
+
+import cv2
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.frame_reader import resolve_decode_mode
+from hometeamproj.pipeline.metrics import StageMetrics
+from hometeamproj.pipeline.motion_backends import MOTION_BACKENDS
+from hometeamproj.pipeline.motion_vectors import BACKEND_NAME as MOTION_VECTORS, motion_vectors_available
+from hometeamproj.pipeline.queue_manager import DetectionData
+from hometeamproj.pipeline.shared_frames import InlineFrameTransport
+
+
+# PipelineConfig fields that change what DetectionProcess emits, besides the
+# resolved backend and decode mode (detection_settings). gaussian_blur_size
+# is not read: the blur kernel follows detection_scale.
+DETECTION_CACHE_FIELDS = (
+    "detection_threshold",
+    "min_motion_area",
+    "detection_scale",
+    "block_size",
+    "block_min_fill",
+    "mv_min_magnitude",
+    "frame_resize_width",
+    "frame_resize_height",
+    "target_fps",
+)
+
+CACHE_COLUMNS = ["frame_id", "timestamp", "box_index", "x", "y", "w", "h"]
+
+
+def video_content_hash(video_path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(video_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resolved_detection_backend(config: PipelineConfig, offline: bool = False) -> str:
+    """The backend a run will actually use for [detection] backend."""
+    name = str(getattr(config, "detection_backend", "contours")).lower()
+    if name == MOTION_VECTORS and offline and motion_vectors_available():
+        return name
+    return name if name in MOTION_BACKENDS else "contours"
+
+
+def _video_fps(video_path: str) -> float:
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0.0
+    finally:
+        cap.release()
+    return fps if fps and fps > 0 else 30.0  # FrameReaderProcess's fallback
+
+
+def detection_settings(video_path: str, config: PipelineConfig, offline: bool = False) -> dict:
+    """Everything that decides a run's detections, as the run will resolve it."""
+    settings = {name: getattr(config, name, None) for name in DETECTION_CACHE_FIELDS}
+    settings["detection_backend"] = resolved_detection_backend(config, offline)
+    if settings["detection_backend"] == MOTION_VECTORS:
+        settings["decode_mode"] = None  # PyAV decodes every frame
+    else:
+        skip_interval = max(1, int(_video_fps(video_path) / max(1, int(config.target_fps))))
+        settings["decode_mode"] = resolve_decode_mode(config, skip_interval)
+    return settings
+
+
+def detection_cache_key(video_path: str, config: PipelineConfig, offline: bool = False) -> str:
+    settings = detection_settings(video_path, config, offline)
+    payload = json.dumps({"video": video_content_hash(video_path), "detection": settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def uncacheable_reason(config: PipelineConfig) -> Optional[str]:
+    """Why a stream run's detections cannot be replayed from or saved to the cache, or None."""
+    if getattr(config, "adaptive_enabled", False):
+        return "adaptive backpressure changes detection scale, fps and drops at runtime"
+    if getattr(config, "roi_enabled", False):
+        return "[roi] detection windows follow the viewport stage's timing"
+    if getattr(config, "detection_heatmap", False):
+        return "the cache does not store motion heatmaps"
+    return None
+
+
+def frames_lost(queue) -> int:
+    """Frames the queue's SequenceTracker found missing (0 for a queue without one)."""
+    delivery = getattr(queue, "delivery", None)
+    return delivery.missing if delivery is not None else 0
+
+
+def _parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        pass
+    try:
+        import fastparquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class DetectionCache:
+    """One cached detection run, stored under cache_dir/<key>.parquet."""
+
+    def __init__(self, cache_dir: str, key: str):
+        self.cache_dir = cache_dir
+        self.key = key
+
+    @classmethod
+    def for_video(cls, video_path: str, config: PipelineConfig, offline: bool = False) -> "DetectionCache":
+        cache_dir = getattr(config, "detection_cache_dir", ".cache/detections")
+        return cls(cache_dir, detection_cache_key(video_path, config, offline))
+
+    @property
+    def parquet_path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self.key}.parquet")
+
+    @property
+    def csv_path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self.key}.csv.gz")
+
+    def exists(self) -> bool:
+        return os.path.exists(self.parquet_path) or os.path.exists(self.csv_path)
+
+    def save(self, records):
+        """records: iterable of (frame_id, timestamp, motion_boxes)."""
+        import pandas as pd
+
+        rows = []
+        for frame_id, timestamp, boxes in records:
+            if not boxes:
+                # Keep motionless frames so replay knows they were detected
+                rows.append((frame_id, timestamp, -1, 0, 0, 0, 0))
+            for i, (x, y, w, h) in enumerate(boxes):
+                rows.append((frame_id, timestamp, i, int(x), int(y), int(w), int(h)))
+
+        df = pd.DataFrame(rows, columns=CACHE_COLUMNS)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Write under a temporary name so an interrupted run never leaves a
+        # truncated cache entry behind
+        if _parquet_available():
+            path = self.parquet_path
+            df.to_parquet(path + ".tmp", index=False)
+        else:
+            path = self.csv_path
+            df.to_csv(path + ".tmp", index=False, compression="gzip")
+        os.replace(path + ".tmp", path)
+        print(f"DetectionCache: saved {df['frame_id'].nunique()} frames to {path}")
+
+    def load(self) -> dict:
+        """Returns {frame_id: (timestamp, [(x, y, w, h), ...])}."""
+        import pandas as pd
+
+        if os.path.exists(self.parquet_path):
+            df = pd.read_parquet(self.parquet_path)
+        else:
+            df = pd.read_csv(self.csv_path, compression="gzip")
+
+        df = df.sort_values(["frame_id", "box_index"])
+        detections = {}
+        for frame_id, timestamp, box_index, x, y, w, h in df.itertuples(index=False, name=None):
+            entry = detections.setdefault(int(frame_id), (float(timestamp), []))
+            if box_index >= 0:
+                entry[1].append((int(x), int(y), int(w), int(h)))
+        return detections
+
+
+class DetectionRecorder:
+    """Collects DetectionData as it streams past and saves it on a clean finish."""
+
+    def __init__(self, cache: DetectionCache):
+        self.cache = cache
+        self.records = []
+
+    def record(self, detection: DetectionData):
+        self.records.append((detection.frame_id, detection.timestamp, list(detection.motion_boxes)))
+
+    def finish(self, lost: int = 0):
+        """Save what was recorded, unless `lost` frames never reached the recorder."""
+        if lost:
+            print(f"DetectionRecorder: {lost} frames were lost before the viewport stage, not caching this run")
+        elif self.records:
+            self.cache.save(self.records)
+        self.records = []
+
+
+class CachedDetectionProcess(Process):
+    """Stands in for the detection stage, attaching cached boxes to each frame."""
+
+    def __init__(self, input_queue, output_queue, config: PipelineConfig, detections: dict, transport=None, metrics=None):
+        super().__init__()
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.config = config
+        self.detections = detections
+        self.transport = transport or InlineFrameTransport()
+        self.metrics = metrics or StageMetrics("detector")
+
+    def run(self):
+        print(f"CachedDetectionProcess: Replaying {len(self.detections)} cached detections")
+
+        while True:
+            try:
+                frame_data = self.metrics.get(self.input_queue, timeout=self.config.queue_timeout)
+            except Empty:
+                continue
+
+            if frame_data is None:
+                try:
+                    self.output_queue.put(None, timeout=self.config.queue_timeout)
+                except Full:
+                    pass
+                break
+
+            cached = self.detections.get(frame_data.frame_id)
+            if cached is None:
+                # The detector emitted nothing for this frame (e.g. the first one)
+                self.transport.release(frame_data)
+                self.metrics.drop("not_cached")
+                continue
+
+            timestamp, boxes = cached
+            detection = DetectionData(
+                frame_id=frame_data.frame_id,
+                frame=frame_data.frame,
+                motion_boxes=list(boxes),
+                slot=frame_data.slot,
+                timestamp=timestamp,
+                created_at=frame_data.created_at,
+                seq=frame_data.seq,
+            )
+            try:
+                self.metrics.put(self.output_queue, detection, timeout=self.config.queue_timeout)
+            except Full:
+                self.transport.release(detection)
+                self.metrics.drop("queue_full")
+
+        self.metrics.close()
+        print("CachedDetectionProcess: Finished")
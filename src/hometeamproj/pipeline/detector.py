@@ -1,20 +1,155 @@
+import math
+import time
 import cv2
 from multiprocessing import Process
 from queue import Empty, Full
 
-from hometeamproj.pipeline.queue_manager import DetectionData
+from hometeamproj.pipeline.queue_manager import ClipMarker, DetectionData
 from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.shared_frames import InlineFrameTransport
+from hometeamproj.pipeline.metrics import StageMetrics
+from hometeamproj.pipeline.backpressure import is_stale
+from hometeamproj.pipeline.motion_backends import create_motion_backend
+from hometeamproj.pipeline.buffer_pool import BufferPool
+from hometeamproj.pipeline.roi import GRID, RoiScheduler, intersect
 
 
 class DetectionProcess(Process):
     """Process that detects motion in frames."""
 
-    def __init__(self, input_queue, output_queue, config: PipelineConfig):
+    def __init__(
+        self, input_queue, output_queue, config: PipelineConfig, transport=None, metrics=None, controls=None, feedback=None
+    ):
         super().__init__()
         self.input_queue = input_queue
         self.output_queue = output_queue
         self.config = config
+        self.transport = transport or InlineFrameTransport()
+        self.metrics = metrics or StageMetrics("detector")
+        self.controls = controls  # PipelineControls when adaptive backpressure is on
         self.prev_frame = None
+        self.pool = BufferPool(self.metrics, enabled=bool(getattr(config, "buffer_pool", True)))
+        self.backend = create_motion_backend(config, pool=self.pool, metrics=self.metrics)
+        # Viewport-guided windows ([roi] enabled): RoiScheduler over the viewport stage's ViewportFeedback
+        self.roi = RoiScheduler(config, feedback) if feedback is not None else None
+        self.prev_window = None  # (blur, rect) of the previous frame in roi mode
+
+    # Tuned for full-resolution frames; rescaled with detection_scale
+    BLUR_KERNEL = 21
+
+    @property
+    def detection_scale(self) -> float:
+        if self.controls is not None:
+            scale = self.controls.detection_scale
+        else:
+            scale = float(getattr(self.config, "detection_scale", 1.0))
+        return min(1.0, max(0.05, scale))
+
+    def preprocess(self, frame):
+        """
+        Grayscale + blur a frame for differencing. Raises cv2.error.
+
+        With detection_scale < 1 this works on a downscaled proxy, and the
+        blur kernel shrinks with it so the smoothing covers the same area.
+        The result lives in a pooled buffer: keep it with keep_previous().
+        """
+        scale = self.detection_scale
+        if scale < 1.0:
+            h, w = frame.shape[:2]
+            proxy_size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+            proxy = self.pool.scratch("proxy", (proxy_size[1], proxy_size[0], 3))
+            with self.metrics.timer("resize"):
+                frame = cv2.resize(frame, proxy_size, dst=proxy, interpolation=cv2.INTER_AREA)
+
+        kernel = max(3, int(round(self.BLUR_KERNEL * scale)) | 1)
+        with self.metrics.timer("cvt_color"):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.pool.scratch("gray", frame.shape[:2]))
+        with self.metrics.timer("blur"):
+            return cv2.GaussianBlur(gray, (kernel, kernel), 0, dst=self.pool.scratch("blur", frame.shape[:2]))
+
+    def keep_previous(self, blur):
+        """
+        Hold on to blur as the previous frame. preprocess() reuses one pooled
+        blur buffer, so the two are swapped and the next frame's blur goes
+        into the old previous frame's buffer.
+        """
+        self.pool.swap("blur", "prev_blur")
+        return blur
+
+    def detect_motion(self, prev_blur, blur, frame_shape=None) -> tuple:
+        """(boxes, heatmap) from the configured motion backend; see motion_backends."""
+        return self.backend.detect(prev_blur, blur, frame_shape)
+
+    def preprocess_window(self, frame, rect):
+        """
+        preprocess() for frame[rect] only. The crop gets a halo of the blur
+        radius, so inside rect the result matches a full-frame preprocess().
+        """
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = rect
+        if rect == (0, 0, w, h):
+            return self.preprocess(frame)
+
+        scale = self.detection_scale
+        kernel = max(3, int(round(self.BLUR_KERNEL * scale)) | 1)
+        # Whole grid cells, so the crop's proxy lines up with the full-frame proxy
+        halo = int(math.ceil((kernel // 2 + 1) / scale / GRID)) * GRID
+        ox1, oy1 = max(0, x1 - halo), max(0, y1 - halo)
+        ox2, oy2 = min(w, x2 + halo), min(h, y2 + halo)
+        blur = self.preprocess(frame[oy1:oy2, ox1:ox2])
+
+        sx = blur.shape[1] / (ox2 - ox1)
+        sy = blur.shape[0] / (oy2 - oy1)
+        return blur[
+            int(round((y1 - oy1) * sy)):int(round((y2 - oy1) * sy)),
+            int(round((x1 - ox1) * sx)):int(round((x2 - ox1) * sx)),
+        ]
+
+    def detect_window(self, frame, timestamp: float):
+        """
+        roi mode: difference this frame's window against the previous frame
+        where the two windows overlap. (boxes, heatmap) in full-frame
+        coordinates, or None for the first frame.
+        """
+        rect = self.roi.window(timestamp, frame.shape)
+        blur = self.preprocess_window(frame, rect)
+        self.metrics.set_gauge("roi_window_frames", self.roi.window_frames)
+        self.metrics.set_gauge("roi_full_frames", self.roi.full_frames)
+
+        result = None
+        if self.prev_window is not None:
+            prev_blur, prev_rect = self.prev_window
+            overlap = intersect(prev_rect, rect)
+            boxes, heatmap = [], None
+            if overlap is not None:
+                a = self._window_view(prev_blur, prev_rect, overlap)
+                b = self._window_view(blur, rect, overlap)
+                rows, cols = min(a.shape[0], b.shape[0]), min(a.shape[1], b.shape[1])
+                x0, y0 = overlap[0], overlap[1]
+                boxes, heatmap = self.detect_motion(
+                    a[:rows, :cols], b[:rows, :cols], (overlap[3] - overlap[1], overlap[2] - overlap[0])
+                )
+                boxes = [(x + x0, y + y0, bw, bh) for (x, y, bw, bh) in boxes]
+                if heatmap is not None:
+                    heatmap.origin = (x0, y0)
+            self.roi.observe(rect, boxes, frame.shape)
+            result = (boxes, heatmap)
+
+        # preprocess() overwrites its blur buffer on the next frame
+        prev = self.pool.scratch("prev_window", blur.shape)
+        prev[...] = blur
+        self.prev_window = (prev, rect)
+        return result
+
+    @staticmethod
+    def _window_view(blur, rect, area):
+        """The part of a window's blur (covering rect) that shows area."""
+        sx = blur.shape[1] / (rect[2] - rect[0])
+        sy = blur.shape[0] / (rect[3] - rect[1])
+        return blur[
+            int(round((area[1] - rect[1]) * sy)):int(round((area[3] - rect[1]) * sy)),
+            int(round((area[0] - rect[0]) * sx)):int(round((area[2] - rect[0]) * sx)),
+        ]
 
     def run(self):
         print("DetectionProcess: Starting motion detection")
@@ -22,7 +157,7 @@ class DetectionProcess(Process):
         while True:
             # 1) Get frame
             try:
-                frame_data = self.input_queue.get(timeout=self.config.queue_timeout)
+                frame_data = self.metrics.get(self.input_queue, timeout=self.config.queue_timeout)
             except Empty:
                 continue
 
@@ -35,51 +170,76 @@ class DetectionProcess(Process):
                     pass
                 break
 
+            if isinstance(frame_data, ClipMarker):
+                # Clip boundary (batch mode): never difference across it
+                self.prev_frame = None
+                self.prev_window = None
+                if self.roi is not None:
+                    self.roi.reset()
+                self.metrics.put(self.output_queue, frame_data)
+                continue
+
+            if self.controls is not None and is_stale(frame_data, self.config.latency_budget):
+                # Already over the latency budget: not worth detecting on
+                self.transport.release(frame_data)
+                self.metrics.drop("stale")
+                continue
 
-            if frame_data.frame is None:
+            frame = self.transport.load(frame_data)
+            if frame is None:
+                self.metrics.drop("bad_frame")
                 continue
 
+            start = time.perf_counter()
             try:
-                gray = cv2.cvtColor(frame_data.frame, cv2.COLOR_BGR2GRAY)
-                blur = cv2.GaussianBlur(gray, (21, 21), 0)
+                if self.roi is not None:
+                    detected = self.detect_window(frame, frame_data.timestamp)
+                else:
+                    blur = self.preprocess(frame)
             except cv2.error as e:
                 print(f"DetectionProcess: OpenCV error: {e}")
+                self.transport.release(frame_data)
+                self.metrics.drop("error")
                 continue
 
-
-            if self.prev_frame is None:
-                self.prev_frame = blur
-                continue
-
-            frame_delta = cv2.absdiff(self.prev_frame, blur)
-            self.prev_frame = blur
-
-
-            thresh = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
-            thresh = cv2.dilate(thresh, None, iterations=2)
-
-
-            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-            boxes = []
-            for c in contours:
-
-                if cv2.contourArea(c) < self.config.min_motion_area:
+            if self.roi is not None:
+                if detected is None:
+                    self.transport.release(frame_data)
                     continue
-                x, y, w, h = cv2.boundingRect(c)
-                boxes.append((x, y, w, h))
+                boxes, heatmap = detected
+            else:
+                if self.prev_frame is None:
+                    self.prev_frame = self.keep_previous(blur)
+                    self.transport.release(frame_data)
+                    continue
+
+                boxes, heatmap = self.detect_motion(self.prev_frame, blur, frame.shape)
+                self.prev_frame = self.keep_previous(blur)
+            self.metrics.observe("processing", time.perf_counter() - start)
 
 
             detection = DetectionData(
                 frame_id=frame_data.frame_id,
                 frame=frame_data.frame,
                 motion_boxes=boxes,
+                slot=frame_data.slot,
+                timestamp=frame_data.timestamp,
+                created_at=frame_data.created_at,
+                motion_heatmap=heatmap,
+                seq=frame_data.seq,
             )
 
             try:
-                self.output_queue.put(detection, timeout=self.config.queue_timeout)
+                self.metrics.put(self.output_queue, detection, timeout=self.config.queue_timeout)
             except Full:
                 print("droppping detection")
-                pass
+                self.transport.release(detection)
+                self.metrics.drop("queue_full")
 
+        if self.roi is not None:
+            print(
+                f"DetectionProcess: {self.roi.window_frames} frames scanned in viewport windows, "
+                f"{self.roi.full_frames} full frames"
+            )
+        self.metrics.close()
         print("DetectionProcess: Finished motion detection")
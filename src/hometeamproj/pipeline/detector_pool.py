@@ -0,0 +1,353 @@
+# pipeline/detector_pool.py
+"""
+Parallel motion detection.
+
+Frame differencing needs the previous frame, so the pool works on
+overlapping chunks: the dispatcher groups consecutive FrameData into chunks
+and hands each chunk the last frame of the previous one as a primer. Workers
+difference their chunk independently and a reorder stage emits the
+resulting DetectionData in frame_id order.
+
+    raw_frames_queue -> dispatcher -> N workers -> reorder -> detections_queue
+"""
+
+import multiprocessing
+import time
+from dataclasses import dataclass, field
+from multiprocessing import Process
+from queue import Empty, Full
+from typing import Optional
+
+import cv2
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.backpressure import is_stale
+from hometeamproj.pipeline.detector import DetectionProcess
+from hometeamproj.pipeline.queue_manager import ClipMarker, DetectionData, FrameData
+from hometeamproj.pipeline.shared_frames import InlineFrameTransport
+from hometeamproj.pipeline.metrics import StageMetrics, stage_metrics
+
+
+@dataclass
+class FrameChunk:
+    """Consecutive frames for one worker plus the frame preceding them."""
+
+    index: int
+    frames: list  # List of FrameData
+    primer: Optional[FrameData] = None
+    marker: Optional[ClipMarker] = None  # Batch mode: clip boundary after these frames
+
+
+@dataclass
+class DetectionBatch:
+    """Detections produced from one FrameChunk."""
+
+    index: int
+    detections: list = field(default_factory=list)  # List of DetectionData
+    marker: Optional[ClipMarker] = None
+
+
+class DetectionDispatcherProcess(Process):
+    """Groups raw frames into overlapping chunks for the worker pool."""
+
+    def __init__(self, input_queue, task_queue, config: PipelineConfig, workers: int, chunk_size: int, transport=None, metrics=None):
+        super().__init__()
+        self.input_queue = input_queue
+        self.task_queue = task_queue
+        self.config = config
+        self.workers = workers
+        self.chunk_size = max(1, chunk_size)
+        self.transport = transport or InlineFrameTransport()
+        self.metrics = metrics or StageMetrics("detector_dispatch")
+
+        self._index = 0
+        self._primer = None
+
+    def _flush(self, frames):
+        if not frames:
+            return
+
+        # The last frame also travels downstream with this chunk, so take a
+        # reference now that is held until it primes the next chunk.
+        next_primer = frames[-1]
+        self.transport.retain(next_primer)
+
+        self.metrics.put(self.task_queue, FrameChunk(index=self._index, frames=list(frames), primer=self._primer))
+        self._index += 1
+        self._primer = next_primer
+        frames.clear()
+
+    def run(self):
+        print(f"DetectionDispatcherProcess: Dispatching chunks of {self.chunk_size} to {self.workers} workers")
+
+        pending = []
+        while True:
+            try:
+                frame_data = self.metrics.get(self.input_queue, timeout=self.config.queue_timeout)
+            except Empty:
+                # Source is stalling: don't sit on a half-filled chunk
+                self._flush(pending)
+                continue
+
+            if frame_data is None:
+                self._flush(pending)
+                if self._primer is not None:
+                    self.transport.release(self._primer)
+                for _ in range(self.workers):
+                    self.task_queue.put(None)
+                break
+
+            if isinstance(frame_data, ClipMarker):
+                # Clip boundary: finish the clip's chunks and don't prime across it
+                self._flush(pending)
+                if self._primer is not None:
+                    self.transport.release(self._primer)
+                    self._primer = None
+                self.metrics.put(self.task_queue, FrameChunk(index=self._index, frames=[], marker=frame_data))
+                self._index += 1
+                continue
+
+            pending.append(frame_data)
+            if len(pending) >= self.chunk_size:
+                self._flush(pending)
+
+        self.metrics.close()
+        print("DetectionDispatcherProcess: Finished dispatching")
+
+
+class DetectionWorkerProcess(DetectionProcess):
+    """Pool member: differences each FrameChunk against its primer frame."""
+
+    def __init__(
+        self, task_queue, result_queue, config: PipelineConfig, worker_id: int = 0, transport=None, metrics=None, controls=None
+    ):
+        super().__init__(task_queue, result_queue, config, transport=transport, metrics=metrics, controls=controls)
+        self.worker_id = worker_id
+
+    def _blur(self, frame_data):
+        frame = self.transport.load(frame_data)
+        if frame is None:
+            return None, None
+        try:
+            return self.preprocess(frame), frame.shape
+        except cv2.error as e:
+            print(f"DetectionWorkerProcess[{self.worker_id}]: OpenCV error: {e}")
+            return None, None
+
+    def process_chunk(self, chunk: FrameChunk) -> DetectionBatch:
+        batch = DetectionBatch(index=chunk.index, marker=chunk.marker)
+
+        prev = None
+        if chunk.primer is not None:
+            prev, _ = self._blur(chunk.primer)
+            if prev is not None:
+                prev = self.keep_previous(prev)
+            self.transport.release(chunk.primer)
+
+        for frame_data in chunk.frames:
+            if self.controls is not None and is_stale(frame_data, self.config.latency_budget):
+                self.transport.release(frame_data)
+                self.metrics.drop("stale")
+                continue
+
+            start = time.perf_counter()
+            blur, frame_shape = self._blur(frame_data)
+            if blur is None:
+                self.transport.release(frame_data)
+                self.metrics.drop("error")
+                continue
+
+            if prev is None:
+                prev = self.keep_previous(blur)
+                self.transport.release(frame_data)
+                continue
+
+            boxes, heatmap = self.detect_motion(prev, blur, frame_shape)
+            prev = self.keep_previous(blur)
+            self.metrics.observe("processing", time.perf_counter() - start)
+
+            batch.detections.append(
+                DetectionData(
+                    frame_id=frame_data.frame_id,
+                    frame=frame_data.frame,
+                    motion_boxes=boxes,
+                    slot=frame_data.slot,
+                    timestamp=frame_data.timestamp,
+                    created_at=frame_data.created_at,
+                    motion_heatmap=heatmap,
+                    seq=frame_data.seq,
+                )
+            )
+        return batch
+
+    def run(self):
+        print(f"DetectionWorkerProcess[{self.worker_id}]: Starting motion detection")
+
+        while True:
+            try:
+                chunk = self.metrics.get(self.input_queue, timeout=self.config.queue_timeout)
+            except Empty:
+                continue
+
+            if chunk is None:
+                self.output_queue.put(None)
+                break
+
+            # Never drop a batch here: the reorder stage waits for every index
+            self.metrics.put(self.output_queue, self.process_chunk(chunk))
+
+        self.metrics.close()
+        print(f"DetectionWorkerProcess[{self.worker_id}]: Finished motion detection")
+
+
+class DetectionReorderProcess(Process):
+    """Restores frame_id order across workers and fans in their sentinels."""
+
+    def __init__(self, result_queue, output_queue, config: PipelineConfig, workers: int, transport=None, metrics=None):
+        super().__init__()
+        self.result_queue = result_queue
+        self.output_queue = output_queue
+        self.config = config
+        self.workers = workers
+        self.transport = transport or InlineFrameTransport()
+        self.metrics = metrics or StageMetrics("detector_reorder")
+
+        # Workers never drop a batch, so a missing index is only a slow worker:
+        # wait for it. What piles up meanwhile is bounded by the frames the
+        # reader can have in flight (ring slots, queue sizes and budgets).
+        self.pending = {}  # index -> DetectionBatch waiting for an earlier one
+        self.next_index = 0
+
+    def accept(self, batch: DetectionBatch) -> list:
+        """Batches that can be emitted, in index order, now that `batch` arrived."""
+        if batch.index < self.next_index:
+            # Already emitted (a repeated chunk): emitting it again would put old frames after newer ones
+            print(f"DetectionReorderProcess: chunk {batch.index} arrived after it was emitted, dropping it")
+            for detection in batch.detections:
+                self.transport.release(detection)
+            self.metrics.drop("late", len(batch.detections))
+            # A clip boundary still has to reach the later stages
+            return [DetectionBatch(index=batch.index, marker=batch.marker)] if batch.marker is not None else []
+
+        self.pending[batch.index] = batch
+
+        ready = []
+        while self.next_index in self.pending:
+            ready.append(self.pending.pop(self.next_index))
+            self.next_index += 1
+        return ready
+
+    def flush(self) -> list:
+        """Whatever is still pending, in index order (all workers have finished)."""
+        ready = [self.pending[index] for index in sorted(self.pending)]
+        self.pending.clear()
+        if ready:
+            self.next_index = ready[-1].index + 1
+        return ready
+
+    def _emit(self, batch: DetectionBatch):
+        for detection in batch.detections:
+            try:
+                self.metrics.put(self.output_queue, detection, timeout=self.config.queue_timeout)
+            except Full:
+                print("DetectionReorderProcess: dropping detection", detection.frame_id)
+                self.transport.release(detection)
+                self.metrics.drop("queue_full")
+        if batch.marker is not None:
+            self.metrics.put(self.output_queue, batch.marker)
+
+    def run(self):
+        print("DetectionReorderProcess: Starting reorder stage")
+
+        finished_workers = 0
+
+        while finished_workers < self.workers:
+            try:
+                batch = self.metrics.get(self.result_queue, timeout=self.config.queue_timeout)
+            except Empty:
+                continue
+
+            if batch is None:
+                finished_workers += 1
+                continue
+
+            for ready in self.accept(batch):
+                self._emit(ready)
+
+        for ready in self.flush():
+            self._emit(ready)
+
+        try:
+            self.output_queue.put(None, timeout=self.config.queue_timeout)
+        except Full:
+            pass
+
+        self.metrics.close()
+        print("DetectionReorderProcess: Finished reorder stage")
+
+
+def create_detection_stage(
+    input_queue,
+    output_queue,
+    config: PipelineConfig,
+    transport=None,
+    collector=None,
+    controls=None,
+    queues=None,
+    feedback=None,
+) -> list:
+    """
+    Build the detection stage: a single DetectionProcess, or a dispatcher,
+    worker pool and reorder stage when [detection] workers > 1. With a
+    QueueManager, the pool's task and result queues share its memory budget.
+    A ViewportFeedback turns on viewport-guided windows (single process only).
+    """
+    workers = max(1, int(getattr(config, "detection_workers", 1)))
+    if workers == 1:
+        return [
+            DetectionProcess(
+                input_queue, output_queue, config,
+                transport=transport, metrics=stage_metrics(collector, "detector"), controls=controls,
+                feedback=feedback,
+            )
+        ]
+    if feedback is not None:
+        print("create_detection_stage: [roi] needs [detection] workers = 1, the worker pool scans full frames")
+
+    chunk_size = max(1, int(getattr(config, "detection_chunk_size", 8)))
+
+    ring_slots = getattr(transport, "slots", None)
+    in_flight = chunk_size * (workers * 3 + 1)
+    if ring_slots is not None and ring_slots < in_flight:
+        print(
+            f"create_detection_stage: ring_slots={ring_slots} is below the ~{in_flight} frames "
+            "the worker pool keeps in flight; the reader will stall waiting for free slots"
+        )
+
+    if queues is not None:
+        task_queue = queues.queue("detector_tasks", workers * 2)
+        result_queue = queues.queue("detector_results", config.queue_max_size)
+    else:
+        task_queue = multiprocessing.Queue(maxsize=workers * 2)
+        result_queue = multiprocessing.Queue(maxsize=config.queue_max_size)
+
+    stage = [
+        DetectionDispatcherProcess(
+            input_queue, task_queue, config, workers, chunk_size,
+            transport=transport, metrics=stage_metrics(collector, "detector_dispatch"),
+        )
+    ]
+    stage += [
+        DetectionWorkerProcess(
+            task_queue, result_queue, config, worker_id=i,
+            transport=transport, metrics=stage_metrics(collector, "detector"), controls=controls,
+        )
+        for i in range(workers)
+    ]
+    stage.append(
+        DetectionReorderProcess(
+            result_queue, output_queue, config, workers,
+            transport=transport, metrics=stage_metrics(collector, "detector_reorder"),
+        )
+    )
+    return stage
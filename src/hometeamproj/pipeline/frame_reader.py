@@ -3,32 +3,70 @@
 import time
 import cv2
 from multiprocessing import Process
-import importlib.util
-from hometeamproj.pipeline.queue_manager import FrameData , QueueManager
-from pathlib import Path
+from queue import Full
+from hometeamproj.pipeline.queue_manager import ClipMarker, FrameData
 from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.shared_frames import InlineFrameTransport
+from hometeamproj.pipeline.metrics import StageMetrics
+from hometeamproj.pipeline.buffer_pool import BufferPool
+
+def resolve_decode_mode(config: PipelineConfig, skip_interval: int) -> str:
+    """
+    How skipped frames are advanced past:
+    - read: decode every frame (original behaviour)
+    - grab: grab() without retrieve() for skipped frames
+    - seek: seek between kept frames
+    - auto: seek when skip_interval >= seek_min_skip, else grab
+    """
+    mode = str(getattr(config, "decode_mode", "auto")).lower()
+    if mode == "auto":
+        seek_min_skip = int(getattr(config, "seek_min_skip", 60))
+        mode = "seek" if skip_interval >= seek_min_skip else "grab"
+    if mode not in ("read", "grab", "seek"):
+        print(f"FrameReaderProcess: unknown decode_mode '{mode}', using grab")
+        mode = "grab"
+    if skip_interval == 1:
+        mode = "read"
+    return mode
+
 
 class FrameReaderProcess(Process):
     """Process that reads frames from video file and pushes FrameData into output_queue."""
 
-    def __init__(self, input_video: str, output_queue, config: PipelineConfig):
+    def __init__(
+        self,
+        input_video,
+        output_queue,
+        config: PipelineConfig,
+        transport=None,
+        metrics=None,
+        controls=None,
+        job_queue=None,
+        start_frame: int = 0,
+        end_frame=None,
+    ):
         super().__init__()
         self.input_video = input_video
         self.output_queue = output_queue
         self.config = config
-
-    def run(self):
-        print(f"FrameReaderProcess: Starting to read {self.input_video}")
-
-        cap = cv2.VideoCapture(self.input_video)
+        self.transport = transport or InlineFrameTransport()
+        self.metrics = metrics or StageMetrics("reader")
+        self.controls = controls  # PipelineControls when adaptive backpressure is on
+        # Batch mode: input_video is ignored and ClipJobs are read from job_queue
+        self.job_queue = job_queue
+        # Sharded mode: only source frames [start_frame, end_frame) are read
+        self.start_frame = max(0, int(start_frame))
+        self.end_frame = end_frame
+        self.pool = BufferPool(self.metrics, enabled=bool(getattr(config, "buffer_pool", True)))
+
+    def read_clip(self, video_path: str) -> dict:
+        """Decode one clip into output_queue (no sentinel); returns the reader's stats for it."""
+        print(f"FrameReaderProcess: Starting to read {video_path}")
+
+        cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
-            print(f"FrameReaderProcess: ERROR could not open video: {self.input_video}")
-            
-            try:
-                self.output_queue.put(None, timeout=self.config.queue_timeout)
-            except Exception:
-                pass
-            return
+            print(f"FrameReaderProcess: ERROR could not open video: {video_path}")
+            return {"error": f"could not open video: {video_path}"}
 
     
         video_fps = cap.get(cv2.CAP_PROP_FPS)
@@ -39,29 +77,108 @@ class FrameReaderProcess(Process):
   
         skip_interval = max(1, int(video_fps / target_fps))
 
+        decode_mode = resolve_decode_mode(self.config, skip_interval)
+        print(f"FrameReaderProcess: skip_interval={skip_interval}, decode_mode={decode_mode}")
+        seekable = True
+
+        # Adaptive mode emulates a live feed: frames are released at source speed
+        pacing = self.controls is not None and bool(getattr(self.config, "realtime_pacing", True))
+
         frame_id = 0
+        if self.start_frame:
+            # frame_ids stay absolute, so decimation lines up with an unsharded run
+            if cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame):
+                frame_id = self.start_frame
+            else:
+                while frame_id < self.start_frame and cap.grab():
+                    frame_id += 1
+        first_frame = frame_id
+        out_shape = (int(self.config.frame_resize_height), int(self.config.frame_resize_width), 3)
+        decoded_shape = None
+        decoded_frames = 0
+        emitted_frames = 0
+        seq = 0  # Every kept frame, queued or not (pipeline/delivery.py)
         start_time = time.time()
 
         try:
             while True:
-                ret, frame = cap.read()
+                if self.end_frame is not None and frame_id >= self.end_frame:
+                    break
+
+                if self.controls is not None and self.controls.target_fps != target_fps:
+                    target_fps = max(1.0, self.controls.target_fps)
+                    skip_interval = max(1, int(video_fps / target_fps))
+                    decode_mode = resolve_decode_mode(self.config, skip_interval)
+                    if decode_mode == "seek" and not seekable:
+                        decode_mode = "grab"
+
+                keep = frame_id % skip_interval == 0
+
+                if not keep and decode_mode == "seek":
+                    # Jump straight to the next kept frame; the demuxer only
+                    # decodes forward from the nearest keyframe.
+                    next_id = (frame_id // skip_interval + 1) * skip_interval
+                    if cap.set(cv2.CAP_PROP_POS_FRAMES, next_id):
+                        frame_id = next_id
+                        continue
+                    print("FrameReaderProcess: seeking not supported, falling back to grab")
+                    decode_mode = "grab"
+                    seekable = False
+
+                if not keep and decode_mode == "grab":
+                    # Demux/advance without decoding or colour conversion
+                    if not cap.grab():
+                        break
+                    frame_id += 1
+                    continue
+
+                decode_start = time.perf_counter()
+                # Decode into the same pooled buffer every time once its shape is known
+                decoded = self.pool.scratch("decoded", decoded_shape) if decoded_shape else None
+                ret, frame = cap.read(decoded)
                 if not ret:
                     break
+                decoded_shape = frame.shape
+                decoded_frames += 1
+                self.metrics.frames_in += 1
+                self.metrics.observe("decode", time.perf_counter() - decode_start)
 
             
-                if frame_id % skip_interval == 0:
-                   frame = cv2.resize(
-                    frame,
-                    (self.config.frame_resize_width, self.config.frame_resize_height),
-                    interpolation=cv2.INTER_AREA,
-                )
+                if keep:
                    timestamp = frame_id / video_fps
+                   if pacing:
+                       delay = start_time + timestamp - first_frame / video_fps - time.time()
+                       if delay > 0:
+                           time.sleep(delay)
 
-                   frame_data = FrameData(frame_id=frame_id, frame=frame, timestamp=timestamp)
+                   frame_data = None
                    try:
-                    self.output_queue.put(frame_data, timeout=self.config.queue_timeout)
-                   except Exception:
-                    pass
+                    # Resize straight into the outgoing buffer (a shared-memory slot when
+                    # the ring is on); it is queued, so it never comes from the pool
+                    buffer, payload, slot = self.transport.reserve(out_shape, timeout=self.config.queue_timeout)
+                    frame_data = FrameData(
+                        frame_id=frame_id, frame=payload, timestamp=timestamp, slot=slot, created_at=time.time(), seq=seq
+                    )
+                    with self.metrics.time("processing"), self.metrics.timer("resize"):
+                        cv2.resize(
+                            frame,
+                            (self.config.frame_resize_width, self.config.frame_resize_height),
+                            dst=buffer,
+                            interpolation=cv2.INTER_AREA,
+                        )
+                    if self.controls is not None:
+                        self.controls.frame_id = frame_id
+                    self.metrics.put(self.output_queue, frame_data, timeout=self.config.queue_timeout)
+                    emitted_frames += 1
+                   except Full:
+                    # Dropped: hand the shared-memory slot back to the ring
+                    if frame_data is not None:
+                        self.transport.release(frame_data)
+                        self.metrics.drop("queue_full")
+                    else:
+                        self.metrics.drop("ring_full")
+                   seq += 1
+                   self.metrics.flush()
                 frame_id+=1
 
          
@@ -71,42 +188,51 @@ class FrameReaderProcess(Process):
 
         finally:
             cap.release()
-            
+
+        elapsed = time.time() - start_time
+        source_frames = frame_id - first_frame
+        if elapsed > 0:
+            approx_out_fps = emitted_frames / elapsed
+            source_fps = source_frames / elapsed
+            decoded_fps = decoded_frames / elapsed
+            # Decoding every source frame would have cost source_frames decodes.
+            # In seek mode the frames decoded internally between the
+            # keyframe and the target are not visible here.
+            decode_gain = source_frames / decoded_frames if decoded_frames else 0.0
+            print(
+                f"FrameReaderProcess: Approx output FPS ~: {approx_out_fps:.2f} | "
+                f"source FPS ~: {source_fps:.2f} | decoded FPS ~: {decoded_fps:.2f} "
+                f"({decoded_frames}/{source_frames} frames decoded, {decode_gain:.1f}x fewer decodes, mode={decode_mode})"
+            )
+
+        return {
+            "source_frames": source_frames,
+            "decoded_frames": decoded_frames,
+            "emitted_frames": emitted_frames,
+            "read_seconds": round(elapsed, 3),
+        }
+
+    def _run_jobs(self):
+        """Batch mode: read clips from job_queue until a None job, each bracketed by ClipMarkers."""
+        while True:
+            job = self.job_queue.get()
+            if job is None:
+                break
+            self.output_queue.put(ClipMarker(job.clip_id, job.output_dir))
+            stats = self.read_clip(job.video_path)
+            self.output_queue.put(ClipMarker(job.clip_id, job.output_dir, end=True, stats={"reader": stats}))
+
+    def run(self):
+        try:
+            if self.job_queue is None:
+                self.read_clip(self.input_video)
+            else:
+                self._run_jobs()
+        finally:
             try:
-                self.output_queue.put(None)
-            except Exception:
+                self.output_queue.put(None, timeout=self.config.queue_timeout)
+            except Full:
                 pass
 
-            elapsed = time.time() - start_time
-            if elapsed > 0:
-                approx_out_fps = (max(0, frame_id // skip_interval)) / elapsed
-                print(f"FrameReaderProcess: Approx output FPS ~: {approx_out_fps:.2f}")
-
+            self.metrics.close()
             print("FrameReaderProcess: Finished reading frames")
-
-
-
-# if __name__ == "__main__":
-#     import multiprocessing as mp
-#     from pathlib import Path
-
-
-#     cfg_path = Path("config.ini")
-#     cfg = PipelineConfig.from_file(str(cfg_path)) if cfg_path.exists() else PipelineConfig.from_file("missing.ini")
-#     mp.get_start_method("spawn")
-#     q = mp.Queue(maxsize=cfg.queue_max_size)
-
-#     video_path = "/Users/bakr/Desktop/HoemTeam Project /HOMETEAMPROJ/src/hometeamproj/pipeline/sample_video_clip.mp4"  # adjust to your real path if needed
-#     p = FrameReaderProcess(input_video=video_path, output_queue=q, config=cfg)
-
-#     p.start()
-
-
-#     while True:
-#         item = q.get()
-#         if item is None:
-#             break
-#         print(item.frame_id)
-#         p.run()
-#     p.terminate()
-#     p.join()
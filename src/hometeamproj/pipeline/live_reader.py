@@ -0,0 +1,244 @@
+# pipeline/live_reader.py
+"""
+Live input for the streaming pipeline.
+
+Sources (picked by [live] source, or automatically from the input):
+- pipe:   a named pipe carrying raw BGR frames (width x height x 3 bytes each)
+- ffmpeg: an ffmpeg subprocess decoding any URL/device to raw BGR on stdout
+- file:   a file that is still being appended to, polled until it stops growing
+
+LiveFrameReaderProcess timestamps every frame on arrival (the "glass" time
+that end-to-end latency is measured from), paces output at the source clock
+and, when downstream lags, drops the oldest queued frame instead of blocking
+the source.
+"""
+
+import os
+import shlex
+import stat
+import subprocess
+import time
+from multiprocessing import Process
+from queue import Empty, Full
+
+import cv2
+import numpy as np
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.metrics import StageMetrics
+from hometeamproj.pipeline.queue_manager import FrameData
+from hometeamproj.pipeline.shared_frames import InlineFrameTransport
+
+
+class RawFrameSource:
+    """Fixed-size raw BGR frames from a byte stream (named pipe or ffmpeg stdout)."""
+
+    def __init__(self, stream, width: int, height: int, fps: float, process=None):
+        self.stream = stream
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.process = process
+        self.frame_bytes = width * height * 3
+
+    def read(self):
+        """Next frame, or None at end of stream."""
+        buf = bytearray(self.frame_bytes)
+        view = memoryview(buf)
+        filled = 0
+        while filled < self.frame_bytes:
+            n = self.stream.readinto(view[filled:])
+            if not n:
+                return None
+            filled += n
+        return np.frombuffer(buf, dtype=np.uint8).reshape(self.height, self.width, 3)
+
+    def release(self):
+        self.stream.close()
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+
+class GrowingFileSource:
+    """A video file still being written: re-opens and seeks when it runs dry."""
+
+    def __init__(self, path: str, poll_interval: float, idle_timeout: float):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.position = 0
+        self.cap = cv2.VideoCapture(path)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else 30.0
+
+    def read(self):
+        """Next frame, or None once the file has not grown for idle_timeout seconds."""
+        deadline = time.monotonic() + self.idle_timeout
+        while True:
+            ok, frame = self.cap.read()
+            if ok:
+                self.position += 1
+                return frame
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(self.poll_interval)
+            # The demuxer caches the old end of file: re-open and resume
+            self.cap.release()
+            self.cap = cv2.VideoCapture(self.path)
+            if self.position:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.position)
+
+    def release(self):
+        self.cap.release()
+
+
+def live_source_kind(source: str, config: PipelineConfig) -> str:
+    kind = str(config.live_source).lower()
+    if kind != "auto":
+        return kind
+    if "://" in source:
+        return "ffmpeg"
+    if os.path.exists(source) and stat.S_ISFIFO(os.stat(source).st_mode):
+        return "pipe"
+    return "file"
+
+
+def open_live_source(source: str, config: PipelineConfig):
+    """Open `source` as a RawFrameSource or GrowingFileSource per [live] settings."""
+    kind = live_source_kind(source, config)
+    width = int(config.live_width) or int(config.frame_resize_width)
+    height = int(config.live_height) or int(config.frame_resize_height)
+    fps = float(config.live_fps)
+
+    if kind == "pipe":
+        return RawFrameSource(open(source, "rb", buffering=0), width, height, fps)
+
+    if kind == "ffmpeg":
+        # Let ffmpeg scale and retime so the raw stream has a known frame size and rate
+        cmd = [
+            config.ffmpeg_bin, "-hide_banner", "-loglevel", "error", "-nostdin",
+            *shlex.split(config.ffmpeg_input_args), "-i", source,
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps:g}", "-",
+        ]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=0)
+        return RawFrameSource(process.stdout, width, height, fps, process=process)
+
+    if kind == "file":
+        return GrowingFileSource(source, float(config.live_poll_interval), float(config.live_idle_timeout))
+
+    raise ValueError(f"unknown live source '{kind}' (expected auto, pipe, ffmpeg or file)")
+
+
+class LiveFrameReaderProcess(Process):
+    """FrameReaderProcess for live sources: source-clock pacing and drop-oldest output."""
+
+    def __init__(self, source: str, output_queue, config: PipelineConfig, transport=None, metrics=None, controls=None):
+        super().__init__()
+        self.source = source
+        self.output_queue = output_queue
+        self.config = config
+        self.transport = transport or InlineFrameTransport()
+        self.metrics = metrics or StageMetrics("reader")
+        self.controls = controls  # PipelineControls when adaptive backpressure is on
+
+    def _target_fps(self) -> float:
+        if self.controls is not None:
+            return max(1.0, self.controls.target_fps)
+        return max(1.0, float(self.config.target_fps))
+
+    def _put_latest(self, frame_data: FrameData) -> bool:
+        """Queue frame_data; if the queue is full, evict the oldest queued frame first."""
+        for _ in range(3):
+            try:
+                self.metrics.put(self.output_queue, frame_data, timeout=0)
+                return True
+            except Full:
+                pass
+            try:
+                oldest = self.output_queue.evict_nowait()
+            except Empty:
+                continue  # The consumer just made room
+            if oldest is not None:
+                self.transport.release(oldest)
+            self.metrics.drop("oldest")
+        return False
+
+    def run(self):
+        print(f"LiveFrameReaderProcess: Opening live source {self.source}")
+        size = (int(self.config.frame_resize_width), int(self.config.frame_resize_height))
+        frame_id = 0
+        seq = 0  # Every kept frame, queued or not (pipeline/delivery.py)
+        emitted = 0
+        clock_start = None  # Wall-clock time of source timestamp 0
+        next_keep = 0.0
+
+        try:
+            source = open_live_source(self.source, self.config)
+        except (OSError, ValueError) as e:
+            print(f"LiveFrameReaderProcess: ERROR could not open live source: {e}")
+            self.output_queue.put(None)
+            return
+
+        print(f"LiveFrameReaderProcess: source fps {source.fps:g}, emitting at ~{self._target_fps():g} fps")
+        try:
+            while True:
+                frame = source.read()
+                if frame is None:
+                    break
+                arrived = time.time()
+                timestamp = frame_id / source.fps
+                frame_id += 1
+                self.metrics.frames_in += 1
+                if clock_start is None:
+                    clock_start = arrived
+
+                # Decimate on the source clock rather than by frame count
+                if timestamp < next_keep - 1e-6:
+                    continue
+                next_keep = max(next_keep, timestamp) + 1.0 / self._target_fps()
+
+                # Pace at the source clock: a backlog (e.g. a file written in bursts)
+                # is released in real time rather than all at once
+                delay = clock_start + timestamp - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+                with self.metrics.time("processing"):
+                    if (frame.shape[1], frame.shape[0]) != size:
+                        with self.metrics.timer("resize"):
+                            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+                try:
+                    payload, slot = self.transport.store(frame, timeout=1.0 / self._target_fps())
+                except Full:
+                    # Every slot is still held downstream: skip rather than fall behind.
+                    # The seq is still used up, so downstream counts the frame as missing
+                    self.metrics.drop("ring_full")
+                    seq += 1
+                    continue
+
+                frame_data = FrameData(
+                    frame_id=frame_id - 1, frame=payload, timestamp=timestamp, slot=slot, created_at=arrived, seq=seq
+                )
+                seq += 1
+                if self.controls is not None:
+                    self.controls.frame_id = frame_id - 1
+                if self._put_latest(frame_data):
+                    emitted += 1
+                else:
+                    self.transport.release(frame_data)
+                    self.metrics.drop("queue_full")
+                self.metrics.flush()
+
+        except KeyboardInterrupt:
+            print("LiveFrameReaderProcess: Interrupted")
+        finally:
+            source.release()
+            try:
+                self.output_queue.put(None)
+            except Exception:
+                pass
+            self.metrics.close()
+
+        print(f"LiveFrameReaderProcess: Finished, {emitted}/{frame_id} source frames emitted")
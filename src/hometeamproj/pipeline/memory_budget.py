@@ -0,0 +1,215 @@
+# pipeline/memory_budget.py
+"""
+Byte budgets for the inter-stage queues ([queues] max_mb / total_mb / policy).
+
+Queue maxsize only bounds item counts, so what a full queue costs depends on
+the frame size. MemoryBudget keeps, in shared memory, how many frame bytes
+each queue and the whole pipeline currently buffer, and BudgetedQueue wraps
+a multiprocessing.Queue so that put() charges an item's bytes and get()
+credits them back:
+
+- block: put() waits (up to its timeout) until the item fits both the queue's
+  and the pipeline's budget, then raises Full like a full queue would.
+- drop:  put() with a timeout raises Full at once when the item does not fit,
+  so the producer drops it (stages already count Full as a queue_full drop).
+  put() without a timeout (sentinels, chunks that must arrive) still waits.
+
+Bytes are measured on the items themselves (inline frames, or the shared
+memory slot an item refers to), so the budget holds at any resolution.
+An item is always admitted into an empty queue, so one frame larger than
+the budget cannot stall the pipeline, and items without frame data
+(sentinels, clip markers) are never held back.
+
+A BudgetedQueue can also carry a SequenceTracker (pipeline/delivery.py), so
+that get() returns each frame once and in order.
+"""
+
+import multiprocessing
+import time
+from collections import deque
+from queue import Empty, Full
+
+import numpy as np
+
+from hometeamproj.config import PipelineConfig
+
+
+MB = 1024 * 1024
+
+
+def item_nbytes(item, slot_nbytes: int = 0) -> int:
+    """Frame bytes an item keeps buffered: inline arrays, or its shared-memory slot."""
+    if item is None:
+        return 0
+    for attr in ("frames", "detections"):
+        batch = getattr(item, attr, None)
+        if isinstance(batch, list):
+            return sum(item_nbytes(i, slot_nbytes) for i in batch)
+
+    nbytes = 0
+    frame = getattr(item, "frame", None)
+    if isinstance(frame, np.ndarray):
+        nbytes += frame.nbytes
+    elif getattr(item, "slot", None) is not None:
+        nbytes += slot_nbytes
+    heatmap = getattr(item, "motion_heatmap", None)
+    if heatmap is not None:
+        nbytes += heatmap.energy.nbytes
+    return nbytes
+
+
+class MemoryBudget:
+    """Buffered bytes per queue and in total, shared between processes."""
+
+    def __init__(self, names: list, queue_bytes: int = 0, total_bytes: int = 0, policy: str = "block"):
+        self.names = list(names)
+        self.queue_bytes = max(0, int(queue_bytes))  # 0 = unbounded
+        self.total_bytes = max(0, int(total_bytes))
+        self.policy = str(policy).lower()
+        if self.policy not in ("block", "drop"):
+            print(f"MemoryBudget: unknown policy '{policy}', using block")
+            self.policy = "block"
+
+        n = len(self.names)
+        # [bytes per queue..., peak per queue..., total, total peak]
+        self._counters = multiprocessing.Array("q", 2 * n + 2)
+        self._changed = multiprocessing.Condition(self._counters.get_lock())
+
+    @classmethod
+    def from_config(cls, names: list, config: PipelineConfig) -> "MemoryBudget":
+        return cls(
+            names,
+            queue_bytes=float(getattr(config, "queue_max_mb", 0)) * MB,
+            total_bytes=float(getattr(config, "queue_total_mb", 0)) * MB,
+            policy=getattr(config, "queue_policy", "block"),
+        )
+
+    def _fits(self, index: int, nbytes: int) -> bool:
+        counts = self._counters.get_obj()
+        queued = counts[index]
+        total = counts[2 * len(self.names)]
+        if self.queue_bytes and queued and queued + nbytes > self.queue_bytes:
+            return False
+        if self.total_bytes and total and total + nbytes > self.total_bytes:
+            return False
+        return True
+
+    def acquire(self, index: int, nbytes: int, block: bool = True, timeout=None):
+        """Charge nbytes to queue `index`, waiting for room as the policy allows. Raises Full."""
+        if nbytes <= 0:
+            return
+        n = len(self.names)
+        wait = block and (self.policy == "block" or timeout is None)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while not self._fits(index, nbytes):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not wait or (remaining is not None and remaining <= 0):
+                    raise Full
+                self._changed.wait(remaining)
+            counts = self._counters.get_obj()
+            counts[index] += nbytes
+            counts[n + index] = max(counts[n + index], counts[index])
+            counts[2 * n] += nbytes
+            counts[2 * n + 1] = max(counts[2 * n + 1], counts[2 * n])
+
+    def release(self, index: int, nbytes: int):
+        if nbytes <= 0:
+            return
+        with self._changed:
+            counts = self._counters.get_obj()
+            counts[index] -= nbytes
+            counts[2 * len(self.names)] -= nbytes
+            self._changed.notify_all()
+
+    def buffered(self) -> dict:
+        """{queue: (bytes now, peak bytes)}, plus "total"."""
+        n = len(self.names)
+        with self._changed:
+            counts = list(self._counters.get_obj())
+        usage = {name: (counts[i], counts[n + i]) for i, name in enumerate(self.names)}
+        usage["total"] = (counts[2 * n], counts[2 * n + 1])
+        return usage
+
+    @staticmethod
+    def summary(usage: dict) -> str:
+        """One line of peak buffered MB per queue, from buffered()."""
+        peaks = ", ".join(f"{name} {peak / MB:.1f} MB" for name, (_, peak) in usage.items())
+        return f"MemoryBudget: peak buffered {peaks}"
+
+
+class BudgetedQueue:
+    """multiprocessing.Queue whose put()/get() are charged against a MemoryBudget."""
+
+    def __init__(self, name: str, budget: MemoryBudget, maxsize: int = 0, slot_nbytes: int = 0, delivery=None):
+        self.name = name
+        self.budget = budget
+        self.index = budget.names.index(name)
+        self.slot_nbytes = int(slot_nbytes)
+        self._queue = multiprocessing.Queue(maxsize=maxsize)
+        # Consumer side: SequenceTracker, and the items it has released but get() not yet returned
+        self.delivery = delivery
+        self._ready = deque()
+
+    def put(self, item, block: bool = True, timeout=None):
+        nbytes = item_nbytes(item, self.slot_nbytes)
+        start = time.monotonic()
+        self.budget.acquire(self.index, nbytes, block=block, timeout=timeout)
+        if timeout is not None:
+            timeout = max(0.0, timeout - (time.monotonic() - start))
+        try:
+            self._queue.put(item, block, timeout)
+        except BaseException:
+            self.budget.release(self.index, nbytes)
+            raise
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block: bool = True, timeout=None):
+        if self.delivery is None:
+            item = self._queue.get(block, timeout)
+            self.budget.release(self.index, item_nbytes(item, self.slot_nbytes))
+            return item
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._ready:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(block, remaining)
+            except Empty:
+                # The producer has stalled: stop waiting for frames that went missing
+                self._ready.extend(self.delivery.flush())
+                if not self._ready:
+                    raise
+                break
+            self.budget.release(self.index, item_nbytes(item, self.slot_nbytes))
+            self._ready.extend(self.delivery.accept(item))
+        return self._ready.popleft()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def evict_nowait(self):
+        """Producer side: take back the oldest queued item, bypassing the SequenceTracker. Raises Empty."""
+        item = self._queue.get_nowait()
+        self.budget.release(self.index, item_nbytes(item, self.slot_nbytes))
+        return item
+
+    def qsize(self) -> int:
+        return self._queue.qsize() + len(self._ready)
+
+    def empty(self) -> bool:
+        return not self._ready and self._queue.empty()
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def close(self):
+        self._queue.close()
+
+    def join_thread(self):
+        self._queue.join_thread()
+
+    def cancel_join_thread(self):
+        self._queue.cancel_join_thread()
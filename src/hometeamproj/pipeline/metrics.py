@@ -0,0 +1,463 @@
+# pipeline/metrics.py
+"""
+Pipeline metrics.
+
+Every stage process owns a StageMetrics that counts frames in/out and drops
+and keeps latency histograms (processing time, time blocked on get/put).
+Snapshots are shipped over a multiprocessing queue to the MetricsCollector
+in the parent, which also samples queue depths and buffered bytes from
+QueueManager and
+exposes everything in Prometheus text format (file and/or HTTP), plus a
+summary at shutdown.
+
+Stages also wrap their hot calls (resize, blur, absdiff, findContours,
+imwrite, ...) in StageMetrics.timer(). Those fine-grained timers cost
+nothing until enable_fine_timers() is called in the process, which
+ProfiledProcess does when profiling is on.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Full
+
+import multiprocessing
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.queue_manager import ClipMarker
+
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+# Per process: whether StageMetrics.timer() records anything
+_fine_timers = False
+_NO_TIMER = nullcontext()
+
+
+def enable_fine_timers(enabled: bool = True):
+    """Turn StageMetrics.timer() on (or off) for every stage in this process."""
+    global _fine_timers
+    _fine_timers = bool(enabled)
+
+
+def fine_timers_enabled() -> bool:
+    return _fine_timers
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus style)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += seconds
+        self.count += 1
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.count += other.count
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-th quantile (None if empty)."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> dict:
+        return {"buckets": list(self.buckets), "counts": list(self.counts), "total": self.total, "count": self.count}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Histogram":
+        h = cls(data["buckets"])
+        h.counts = list(data["counts"])
+        h.total = data["total"]
+        h.count = data["count"]
+        return h
+
+
+def _frame_count(item) -> int:
+    """Frames carried by a queue item (batches from the detector pool carry several)."""
+    if item is None or isinstance(item, ClipMarker):
+        return 0
+    for attr in ("frames", "detections"):
+        batch = getattr(item, attr, None)
+        if isinstance(batch, list):
+            return len(batch)
+    return 1
+
+
+class StageMetrics:
+    """Counters and histograms for one stage process."""
+
+    def __init__(self, stage: str, sink=None, interval: float = 1.0):
+        self.stage = stage
+        self.sink = sink
+        self.interval = interval
+
+        self.frames_in = 0
+        self.frames_out = 0
+        self.drops = defaultdict(int)
+        self.histograms = defaultdict(Histogram)
+        self.gauges = {}
+        self._last_flush = 0.0
+        self._lock = threading.Lock()  # the writer's encoder threads observe too
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["drops"] = dict(self.drops)
+        state["histograms"] = {}
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.drops = defaultdict(int, self.drops)
+        self.histograms = defaultdict(Histogram)
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            self.histograms[name].observe(seconds)
+
+    @contextmanager
+    def time(self, name: str = "processing"):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timer(self, name: str):
+        """time(name) around one hot call, or a no-op unless fine timers are enabled."""
+        if not _fine_timers:
+            return _NO_TIMER
+        return self.time(name)
+
+    def get(self, q, timeout=None):
+        """q.get(timeout=...) that records time blocked and frames in. Raises Empty."""
+        start = time.perf_counter()
+        try:
+            item = q.get(timeout=timeout)
+        finally:
+            self.observe("get_blocked", time.perf_counter() - start)
+        self.frames_in += _frame_count(item)
+        delivery = getattr(q, "delivery", None)
+        if delivery is not None:
+            # Frames the queue's SequenceTracker dropped or never saw
+            if delivery.duplicates:
+                self.drops["duplicate"] = delivery.duplicates
+            if delivery.missing:
+                self.drops["missing"] = delivery.missing
+        self.flush()
+        return item
+
+    def put(self, q, item, timeout=None):
+        """q.put(item, timeout=...) that records time blocked and frames out. Raises Full."""
+        start = time.perf_counter()
+        try:
+            if timeout is None:
+                q.put(item)
+            else:
+                q.put(item, timeout=timeout)
+        finally:
+            self.observe("put_blocked", time.perf_counter() - start)
+        self.frames_out += _frame_count(item)
+
+    def drop(self, reason: str = "queue_full", count: int = 1):
+        self.drops[reason] += count
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {name: h.to_dict() for name, h in self.histograms.items()}
+        return {
+            "stage": self.stage,
+            "pid": os.getpid(),
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "drops": dict(self.drops),
+            "histograms": histograms,
+            "gauges": dict(self.gauges),
+        }
+
+    def flush(self, force: bool = False):
+        if self.sink is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.interval:
+            return
+        self._last_flush = now
+        try:
+            self.sink.put_nowait(self.snapshot())
+        except Full:
+            pass
+
+    def close(self):
+        self.flush(force=True)
+
+
+def stage_metrics(collector, stage: str) -> StageMetrics:
+    """StageMetrics wired to collector, or a local-only one when metrics are off."""
+    if collector is None:
+        return StageMetrics(stage)
+    return collector.stage(stage)
+
+
+class MetricsCollector:
+    """Aggregates StageMetrics snapshots and queue depths in the parent process."""
+
+    def __init__(self, config: PipelineConfig, queues=None, output_dir: str = ".", export: bool = True):
+        """export=False collects for listeners only: no file, HTTP endpoint or summary."""
+        self.config = config
+        self.queues = queues
+        self.interval = float(getattr(config, "metrics_interval", 1.0))
+        self.sink = multiprocessing.Queue(maxsize=10000)
+
+        path = getattr(config, "metrics_file", "") or "metrics.prom"
+        self.path = path if os.path.isabs(path) else os.path.join(output_dir, path)
+        self.http_port = int(getattr(config, "metrics_http_port", 0))
+        if not export:
+            self.path = ""
+            self.http_port = 0
+        self.export = export
+
+        self._snapshots = {}  # (stage, pid) -> latest snapshot
+        self._queue_depth = {}
+        self._queue_depth_max = defaultdict(int)
+        self._queue_bytes = {}  # queue -> (bytes now, peak bytes)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+        self._listeners = []
+
+    def stage(self, name: str) -> StageMetrics:
+        return StageMetrics(name, sink=self.sink, interval=self.interval)
+
+    def add_listener(self, callback):
+        """callback(collector) runs on the collector thread after every sample."""
+        self._listeners.append(callback)
+
+    # --- collection -------------------------------------------------------
+
+    def _drain(self):
+        while True:
+            try:
+                snap = self.sink.get_nowait()
+            except Empty:
+                return
+            with self._lock:
+                self._snapshots[(snap["stage"], snap["pid"])] = snap
+
+    def _sample_queues(self):
+        if self.queues is None:
+            return
+        depths = self.queues.depths()
+        buffered = self.queues.buffered_bytes()
+        with self._lock:
+            self._queue_bytes.update(buffered)
+            for name, depth in depths.items():
+                if depth is None:
+                    continue
+                self._queue_depth[name] = depth
+                self._queue_depth_max[name] = max(self._queue_depth_max[name], depth)
+
+    def _loop(self):
+        next_write = 0.0
+        while not self._stop.wait(min(0.25, self.interval)):
+            self._drain()
+            self._sample_queues()
+            for callback in self._listeners:
+                callback(self)
+            if time.monotonic() >= next_write:
+                self.write_file()
+                next_write = time.monotonic() + self.interval
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="metrics", daemon=True)
+        self._thread.start()
+        if self.http_port:
+            self._start_http()
+
+    def stop(self, summary: bool = True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._drain()
+        self._sample_queues()
+        self.write_file()
+        if self._server is not None:
+            self._server.shutdown()
+        if summary and self.export:
+            print(self.summary())
+
+    # --- aggregation ------------------------------------------------------
+
+    def stages(self) -> dict:
+        """Per-stage totals summed over all processes of that stage."""
+        with self._lock:
+            snapshots = list(self._snapshots.values())
+
+        stages = {}
+        for snap in snapshots:
+            agg = stages.setdefault(
+                snap["stage"],
+                {"frames_in": 0, "frames_out": 0, "drops": defaultdict(int), "histograms": {}, "gauges": {}, "processes": 0},
+            )
+            agg["processes"] += 1
+            agg["frames_in"] += snap["frames_in"]
+            agg["frames_out"] += snap["frames_out"]
+            for reason, n in snap["drops"].items():
+                agg["drops"][reason] += n
+            for name, data in snap["histograms"].items():
+                h = Histogram.from_dict(data)
+                if name in agg["histograms"]:
+                    agg["histograms"][name].merge(h)
+                else:
+                    agg["histograms"][name] = h
+            for name, value in snap["gauges"].items():
+                agg["gauges"][name] = agg["gauges"].get(name, 0) + value
+        return stages
+
+    def queue_depths(self) -> dict:
+        with self._lock:
+            return {name: (depth, self._queue_depth_max[name]) for name, depth in self._queue_depth.items()}
+
+    def queue_bytes(self) -> dict:
+        """{queue: (frame bytes buffered, peak)} from the memory budget, plus "total"."""
+        with self._lock:
+            return dict(self._queue_bytes)
+
+    # --- exposition -------------------------------------------------------
+
+    def render_prometheus(self) -> str:
+        lines = []
+        stages = self.stages()
+
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        metric("hometeam_frames_in_total", "counter", "Items received by the stage")
+        for stage, agg in stages.items():
+            lines.append(f'hometeam_frames_in_total{{stage="{stage}"}} {agg["frames_in"]}')
+        metric("hometeam_frames_out_total", "counter", "Items emitted by the stage")
+        for stage, agg in stages.items():
+            lines.append(f'hometeam_frames_out_total{{stage="{stage}"}} {agg["frames_out"]}')
+        metric("hometeam_drops_total", "counter", "Frames dropped by the stage")
+        for stage, agg in stages.items():
+            for reason, n in agg["drops"].items():
+                lines.append(f'hometeam_drops_total{{stage="{stage}",reason="{reason}"}} {n}')
+
+        metric("hometeam_stage_seconds", "histogram", "Per-frame stage timings (processing, get_blocked, put_blocked, ...)")
+        for stage, agg in stages.items():
+            for op, h in agg["histograms"].items():
+                labels = f'stage="{stage}",op="{op}"'
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f'hometeam_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'hometeam_stage_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"hometeam_stage_seconds_sum{{{labels}}} {h.total:.6f}")
+                lines.append(f"hometeam_stage_seconds_count{{{labels}}} {h.count}")
+
+        metric("hometeam_stage_gauge", "gauge", "Stage-specific gauges")
+        for stage, agg in stages.items():
+            for name, value in agg["gauges"].items():
+                lines.append(f'hometeam_stage_gauge{{stage="{stage}",name="{name}"}} {value}')
+
+        depths = self.queue_depths()
+        metric("hometeam_queue_depth", "gauge", "Sampled queue depth (items)")
+        for name, (depth, _) in depths.items():
+            lines.append(f'hometeam_queue_depth{{queue="{name}"}} {depth}')
+        metric("hometeam_queue_depth_max", "gauge", "Highest sampled queue depth (items)")
+        for name, (_, peak) in depths.items():
+            lines.append(f'hometeam_queue_depth_max{{queue="{name}"}} {peak}')
+
+        buffered = self.queue_bytes()
+        metric("hometeam_queue_bytes", "gauge", "Frame bytes buffered in the queue (total = all queues)")
+        for name, (now, _) in buffered.items():
+            lines.append(f'hometeam_queue_bytes{{queue="{name}"}} {now}')
+        metric("hometeam_queue_bytes_max", "gauge", "Peak frame bytes buffered in the queue")
+        for name, (_, peak) in buffered.items():
+            lines.append(f'hometeam_queue_bytes_max{{queue="{name}"}} {peak}')
+
+        return "\n".join(lines) + "\n"
+
+    def write_file(self):
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"MetricsCollector: could not write {self.path}: {e}")
+
+    def _start_http(self):
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = collector.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("0.0.0.0", self.http_port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"MetricsCollector: serving metrics on :{self.http_port}/metrics")
+
+    def summary(self) -> str:
+        def ms(value):
+            return "-" if value is None else f"{value * 1000:.0f}"
+
+        lines = ["Pipeline metrics summary:"]
+        lines.append(f"  {'stage':<20}{'in':>8}{'out':>8}{'drops':>8}{'p50ms':>8}{'p99ms':>8}{'get s':>9}{'put s':>9}")
+        for stage, agg in self.stages().items():
+            processing = agg["histograms"].get("processing", Histogram())
+            get_blocked = agg["histograms"].get("get_blocked", Histogram())
+            put_blocked = agg["histograms"].get("put_blocked", Histogram())
+            lines.append(
+                f"  {stage:<20}{agg['frames_in']:>8}{agg['frames_out']:>8}{sum(agg['drops'].values()):>8}"
+                f"{ms(processing.quantile(0.5)):>8}{ms(processing.quantile(0.99)):>8}"
+                f"{get_blocked.total:>9.2f}{put_blocked.total:>9.2f}"
+            )
+        buffered = self.queue_bytes()
+        for name, (_, peak) in self.queue_depths().items():
+            line = f"  queue {name}: max depth {peak}"
+            if name in buffered:
+                line += f", peak {buffered[name][1] / (1024 * 1024):.1f} MB"
+            lines.append(line)
+        if "total" in buffered:
+            lines.append(f"  all queues: peak {buffered['total'][1] / (1024 * 1024):.1f} MB")
+        return "\n".join(lines)
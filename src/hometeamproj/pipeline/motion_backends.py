@@ -0,0 +1,197 @@
+# pipeline/motion_backends.py
+"""
+Motion detection backends for DetectionProcess.
+
+A backend turns two preprocessed (grayscale, blurred) frames into motion
+boxes in full-frame coordinates, optionally with a coarse motion heatmap.
+Picked by [detection] backend:
+
+- contours: threshold + dilate the frame difference, then findContours and
+  one bounding box per contour (original behaviour). Cost grows with the
+  number of contours, i.e. with scene clutter.
+- blocks:   count changed pixels per block of a coarse grid with NumPy block
+  sums and merge adjacent active blocks into boxes. Cost depends only on
+  the frame and block size.
+
+motion_vectors reads the codec's motion vectors instead of differencing
+frames; it replaces the reader and detector, so it lives in
+pipeline/motion_vectors.py and is not a MotionBackend.
+"""
+
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.buffer_pool import BufferPool
+from hometeamproj.pipeline.metrics import StageMetrics
+from hometeamproj.pipeline.queue_manager import MotionHeatmap
+
+
+class MotionBackend:
+    """Base class: scale handling shared by every backend."""
+
+    name = ""
+
+    def __init__(self, config: PipelineConfig, pool: Optional[BufferPool] = None, metrics: Optional[StageMetrics] = None):
+        self.config = config
+        self.pool = pool or BufferPool(enabled=False)
+        self.metrics = metrics or StageMetrics("detector")  # fine timers (absdiff, findContours, ...)
+
+    def detect(self, prev_blur, blur, frame_shape=None) -> tuple:
+        """
+        (boxes, heatmap) for the motion between two blurred frames. Boxes are
+        (x, y, w, h) in full-frame coordinates when frame_shape is given;
+        heatmap is a MotionHeatmap or None.
+        """
+        proxy_h, proxy_w = blur.shape[:2]
+        if prev_blur.shape != blur.shape:
+            # detection_scale changed between the two frames
+            prev_blur = cv2.resize(prev_blur, (proxy_w, proxy_h), interpolation=cv2.INTER_AREA)
+        if frame_shape is None:
+            frame_h, frame_w = proxy_h, proxy_w
+        else:
+            frame_h, frame_w = frame_shape[:2]
+        return self._detect(prev_blur, blur, frame_w / proxy_w, frame_h / proxy_h, frame_w, frame_h)
+
+    def _detect(self, prev_blur, blur, sx: float, sy: float, frame_w: int, frame_h: int) -> tuple:
+        raise NotImplementedError
+
+
+class ContourMotionBackend(MotionBackend):
+    """Thresholded difference -> dilate -> findContours -> bounding boxes."""
+
+    name = "contours"
+
+    # Tuned for full-resolution frames; rescaled with detection_scale
+    DILATE_ITERATIONS = 2
+
+    def _detect(self, prev_blur, blur, sx, sy, frame_w, frame_h):
+        timer = self.metrics.timer
+        with timer("absdiff"):
+            frame_delta = cv2.absdiff(prev_blur, blur, dst=self.pool.scratch("delta", blur.shape))
+
+        with timer("threshold"):
+            thresh = cv2.threshold(
+                frame_delta, self.config.detection_threshold, 255, cv2.THRESH_BINARY, dst=frame_delta
+            )[1]
+        iterations = max(1, int(round(self.DILATE_ITERATIONS / max(sx, sy))))
+        with timer("dilate"):
+            thresh = cv2.dilate(thresh, None, dst=self.pool.scratch("mask", blur.shape), iterations=iterations)
+
+        with timer("find_contours"):
+            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        # min_motion_area is given in full-frame pixels
+        min_area = self.config.min_motion_area / (sx * sy)
+
+        boxes = []
+        for c in contours:
+            if cv2.contourArea(c) < min_area:
+                continue
+            x, y, w, h = cv2.boundingRect(c)
+            if sx != 1.0 or sy != 1.0:
+                x1 = int(x * sx)
+                y1 = int(y * sy)
+                x2 = min(frame_w, int(round((x + w) * sx)))
+                y2 = min(frame_h, int(round((y + h) * sy)))
+                x, y, w, h = x1, y1, x2 - x1, y2 - y1
+            boxes.append((x, y, w, h))
+        return boxes, None
+
+
+class BlockMotionBackend(MotionBackend):
+    """
+    Motion energy on a coarse block grid.
+
+    The thresholded difference is summed per block (a reshape + sum, i.e. a
+    block-strided integral image), blocks whose changed fraction reaches
+    block_min_fill are active, and 8-connected groups of active blocks are
+    merged into one box each. Groups with less than min_motion_area changed
+    pixels are discarded, as contours are in the contours backend.
+    """
+
+    name = "blocks"
+
+    def _grid(self, blur, sx: float, sy: float) -> tuple:
+        """Block size in proxy pixels and the grid shape covering the proxy."""
+        h, w = blur.shape[:2]
+        block = max(1, int(round(int(self.config.block_size) / max(sx, sy))))
+        return block, -(-h // block), -(-w // block)
+
+    def block_counts(self, prev_blur, blur, block: int, rows: int, cols: int) -> np.ndarray:
+        """Changed pixels per block, shape (rows, cols)."""
+        h, w = blur.shape[:2]
+        # |a - b| in uint8 without widening: max - min cannot underflow
+        delta = np.maximum(prev_blur, blur, out=self.pool.scratch("delta", blur.shape))
+        delta -= np.minimum(prev_blur, blur, out=self.pool.scratch("delta_min", blur.shape))
+        # The pooled buffer is reused while the padded grid shape stays the
+        # same, so padding past the frame edge may hold a larger frame's mask
+        changed = self.pool.scratch("changed", (rows * block, cols * block))
+        np.greater(delta, self.config.detection_threshold, out=changed[:h, :w].view(bool))
+        changed[h:, :] = 0
+        changed[:h, w:] = 0
+        # Sum block rows first (contiguous), then block columns
+        per_row = changed.reshape(rows, block, cols * block).sum(
+            axis=1, dtype=np.int32, out=self.pool.scratch("row_sums", (rows, cols * block), np.int32)
+        )
+        return per_row.reshape(rows, cols, block).sum(axis=2, out=self.pool.scratch("block_sums", (rows, cols), np.int32))
+
+    def _detect(self, prev_blur, blur, sx, sy, frame_w, frame_h):
+        h, w = blur.shape[:2]
+        block, rows, cols = self._grid(blur, sx, sy)
+        with self.metrics.timer("block_counts"):
+            counts = self.block_counts(prev_blur, blur, block, rows, cols)
+
+        # Edge blocks are partial: compare against their real pixel count
+        row_px = np.minimum(block, h - np.arange(rows) * block)
+        col_px = np.minimum(block, w - np.arange(cols) * block)
+        active = counts >= np.maximum(1.0, float(self.config.block_min_fill) * np.outer(row_px, col_px))
+
+        with self.metrics.timer("components"):
+            n, labels, stats, _ = cv2.connectedComponentsWithStats(active.astype(np.uint8), connectivity=8)
+        # Changed pixels per group, in full-frame pixels
+        area = np.bincount(labels.ravel(), weights=counts.ravel(), minlength=n) * (sx * sy)
+        keep = area >= self.config.min_motion_area
+        keep[0] = False  # Label 0 is the inactive background
+
+        x1 = stats[keep, cv2.CC_STAT_LEFT] * block
+        y1 = stats[keep, cv2.CC_STAT_TOP] * block
+        x2 = np.minimum(w, x1 + stats[keep, cv2.CC_STAT_WIDTH] * block)
+        y2 = np.minimum(h, y1 + stats[keep, cv2.CC_STAT_HEIGHT] * block)
+        x1 = (x1 * sx).astype(np.int64)
+        y1 = (y1 * sy).astype(np.int64)
+        x2 = np.minimum(frame_w, np.rint(x2 * sx)).astype(np.int64)
+        y2 = np.minimum(frame_h, np.rint(y2 * sy)).astype(np.int64)
+        boxes = [tuple(b) for b in np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).tolist()]
+
+        heatmap = None
+        if self.config.detection_heatmap:
+            energy = np.where(keep[labels], counts * (sx * sy), 0.0).astype(np.float32)
+            heatmap = MotionHeatmap(energy=energy, cell_width=block * sx, cell_height=block * sy)
+        return boxes, heatmap
+
+
+MOTION_BACKENDS = {
+    ContourMotionBackend.name: ContourMotionBackend,
+    BlockMotionBackend.name: BlockMotionBackend,
+}
+
+
+def create_motion_backend(
+    config: PipelineConfig,
+    name: Optional[str] = None,
+    pool: Optional[BufferPool] = None,
+    metrics: Optional[StageMetrics] = None,
+) -> MotionBackend:
+    """The backend named by [detection] backend (or `name`); unknown names fall back to contours."""
+    name = str(name or getattr(config, "detection_backend", "contours")).lower()
+    backend = MOTION_BACKENDS.get(name)
+    if name == "motion_vectors":
+        print("create_motion_backend: motion_vectors needs offline mode and PyAV, using contours")
+        backend = ContourMotionBackend
+    elif backend is None:
+        print(f"create_motion_backend: unknown detection backend '{name}', using contours")
+        backend = ContourMotionBackend
+    return backend(config, pool=pool, metrics=metrics)
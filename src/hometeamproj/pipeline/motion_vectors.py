@@ -0,0 +1,224 @@
+# pipeline/motion_vectors.py
+"""
+Codec motion-vector detection ([detection] backend = motion_vectors).
+
+Inter-coded frames already carry the encoder's motion estimate: one vector
+per macroblock (or partition) saying where its pixels came from. With the
+decoder's export_mvs flag, FFmpeg attaches those vectors to every decoded
+frame, so motion can be read straight off the bitstream instead of
+converting, resizing, blurring and differencing pixels.
+
+MotionVectorDetectionProcess replaces the reader and detector of a
+detection-only pass (offline mode): it decodes the clip with PyAV, never
+turns a frame into an array, and emits DetectionData with frame=None on the
+same frame_ids and timestamps FrameReaderProcess would use.
+
+Per decoded frame, every vector at least mv_min_magnitude pixels long adds
+its block's area to the block_size grid cell under it (output-frame
+coordinates). The grid is accumulated over the frames skipped between two
+kept frames, so decimation does not lose motion. A cell is active when its
+average moving area reaches block_min_fill of the cell; 8-connected active
+cells become one box each, and groups under min_motion_area are dropped, as
+in the blocks backend. Intra frames carry no vectors: when nothing but
+intra frames was decoded since the last kept frame, its boxes are reused.
+
+PyAV (`pip install av`) is optional and only imported by the process; it
+bundles its own FFmpeg libraries. Without it the offline pass falls back to
+pixel differencing with the contours backend.
+"""
+
+import importlib.util
+import time
+from multiprocessing import Process
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.metrics import StageMetrics
+from hometeamproj.pipeline.queue_manager import DetectionData, MotionHeatmap
+
+
+BACKEND_NAME = "motion_vectors"
+
+
+def motion_vectors_available() -> bool:
+    return importlib.util.find_spec("av") is not None
+
+
+def use_motion_vectors(config: PipelineConfig) -> bool:
+    """True when [detection] backend asks for codec motion vectors and PyAV is installed."""
+    if str(getattr(config, "detection_backend", "")).lower() != BACKEND_NAME:
+        return False
+    if not motion_vectors_available():
+        print("use_motion_vectors: PyAV is not installed (pip install av), using pixel differencing")
+        return False
+    return True
+
+
+class MotionVectorGrid:
+    """Moving area per grid cell, accumulated from one or more frames' motion vectors."""
+
+    def __init__(self, config: PipelineConfig, frame_w: int, frame_h: int, source_w: int, source_h: int):
+        self.config = config
+        self.frame_w, self.frame_h = frame_w, frame_h
+        self.sx, self.sy = frame_w / source_w, frame_h / source_h
+        self.block = max(1, int(config.block_size))
+        self.rows = -(-frame_h // self.block)
+        self.cols = -(-frame_w // self.block)
+        self.min_magnitude = float(getattr(config, "mv_min_magnitude", 1.0))
+        self.area = np.zeros(self.rows * self.cols, dtype=np.float64)
+        self.frames = 0  # inter frames accumulated
+
+    def reset(self):
+        self.area[:] = 0.0
+        self.frames = 0
+
+    def add(self, vectors: Optional[np.ndarray]):
+        """Accumulate one inter frame's vectors (PyAV MotionVectors.to_ndarray())."""
+        self.frames += 1
+        if vectors is None or len(vectors) == 0:
+            return
+        scale = np.maximum(vectors["motion_scale"], 1).astype(np.float64)
+        dx = vectors["motion_x"] / scale * self.sx
+        dy = vectors["motion_y"] / scale * self.sy
+        moving = np.hypot(dx, dy) >= self.min_magnitude
+        if not moving.any():
+            return
+        v = vectors[moving]
+        # dst_x/dst_y is the block's centre in the current frame
+        col = np.clip((v["dst_x"] * self.sx).astype(np.int64) // self.block, 0, self.cols - 1)
+        row = np.clip((v["dst_y"] * self.sy).astype(np.int64) // self.block, 0, self.rows - 1)
+        area = v["w"].astype(np.float64) * v["h"] * (self.sx * self.sy)
+        self.area += np.bincount(row * self.cols + col, weights=area, minlength=self.rows * self.cols)
+
+    def detect(self) -> tuple:
+        """(boxes, heatmap) for the accumulated motion, in output-frame pixels."""
+        block, rows, cols = self.block, self.rows, self.cols
+        energy = (self.area / max(1, self.frames)).reshape(rows, cols)
+
+        # Edge cells are partial: compare against their real pixel count
+        row_px = np.minimum(block, self.frame_h - np.arange(rows) * block)
+        col_px = np.minimum(block, self.frame_w - np.arange(cols) * block)
+        active = energy >= np.maximum(1.0, float(self.config.block_min_fill) * np.outer(row_px, col_px))
+
+        n, labels, stats, _ = cv2.connectedComponentsWithStats(active.astype(np.uint8), connectivity=8)
+        area = np.bincount(labels.ravel(), weights=energy.ravel(), minlength=n)
+        keep = area >= self.config.min_motion_area
+        keep[0] = False  # Label 0 is the inactive background
+
+        x1 = stats[keep, cv2.CC_STAT_LEFT] * block
+        y1 = stats[keep, cv2.CC_STAT_TOP] * block
+        x2 = np.minimum(self.frame_w, x1 + stats[keep, cv2.CC_STAT_WIDTH] * block)
+        y2 = np.minimum(self.frame_h, y1 + stats[keep, cv2.CC_STAT_HEIGHT] * block)
+        boxes = [tuple(b) for b in np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).tolist()]
+
+        heatmap = None
+        if self.config.detection_heatmap:
+            heatmap = MotionHeatmap(
+                energy=np.where(keep[labels], energy, 0.0).astype(np.float32), cell_width=block, cell_height=block
+            )
+        return boxes, heatmap
+
+
+class MotionVectorDetectionProcess(Process):
+    """Decodes a clip with motion-vector export and emits DetectionData without touching pixels."""
+
+    def __init__(self, input_video, output_queue, config: PipelineConfig, metrics=None):
+        super().__init__()
+        self.input_video = input_video
+        self.output_queue = output_queue
+        self.config = config
+        self.metrics = metrics or StageMetrics("detector")
+
+    def detect_clip(self, video_path: str) -> Optional[dict]:
+        import av
+
+        try:
+            container = av.open(video_path)
+        except (av.FFmpegError, OSError) as e:
+            print(f"MotionVectorDetectionProcess: ERROR could not open video: {video_path}: {e}")
+            return None
+
+        emitted = 0
+        frame_id = 0
+        seq = 0
+        start_time = time.time()
+        try:
+            stream = container.streams.video[0]
+            stream.codec_context.options = {"flags2": "+export_mvs"}
+            stream.thread_type = "AUTO"
+
+            video_fps = float(stream.average_rate or 0) or 30.0
+            skip_interval = max(1, int(video_fps / max(1, int(self.config.target_fps))))
+            print(f"MotionVectorDetectionProcess: skip_interval={skip_interval}, codec={stream.codec_context.name}")
+
+            grid = MotionVectorGrid(
+                self.config,
+                int(self.config.frame_resize_width),
+                int(self.config.frame_resize_height),
+                stream.codec_context.width,
+                stream.codec_context.height,
+            )
+            boxes, heatmap = [], None
+
+            for frame in container.decode(stream):
+                self.metrics.frames_in += 1
+                with self.metrics.time("processing"):
+                    vectors = frame.side_data.get("MOTION_VECTORS")
+                    if vectors is not None:
+                        grid.add(vectors.to_ndarray())
+                    elif not frame.key_frame:
+                        grid.add(None)  # Inter frame without vectors: every block stayed put
+
+                    if frame_id % skip_interval == 0:
+                        # Only intra frames since the last kept frame: keep its boxes
+                        if grid.frames:
+                            boxes, heatmap = grid.detect()
+                        grid.reset()
+                        detection = DetectionData(
+                            frame_id=frame_id,
+                            frame=None,
+                            motion_boxes=boxes,
+                            timestamp=frame_id / video_fps,
+                            created_at=time.time(),
+                            motion_heatmap=heatmap,
+                            seq=seq,
+                        )
+                        seq += 1
+                    else:
+                        detection = None
+
+                if detection is not None:
+                    # Detection-only pass: no real-time constraint, so block rather than drop
+                    self.metrics.put(self.output_queue, detection)
+                    emitted += 1
+                    self.metrics.flush()
+                frame_id += 1
+        except av.FFmpegError as e:
+            print(f"MotionVectorDetectionProcess: decode error after frame {frame_id}: {e}")
+        finally:
+            container.close()
+
+        elapsed = time.time() - start_time
+        if elapsed > 0:
+            print(
+                f"MotionVectorDetectionProcess: {emitted} detections from {frame_id} frames "
+                f"in {elapsed:.2f}s ({frame_id / elapsed:.1f} source FPS)"
+            )
+        return {"source_frames": frame_id, "emitted_frames": emitted}
+
+    def run(self):
+        print("MotionVectorDetectionProcess: Starting motion-vector detection")
+        try:
+            self.detect_clip(self.input_video)
+        except KeyboardInterrupt:
+            print("MotionVectorDetectionProcess: Interrupted")
+        finally:
+            try:
+                self.output_queue.put(None)
+            except Exception:
+                pass
+            self.metrics.close()
+            print("MotionVectorDetectionProcess: Finished")
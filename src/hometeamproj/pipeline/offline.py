@@ -0,0 +1,319 @@
+# pipeline/offline.py
+"""
+Offline (non-causal) processing for recorded clips.
+
+1. Detection pass: FrameReaderProcess -> detection stage, collecting every
+   frame's motion boxes in the parent process. With [detection] backend =
+   motion_vectors, MotionVectorDetectionProcess reads the codec's motion
+   vectors instead and no frame is converted or differenced.
+2. Trajectory: the whole viewport path is computed in one vectorized NumPy
+   pass. It follows ViewportCalculatorProcess semantics (area-weighted ROI,
+   TRACKING/STEADY hysteresis, clamping) but smooths with a zero-phase
+   filter, so the camera does not lag behind the action.
+3. Render pass: FrameReaderProcess -> TrajectoryRenderProcess ->
+   OutputWriterProcess.
+"""
+
+import os
+from multiprocessing import Process
+from queue import Empty
+
+import numpy as np
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.detection_cache import DetectionCache, frames_lost
+from hometeamproj.pipeline.detector_pool import create_detection_stage
+from hometeamproj.pipeline.frame_reader import FrameReaderProcess
+from hometeamproj.pipeline.metrics import MetricsCollector, StageMetrics, stage_metrics
+from hometeamproj.pipeline.motion_vectors import MotionVectorDetectionProcess, use_motion_vectors
+from hometeamproj.pipeline.output_writer import OutputWriterProcess
+from hometeamproj.pipeline.profiling import profile_stages
+from hometeamproj.pipeline.queue_manager import QueueManager, ViewportData
+from hometeamproj.pipeline.shared_frames import InlineFrameTransport
+
+
+def _run_lengths(mask: np.ndarray) -> np.ndarray:
+    """Length of the run of True values ending at each index (0 where False)."""
+    idx = np.arange(len(mask))
+    last_false = np.maximum.accumulate(np.where(mask, -1, idx))
+    return np.where(mask, idx - last_false, 0)
+
+
+def _forward_fill_index(mask: np.ndarray) -> np.ndarray:
+    """Index of the most recent True at or before each position (-1 if none)."""
+    idx = np.arange(len(mask))
+    return np.maximum.accumulate(np.where(mask, idx, -1))
+
+
+def _convolve_edge(signal: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """Convolve each column of an (n, d) signal, padding with edge values."""
+    left = len(kernel) // 2
+    right = len(kernel) - 1 - left
+    padded = np.pad(signal, ((left, right), (0, 0)), mode="edge")
+    return np.stack(
+        [np.convolve(padded[:, i], kernel[::-1], mode="valid") for i in range(signal.shape[1])],
+        axis=1,
+    )
+
+
+def roi_centers(motion_boxes: list, frame_shape) -> tuple:
+    """
+    Vectorized ViewportCalculatorProcess.calculate_roi over a whole clip.
+
+    Returns (centers, has_motion): an (n, 2) float array of area-weighted box
+    centroids (frame center where there is no motion) and a bool mask.
+    """
+    height, width = frame_shape[:2]
+    n = len(motion_boxes)
+
+    counts = np.fromiter((len(b) for b in motion_boxes), dtype=np.int64, count=n)
+    flat = np.array([box for boxes in motion_boxes for box in boxes], dtype=np.float64).reshape(-1, 4)
+    owner = np.repeat(np.arange(n), counts)
+
+    w = np.maximum(1, flat[:, 2].astype(np.int64))
+    h = np.maximum(1, flat[:, 3].astype(np.int64))
+    area = (w * h).astype(np.float64)
+    cx = (flat[:, 0] + w / 2).astype(np.int64)
+    cy = (flat[:, 1] + h / 2).astype(np.int64)
+
+    total = np.bincount(owner, weights=area, minlength=n)
+    has_motion = total > 0
+    safe_total = np.where(has_motion, total, 1.0)
+
+    centers = np.empty((n, 2), dtype=np.float64)
+    centers[:, 0] = np.where(has_motion, np.round(np.bincount(owner, weights=cx * area, minlength=n) / safe_total), width // 2)
+    centers[:, 1] = np.where(has_motion, np.round(np.bincount(owner, weights=cy * area, minlength=n) / safe_total), height // 2)
+    return centers, has_motion
+
+
+def tracking_mask(has_motion: np.ndarray, enter_tracking: int, enter_steady: int) -> np.ndarray:
+    """
+    Vectorized ViewportTracker.update_state hysteresis.
+
+    A run of enter_tracking motion frames switches to TRACKING, a run of
+    enter_steady still frames switches back to STEADY; the state at each frame
+    is whichever switch happened last (initially STEADY).
+    """
+    to_tracking = _run_lengths(has_motion) == max(1, enter_tracking)
+    to_steady = _run_lengths(~has_motion) == max(1, enter_steady)
+
+    last_switch = _forward_fill_index(to_tracking | to_steady)
+    return np.where(last_switch >= 0, to_tracking[np.maximum(last_switch, 0)], False)
+
+
+def smooth_trajectory(raw: np.ndarray, window: int, alpha: float) -> np.ndarray:
+    """
+    Zero-phase smoothing: a centred moving average over `window` samples,
+    then a symmetric exponential kernel equivalent to running the EMA
+    (same alpha as smooth_viewport) forwards and backwards.
+    """
+    out = raw.astype(np.float64)
+    if len(out) == 0:
+        return out
+
+    if window > 1:
+        out = _convolve_edge(out, np.full(window, 1.0 / window))
+
+    alpha = max(0.0, min(1.0, float(alpha)))
+    if 0.0 < alpha < 1.0:
+        decay = 1.0 - alpha
+        radius = min(len(out), int(np.ceil(np.log(1e-3) / np.log(decay))))
+        kernel = decay ** np.abs(np.arange(-radius, radius + 1))
+        out = _convolve_edge(out, kernel / kernel.sum())
+
+    return out
+
+
+def clamp_trajectory(centers: np.ndarray, frame_shape, viewport_size) -> np.ndarray:
+    """Vectorized ViewportTracker.clamp_viewport."""
+    height, width = frame_shape[:2]
+    vp_w, vp_h = viewport_size
+
+    clamped = np.empty(centers.shape, dtype=np.int64)
+    clamped[:, 0] = np.maximum(vp_w // 2, np.minimum(np.rint(centers[:, 0]).astype(np.int64), width - vp_w // 2))
+    clamped[:, 1] = np.maximum(vp_h // 2, np.minimum(np.rint(centers[:, 1]).astype(np.int64), height - vp_h // 2))
+    return clamped
+
+
+def compute_trajectory(motion_boxes: list, frame_shape, config: PipelineConfig) -> np.ndarray:
+    """Viewport centers (n, 2) for a clip's per-frame motion boxes."""
+    height, width = frame_shape[:2]
+    if not motion_boxes:
+        return np.empty((0, 2), dtype=np.int64)
+
+    roi, has_motion = roi_centers(motion_boxes, frame_shape)
+    tracking = tracking_mask(
+        has_motion,
+        int(getattr(config, "tracking_enter_frames", 2)),
+        int(getattr(config, "steady_enter_frames", 10)),
+    )
+
+    # TRACKING follows the ROI; STEADY holds the last tracked position
+    last_tracked = _forward_fill_index(tracking)
+    raw = np.where(
+        (last_tracked >= 0)[:, None],
+        roi[np.maximum(last_tracked, 0)],
+        np.array([width // 2, height // 2], dtype=np.float64),
+    )
+
+    smoothed = smooth_trajectory(raw, int(config.smoothing_window_size), float(config.smoothing_alpha))
+    return clamp_trajectory(smoothed, frame_shape, (int(config.viewport_width), int(config.viewport_height)))
+
+
+class TrajectoryRenderProcess(Process):
+    """Turns FrameData into ViewportData using a precomputed trajectory."""
+
+    def __init__(self, input_queue, output_queue, config: PipelineConfig, frame_ids, centers, transport=None, metrics=None):
+        super().__init__()
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.config = config
+        self.frame_ids = np.asarray(frame_ids, dtype=np.int64)
+        self.centers = np.asarray(centers, dtype=np.int64)
+        self.transport = transport or InlineFrameTransport()
+        self.metrics = metrics or StageMetrics("viewport")
+
+    def center_for(self, frame_id: int, frame_shape) -> tuple:
+        if len(self.frame_ids) == 0:
+            h, w = frame_shape[:2]
+            return (w // 2, h // 2)
+
+        # Frames without a detection (e.g. the first one) use the nearest sample
+        i = int(np.searchsorted(self.frame_ids, frame_id))
+        if i >= len(self.frame_ids) or (i > 0 and frame_id - self.frame_ids[i - 1] < self.frame_ids[i] - frame_id):
+            i = max(0, i - 1)
+        x, y = self.centers[i]
+        return (int(x), int(y))
+
+    def run(self):
+        print("TrajectoryRenderProcess: Starting")
+        viewport_size = (int(self.config.viewport_width), int(self.config.viewport_height))
+
+        while True:
+            try:
+                frame_data = self.metrics.get(self.input_queue, timeout=self.config.queue_timeout)
+            except Empty:
+                continue
+
+            if frame_data is None:
+                self.output_queue.put(None)
+                break
+
+            frame = self.transport.load(frame_data)
+            vp = ViewportData(
+                frame_id=frame_data.frame_id,
+                frame=frame_data.frame,
+                viewport_center=self.center_for(frame_data.frame_id, frame.shape),
+                viewport_size=viewport_size,
+                slot=frame_data.slot,
+                created_at=frame_data.created_at,
+                seq=frame_data.seq,
+                timestamp=frame_data.timestamp,
+            )
+            # Offline: no real-time constraint, so block rather than drop
+            self.metrics.put(self.output_queue, vp)
+
+        self.metrics.close()
+        print("TrajectoryRenderProcess: Finished")
+
+
+def collect_detections(
+    config: PipelineConfig, video_path: str, queues: QueueManager, collector=None, output_dir: str = "."
+) -> tuple:
+    """Detection pass: returns (frame_ids, motion_boxes, timestamps) for the whole clip."""
+    transport = queues.frame_transport
+    if use_motion_vectors(config):
+        stages = [
+            MotionVectorDetectionProcess(
+                video_path, queues.detections_queue, config, metrics=stage_metrics(collector, "detector")
+            )
+        ]
+    else:
+        stages = [
+            FrameReaderProcess(
+                video_path, queues.raw_frames_queue, config, transport=transport, metrics=stage_metrics(collector, "reader")
+            ),
+            *create_detection_stage(
+                queues.raw_frames_queue, queues.detections_queue, config,
+                transport=transport, collector=collector, queues=queues,
+            ),
+        ]
+    processes = profile_stages(stages, config, output_dir)
+    for p in processes:
+        p.start()
+
+    detections = {}
+    while True:
+        try:
+            detection = queues.detections_queue.get(timeout=config.queue_timeout)
+        except Empty:
+            if not any(p.is_alive() for p in processes):
+                break
+            continue
+        if detection is None:
+            break
+        detections[detection.frame_id] = (detection.timestamp, list(detection.motion_boxes))
+        transport.release(detection)
+
+    for p in processes:
+        p.join()
+
+    frame_ids = sorted(detections)
+    return frame_ids, [detections[i][1] for i in frame_ids], [detections[i][0] for i in frame_ids]
+
+
+def save_trajectory(path: str, frame_ids, centers):
+    data = np.column_stack([np.asarray(frame_ids, dtype=np.int64), np.asarray(centers, dtype=np.int64).reshape(-1, 2)])
+    np.savetxt(path, data, fmt="%d", delimiter=",", header="frame_id,x,y", comments="")
+
+
+def run_offline(config: PipelineConfig, video_path: str, output_dir: str):
+    """Detect the whole clip, optimise the trajectory, then render it."""
+    queues = QueueManager(config)
+    collector = MetricsCollector(config, queues, output_dir) if config.metrics_enabled else None
+    if collector is not None:
+        collector.start()
+    try:
+        cache = DetectionCache.for_video(video_path, config, offline=True) if config.detection_cache_enabled else None
+        if cache is not None and cache.exists():
+            print(f"Offline: using cached detections {cache.key}")
+            cached = cache.load()
+            frame_ids = sorted(cached)
+            motion_boxes = [cached[i][1] for i in frame_ids]
+        else:
+            print("Offline: detection pass")
+            frame_ids, motion_boxes, timestamps = collect_detections(config, video_path, queues, collector, output_dir)
+            lost = frames_lost(queues.detections_queue)
+            if cache is not None and lost:
+                print(f"Offline: {lost} frames were lost in the detection pass, not caching it")
+            elif cache is not None:
+                cache.save(zip(frame_ids, timestamps, motion_boxes))
+
+        frame_shape = (int(config.frame_resize_height), int(config.frame_resize_width))
+        centers = compute_trajectory(motion_boxes, frame_shape, config)
+        save_trajectory(os.path.join(output_dir, "trajectory.csv"), frame_ids, centers)
+        print(f"Offline: trajectory computed for {len(frame_ids)} frames")
+
+        print("Offline: render pass")
+        transport = queues.frame_transport
+        processes = profile_stages([
+            FrameReaderProcess(
+                video_path, queues.raw_frames_queue, config, transport=transport,
+                metrics=stage_metrics(collector, "render_reader"),
+            ),
+            TrajectoryRenderProcess(
+                queues.raw_frames_queue, queues.viewport_queue, config, frame_ids, centers, transport=transport,
+                metrics=stage_metrics(collector, "viewport"),
+            ),
+            OutputWriterProcess(
+                queues.viewport_queue, output_dir, config, transport=transport, metrics=stage_metrics(collector, "writer")
+            ),
+        ], config, output_dir)
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+    finally:
+        if collector is not None:
+            collector.stop()
+        queues.close()
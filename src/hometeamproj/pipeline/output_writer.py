@@ -1,19 +1,58 @@
+import json
 import os
+import time
 import cv2
+import numpy as np
 import traceback
 from multiprocessing import Process
 from queue import Empty
 
-from hometeamproj.pipeline.queue_manager import ViewportData
+from hometeamproj.pipeline.queue_manager import ClipMarker, ViewportData
 from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.shared_frames import InlineFrameTransport
+from hometeamproj.pipeline.writer_engine import (
+    FfmpegOptions,
+    WriterEngine,
+    degrade_output_profile,
+    resolve_output_profile,
+)
+from hometeamproj.pipeline.metrics import StageMetrics
+from hometeamproj.pipeline.buffer_pool import BufferPool
+
+
+# Overlay rectangle per viewport (BGR): primary green, then orange, magenta, cyan, ...
+VIEW_COLORS = ((0, 255, 0), (0, 165, 255), (255, 0, 255), (255, 255, 0), (0, 0, 255), (255, 0, 0))
 
 
 class OutputWriterProcess(Process):
-    def __init__(self, input_queue, output_dir: str, config: PipelineConfig):
+    def __init__(
+        self,
+        input_queue,
+        output_dir,
+        config: PipelineConfig,
+        transport=None,
+        metrics=None,
+        controls=None,
+        results_queue=None,
+        latency_log=None,
+        checkpointer=None,
+    ):
         super().__init__()
         self.input_queue = input_queue
+        # None in batch mode: each clip's ClipMarker names its output directory
         self.output_dir = output_dir
+        self.results_queue = results_queue  # Batch mode: per-clip summaries go here
         self.config = config
+        self.transport = transport or InlineFrameTransport()
+        self.metrics = metrics or StageMetrics("writer")
+        self.controls = controls  # PipelineControls when adaptive backpressure is on
+        self._latency = None  # EWMA of end-to-end latency, seconds
+        self.latency_log = latency_log  # Live mode: CSV of per-frame glass-to-output latency
+        self._latency_file = None
+        self._latencies = []
+        self.pool = BufferPool(self.metrics, enabled=bool(getattr(config, "buffer_pool", True)))
+        self.checkpointer = checkpointer  # Stream mode with [checkpoint] enabled: videos are written in parts
+        self._next_slot = None  # Adaptive mode: output video slot the next frame should take
 
     def _viewport_rect(self, center, size):
         cx, cy = center
@@ -36,30 +75,108 @@ class OutputWriterProcess(Process):
             y2 = min(h, y1 + 1)
         return x1, y1, x2, y2
 
-    def run(self):
-        print("OutputWriterProcess: Starting output writing")
-        print("OutputWriterProcess: writing to", os.path.abspath(self.output_dir))
+    def _observe_latency(self, viewport_data: ViewportData):
+        if not viewport_data.created_at:
+            return
+        latency = time.time() - viewport_data.created_at
+        self.metrics.observe("latency", latency)
+        self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+        self.metrics.set_gauge("latency_s", self._latency)
+        if self._latency_file is not None:
+            self._latency_file.write(f"{viewport_data.frame_id},{viewport_data.created_at:.6f},{latency * 1000:.2f}\n")
+            self._latencies.append(latency)
 
-        frames_dir = os.path.join(self.output_dir, "frames")
-        viewport_dir = os.path.join(self.output_dir, "viewport")
-        os.makedirs(frames_dir, exist_ok=True)
-        os.makedirs(viewport_dir, exist_ok=True)
+    def _close_latency_log(self):
+        if self._latency_file is None:
+            return
+        self._latency_file.close()
+        self._latency_file = None
+        if self._latencies:
+            ms = np.asarray(self._latencies) * 1000.0
+            print(
+                f"OutputWriterProcess: glass-to-output latency over {len(ms)} frames: "
+                f"p50 {np.percentile(ms, 50):.0f}ms, p99 {np.percentile(ms, 99):.0f}ms, max {ms.max():.0f}ms"
+            )
 
-        video_writer = None
-        viewport_writer = None
+    def _open_output(self, output_dir: str, profile) -> WriterEngine:
+        """Create output_dir (and the stills folders the profile needs) and an engine writing there."""
+        print("OutputWriterProcess: writing to", os.path.abspath(output_dir))
+        os.makedirs(output_dir, exist_ok=True)
+        if profile.overlay_stills:
+            os.makedirs(os.path.join(output_dir, "frames"), exist_ok=True)
+        if profile.viewport_stills:
+            os.makedirs(os.path.join(output_dir, "viewport"), exist_ok=True)
 
         out_fps = float(getattr(self.config, "target_fps", 30.0))
         out_fps = max(1.0, out_fps)
 
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        full_video_path = os.path.join(self.output_dir, "output_full.mp4")
-        viewport_video_path = os.path.join(self.output_dir, "output_viewport.mp4")
+        return WriterEngine(
+            output_dir,
+            out_fps,
+            encode_threads=int(getattr(self.config, "encode_threads", 4)),
+            max_inflight=int(getattr(self.config, "max_inflight_writes", 16)),
+            ffmpeg=FfmpegOptions.from_config(self.config) if self.config.video_backend == "ffmpeg" else None,
+            part=self.checkpointer.start_part if self.checkpointer is not None else None,
+            metrics=self.metrics,
+            fill_gaps=self.controls is not None,
+        )
+
+    def _video_repeats(self, viewport_data: ViewportData, fps: float) -> int:
+        """
+        Adaptive mode: how often to repeat the previous video frame before
+        this one. The backpressure controller may lower the reader's fps,
+        while the videos keep config.target_fps; filling the slots the
+        source skipped keeps output time in step with source time.
+        """
+        if self.controls is None:
+            return 0
+        slot = int(round(viewport_data.timestamp * fps))
+        repeat = 0 if self._next_slot is None else max(0, slot - self._next_slot)
+        self._next_slot = slot + 1
+        return repeat
+
+    def _finish_clip(self, marker: ClipMarker, engine: WriterEngine, frames: int, started: float):
+        """Write the clip's summary.json and report it on results_queue."""
+        seconds = time.time() - started
+        summary = {
+            "clip_id": marker.clip_id,
+            "output_dir": marker.output_dir,
+            "frames_written": frames,
+            "stills_written": engine.stills_written,
+            "stills_failed": engine.stills_failed,
+            "video_frames_written": engine.video_frames_written,
+            "video_frames_dropped": engine.video_frames_dropped,
+            "video_frames_repeated": engine.video_frames_repeated,
+            "seconds": round(seconds, 3),
+            "fps": round(frames / seconds, 2) if seconds > 0 else 0.0,
+            **marker.stats,
+        }
+        with open(os.path.join(marker.output_dir, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        if self.results_queue is not None:
+            self.results_queue.put(summary)
+
+    def run(self):
+        print("OutputWriterProcess: Starting output writing")
+
+        profile_name = str(getattr(self.config, "output_profile", "debug")).lower()
+        base_profile = profile = resolve_output_profile(profile_name)
+        print("OutputWriterProcess: output profile", profile)
+        # The backpressure controller may step down to a cheaper profile (a subset of this one)
+        output_level = 0
+
+        output_dir = self.output_dir
+        engine = self._open_output(output_dir, base_profile) if output_dir is not None else None
+        if self.latency_log:
+            self._latency_file = open(self.latency_log, "w")
+            self._latency_file.write("frame_id,captured_at,latency_ms\n")
+        clip_frames, clip_started = 0, 0.0
+        still_dirs = set()  # viewport stills folders already created
 
         try:
             while True:
                 try:
-                    viewport_data: ViewportData = self.input_queue.get(timeout=self.config.queue_timeout)
-                    print(viewport_data)
+                    viewport_data: ViewportData = self.metrics.get(self.input_queue, timeout=self.config.queue_timeout)
                 except Empty:
                     continue
 
@@ -67,55 +184,114 @@ class OutputWriterProcess(Process):
                     print("OutputWriterProcess: got sentinel None, stopping.")
                     break
 
-                print("OutputWriterProcess: got frame", viewport_data.frame_id)
+                if isinstance(viewport_data, ClipMarker):
+                    if engine is not None:
+                        engine.close()
+                    if viewport_data.end:
+                        if engine is not None:
+                            self._finish_clip(viewport_data, engine, clip_frames, clip_started)
+                        engine = None
+                    else:
+                        output_dir = viewport_data.output_dir
+                        engine = self._open_output(output_dir, base_profile)
+                        clip_frames, clip_started = 0, time.time()
+                        self._next_slot = None
+                    continue
+
+                if engine is None:
+                    # Frames outside any clip (batch mode) have nowhere to go
+                    self.transport.release(viewport_data)
+                    self.metrics.drop("no_clip")
+                    continue
 
-                frame = viewport_data.frame
+                frame = self.transport.load(viewport_data)
                 if frame is None or not hasattr(frame, "shape"):
                     print("OutputWriterProcess: bad frame, skipping.")
+                    self.transport.release(viewport_data)
+                    self.metrics.drop("bad_frame")
                     continue
 
-                frame_h, frame_w = frame.shape[:2]
-
-                if video_writer is None:
-                    video_writer = cv2.VideoWriter(full_video_path, fourcc, out_fps, (frame_w, frame_h))
-                    print("OutputWriterProcess: full writer opened =", video_writer.isOpened())
-
-                vp_w, vp_h = map(int, viewport_data.viewport_size)
+                if self.controls is not None and self.controls.output_level != output_level:
+                    output_level = self.controls.output_level
+                    profile = resolve_output_profile(degrade_output_profile(profile_name, output_level))
+                    print(f"OutputWriterProcess: frame {viewport_data.frame_id}: output profile now {profile}")
 
-                if viewport_writer is None:
-                    viewport_writer = cv2.VideoWriter(viewport_video_path, fourcc, out_fps, (vp_w, vp_h))
-                    print("OutputWriterProcess: viewport writer opened =", viewport_writer.isOpened())
+                start = time.perf_counter()
+                views = viewport_data.views()
+                rects = []
+                for view in views:
+                    vp_w, vp_h = map(int, view.size)
+                    x1, y1, x2, y2 = self._viewport_rect(view.center, (vp_w, vp_h))
+                    rects.append(self._clamp_rect(x1, y1, x2, y2, frame.shape))
 
-                vis = frame.copy()
+                # The copies go into pooled buffers, which the engine hands back
+                # once every write using them (still and/or video) is done
+                vis = None
+                if profile.needs_overlay:
+                    vis = self.pool.acquire(frame.shape, users=profile.overlay_stills + profile.overlay_video)
+                    with self.metrics.timer("overlay"):
+                        np.copyto(vis, frame)
+                        for i, (x1, y1, x2, y2) in enumerate(rects):
+                            cv2.rectangle(vis, (x1, y1), (x2, y2), VIEW_COLORS[i % len(VIEW_COLORS)], 2)
 
-                x1, y1, x2, y2 = self._viewport_rect(viewport_data.viewport_center, (vp_w, vp_h))
-                x1, y1, x2, y2 = self._clamp_rect(x1, y1, x2, y2, frame.shape)
+                # One crop per viewport, all from the same decoded frame
+                crops = []
+                for view, (x1, y1, x2, y2) in zip(views, rects):
+                    vp_w, vp_h = map(int, view.size)
+                    crop = self.pool.acquire((vp_h, vp_w, 3), users=profile.viewport_stills + profile.viewport_video)
+                    region = frame[y1:y2, x1:x2]
+                    with self.metrics.timer("crop"):
+                        if region.shape[1] != vp_w or region.shape[0] != vp_h:
+                            cv2.resize(region, (vp_w, vp_h), dst=crop, interpolation=cv2.INTER_AREA)
+                        else:
+                            np.copyto(crop, region)
+                    crops.append(crop)
+                region = None
 
-                cv2.rectangle(vis, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                # Everything below works on copies: recycle the shared-memory
+                # slot before handing the encodes off to the engine
+                frame = None
+                self.transport.release(viewport_data)
 
-                crop = frame[y1:y2, x1:x2].copy()
-                if crop.shape[1] != vp_w or crop.shape[0] != vp_h:
-                    crop = cv2.resize(crop, (vp_w, vp_h), interpolation=cv2.INTER_AREA)
+                done = self.pool.release
+                repeat = self._video_repeats(viewport_data, engine.fps)
+                if profile.overlay_stills:
+                    engine.write_still(
+                        os.path.join(output_dir, "frames", f"frame_{viewport_data.frame_id:06d}.jpg"), vis, done
+                    )
+                if profile.overlay_video:
+                    engine.write_video("full", vis, done, repeat)
 
-                frame_path = os.path.join(frames_dir, f"frame_{viewport_data.frame_id:06d}.jpg")
-                crop_path = os.path.join(viewport_dir, f"viewport_{viewport_data.frame_id:06d}.jpg")
+                for view, crop in zip(views, crops):
+                    if profile.viewport_stills:
+                        still_dir = os.path.join(output_dir, view.name)
+                        if still_dir not in still_dirs:
+                            os.makedirs(still_dir, exist_ok=True)
+                            still_dirs.add(still_dir)
+                        engine.write_still(
+                            os.path.join(still_dir, f"{view.name}_{viewport_data.frame_id:06d}.jpg"), crop, done
+                        )
+                    if profile.viewport_video:
+                        engine.write_video(view.name, crop, done, repeat)
+                    if not (profile.viewport_stills or profile.viewport_video):
+                        done(crop)
 
-                ok1 = cv2.imwrite(frame_path, vis)
-                ok2 = cv2.imwrite(crop_path, crop)
-                if not ok1 or not ok2:
-                    print("OutputWriterProcess: imwrite failed:", frame_path, crop_path)
+                if viewport_data.checkpoint is not None and self.checkpointer is not None:
+                    # Everything up to this frame reaches disk before it is recorded
+                    engine.flush()
+                    self.checkpointer.save(viewport_data.frame_id, engine.part, viewport_data.checkpoint)
 
-                if video_writer is not None:
-                    video_writer.write(vis)
-                if viewport_writer is not None:
-                    viewport_writer.write(crop)
+                self.metrics.observe("processing", time.perf_counter() - start)
+                self.metrics.frames_out += 1
+                clip_frames += 1
+                self._observe_latency(viewport_data)
 
         except Exception:
             traceback.print_exc()
         finally:
-            if video_writer is not None:
-                video_writer.release()
-            if viewport_writer is not None:
-                viewport_writer.release()
+            if engine is not None:
+                engine.close()
+            self._close_latency_log()
+            self.metrics.close()
 
         print("OutputWriterProcess: Finished writing output")
@@ -0,0 +1,107 @@
+# pipeline/profiling.py
+"""
+Per-stage profiling ([profiling] enabled or --profile).
+
+ProfiledProcess wraps a stage process: in the child it runs the stage's
+run() under cProfile and turns on the fine-grained StageMetrics timers
+(decode, resize, blur, absdiff, findContours, smooth_viewport, imwrite,
+video_write, ...). When the stage exits it writes, to [profiling] dir:
+
+- <stage>_<pid>.prof: cProfile stats (pstats, snakeviz, ...)
+- <stage>_<pid>.txt: the top functions by cumulative time
+- <stage>_<pid>.timers.json: count, total, mean and the p50/p99 bucket
+  bounds of every timer the stage recorded
+
+The timers also reach the MetricsCollector as hometeam_stage_seconds op
+labels when [metrics] is enabled.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+from multiprocessing import Process
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.metrics import Histogram, enable_fine_timers
+
+
+# Rows of the cumulative-time listing in <stage>_<pid>.txt
+TOP_FUNCTIONS = 40
+
+
+def profile_dir(config: PipelineConfig, output_dir: str) -> str:
+    """[profiling] dir, relative to the output directory unless absolute."""
+    path = getattr(config, "profiling_dir", "") or "profiles"
+    return path if os.path.isabs(path) else os.path.join(output_dir, path)
+
+
+class ProfiledProcess(Process):
+    """Runs another (not yet started) stage process's run() under cProfile."""
+
+    def __init__(self, stage: Process, directory: str, sort: str = "cumulative"):
+        super().__init__(name=stage.name, daemon=stage.daemon)
+        self.stage = stage
+        self.directory = directory
+        self.sort = sort
+
+    @property
+    def stage_name(self) -> str:
+        metrics = getattr(self.stage, "metrics", None)
+        return getattr(metrics, "stage", None) or type(self.stage).__name__
+
+    def run(self):
+        enable_fine_timers()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self.stage.run()
+        finally:
+            profiler.disable()
+            self._dump(profiler)
+
+    def _dump(self, profiler: cProfile.Profile):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            base = os.path.join(self.directory, f"{self.stage_name}_{os.getpid()}")
+            profiler.dump_stats(base + ".prof")
+
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats(self.sort).print_stats(TOP_FUNCTIONS)
+            with open(base + ".txt", "w") as f:
+                f.write(text.getvalue())
+
+            with open(base + ".timers.json", "w") as f:
+                json.dump(self.timers(), f, indent=2)
+        except OSError as e:
+            print(f"ProfiledProcess: could not write profile for {self.stage_name}: {e}")
+            return
+        print(f"ProfiledProcess: {self.stage_name} profile written to {base}.prof")
+
+    def timers(self) -> dict:
+        """Summary of the stage's StageMetrics histograms (seconds)."""
+        metrics = getattr(self.stage, "metrics", None)
+        if metrics is None:
+            return {}
+        histograms = metrics.snapshot()["histograms"]
+        summary = {}
+        for name, data in sorted(histograms.items()):
+            h = Histogram.from_dict(data)
+            summary[name] = {
+                "count": h.count,
+                "total_s": round(h.total, 6),
+                "mean_ms": round(h.total / h.count * 1000, 4) if h.count else None,
+                "p50_le_s": h.quantile(0.5),
+                "p99_le_s": h.quantile(0.99),
+            }
+        return summary
+
+
+def profile_stages(processes: list, config: PipelineConfig, output_dir: str) -> list:
+    """processes, each wrapped in a ProfiledProcess when profiling is enabled."""
+    if not getattr(config, "profiling_enabled", False):
+        return processes
+    directory = profile_dir(config, output_dir)
+    print(f"Profiling: writing per-stage profiles to {directory}")
+    return [ProfiledProcess(p, directory, sort=getattr(config, "profiling_sort", "cumulative")) for p in processes]
@@ -3,19 +3,18 @@
 Queue management for inter-process communication.
 """
 
-import multiprocessing
-from dataclasses import dataclass
-from typing import Any
-import importlib.util
-from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Any, Optional
 
-path = Path("/Users/bakr/Desktop/HoemTeam Project /HOMETEAMPROJ/src/hometeamproj/config.py")
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.delivery import SequenceTracker
+from hometeamproj.pipeline.memory_budget import BudgetedQueue, MemoryBudget
+from hometeamproj.pipeline.shared_frames import create_frame_transport
 
-spec = importlib.util.spec_from_file_location("config", path)
-module = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(module)
 
-PipelineConfig = module.PipelineConfig
+# Queues charged against the MemoryBudget; the detector pool's only exist with [detection] workers > 1
+POOL_QUEUES = ("detector_tasks", "detector_results")
+BUDGETED_QUEUES = ("raw_frames", "detections", "viewport") + POOL_QUEUES
 
 
 @dataclass
@@ -23,8 +22,21 @@ class FrameData:
     """Frame data structure passed through queues."""
 
     frame_id: int
-    frame: Any  # numpy array
+    frame: Any  # numpy array (None when the frame lives in a shared-memory slot)
     timestamp: float
+    slot: Optional[int] = None  # SharedFrameRing slot index
+    created_at: float = 0.0  # Wall-clock time the frame entered the pipeline (time.time())
+    seq: Optional[int] = None  # Per-clip sequence number from the frame source (pipeline/delivery.py)
+
+
+@dataclass
+class MotionHeatmap:
+    """Motion energy on a coarse grid: changed full-frame pixels per cell."""
+
+    energy: Any  # float32 array, shape (rows, cols)
+    cell_width: float  # Cell size in full-frame pixels
+    cell_height: float
+    origin: tuple = (0, 0)  # Full-frame (x, y) of the grid's top-left corner (detection windows)
 
 
 @dataclass
@@ -34,6 +46,20 @@ class DetectionData:
     frame_id: int
     frame: Any
     motion_boxes: list  # List of (x, y, w, h) bounding boxes
+    slot: Optional[int] = None
+    timestamp: float = 0.0  # Source timestamp in seconds (from FrameData)
+    created_at: float = 0.0
+    motion_heatmap: Optional[MotionHeatmap] = None  # Block backend with [detection] heatmap = true
+    seq: Optional[int] = None  # From FrameData
+
+
+@dataclass
+class ViewportView:
+    """One of several viewports on a frame ([viewport] count / wide)."""
+
+    name: str  # Output name: viewport, viewport_1, ..., wide
+    center: tuple  # (x, y)
+    size: tuple  # (width, height)
 
 
 @dataclass
@@ -44,6 +70,31 @@ class ViewportData:
     frame: Any
     viewport_center: tuple  # (x, y) center coordinates
     viewport_size: tuple  # (width, height)
+    slot: Optional[int] = None
+    created_at: float = 0.0
+    viewports: Optional[list] = None  # Every ViewportView, primary first; None = just the primary
+    checkpoint: Optional[dict] = None  # Viewport tracking state after this frame, on checkpoint frames
+    seq: Optional[int] = None  # From DetectionData
+    timestamp: float = 0.0  # Source time in seconds, from DetectionData
+
+    def views(self) -> list:
+        """The viewports to render for this frame."""
+        if self.viewports:
+            return self.viewports
+        return [ViewportView("viewport", self.viewport_center, self.viewport_size)]
+
+
+@dataclass
+class ClipMarker:
+    """
+    Clip boundary in batch mode. A start marker precedes a clip's frames and
+    an end marker follows them; stages reset per-clip state and forward both.
+    """
+
+    clip_id: str
+    output_dir: str
+    end: bool = False
+    stats: dict = field(default_factory=dict)  # Per-stage numbers gathered on the end marker
 
 
 class QueueManager:
@@ -51,21 +102,57 @@ class QueueManager:
 
     def __init__(self, config: PipelineConfig):
         """
-        Initialize queues.
-
-        TODO: Create multiprocessing queues with appropriate maxsize.
-        Consider using multiprocessing.Queue or multiprocessing.Manager().Queue()
-        Use config.queue_max_size for the maxsize parameter to prevent unbounded memory growth.
+        Create the frame transport ([transport] mode), the MemoryBudget shared
+        by every queue ([queues] max_mb / total_mb) and the three stage
+        queues: raw_frames (reader -> detector), detections (detector ->
+        viewport) and viewport (viewport -> writer). Each holds at most
+        [queues] max_size items and delivers frames once and in order.
         """
         self.config = config
-        #NOTE: here in my implementation i will be using multiprocessing.Queue for faste execution
-        # TODO: Initialize queues
 
-        # self.raw_frames_queue = multiprocessing.Queue(maxsize=config.queue_max_size)
-        # self.detections_queue = multiprocessing.Queue(maxsize=config.queue_max_size)
-        # self.viewport_queue = multiprocessing.Queue(maxsize=config.queue_max_size)
+        # Frame pixels either ride inside the queue items or sit in a shared
+        # memory ring, in which case the queues only carry slot indices.
+        self.frame_transport = create_frame_transport(config)
+
+        # Besides maxsize items, every queue is bounded by the bytes of frames it holds
+        self.memory_budget = MemoryBudget.from_config(list(BUDGETED_QUEUES), config)
+        # Stage queues deliver each frame once and in order (pipeline/delivery.py)
+        self.raw_frames_queue = self.queue("raw_frames", config.queue_max_size, ordered=True)
+        self.detections_queue = self.queue("detections", config.queue_max_size, ordered=True)
+        self.viewport_queue = self.queue("viewport", config.queue_max_size, ordered=True)
 
-        # Placeholder - replace with actual queue initialization
-        self.raw_frames_queue = multiprocessing.Queue(maxsize=config.queue_max_size)
-        self.detections_queue = multiprocessing.Queue(maxsize=config.queue_max_size)
-        self.viewport_queue = multiprocessing.Queue(maxsize=config.queue_max_size)
\ No newline at end of file
+    def queue(self, name: str, maxsize: int, ordered: bool = False) -> BudgetedQueue:
+        """
+        A queue of at most maxsize items, charged to the budget as `name`.
+        ordered=True adds a SequenceTracker; only for queues with one consumer.
+        """
+        slot_nbytes = getattr(self.frame_transport, "slot_nbytes", 0)
+        delivery = None
+        if ordered:
+            window = int(getattr(self.config, "queue_reorder_window", 0))
+            delivery = SequenceTracker(name, window=window, transport=self.frame_transport)
+        return BudgetedQueue(name, self.memory_budget, maxsize=maxsize, slot_nbytes=slot_nbytes, delivery=delivery)
+
+    def depths(self) -> dict:
+        """Approximate number of items in each queue (None where qsize() is unsupported, e.g. macOS)."""
+        depths = {}
+        for name, q in (
+            ("raw_frames", self.raw_frames_queue),
+            ("detections", self.detections_queue),
+            ("viewport", self.viewport_queue),
+        ):
+            try:
+                depths[name] = q.qsize()
+            except NotImplementedError:
+                depths[name] = None
+        return depths
+
+    def buffered_bytes(self) -> dict:
+        """{queue: (frame bytes buffered now, peak)} for the queues in use, plus "total"."""
+        usage = self.memory_budget.buffered()
+        return {name: value for name, value in usage.items() if name not in POOL_QUEUES or value[1]}
+
+    def close(self):
+        """Report peak buffered bytes and release the frame transport (unlinks shared memory when used)."""
+        print(MemoryBudget.summary(self.buffered_bytes()))
+        self.frame_transport.close()
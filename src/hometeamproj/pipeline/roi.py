@@ -0,0 +1,157 @@
+# pipeline/roi.py
+"""
+Viewport-guided detection windows ([roi] enabled).
+
+The action is nearly always close to where the viewport already is, so
+DetectionProcess can difference a window around it instead of the whole
+frame. Two pieces:
+
+- ViewportFeedback: shared memory written by ViewportCalculatorProcess after
+  every frame with the rectangle covering its viewports, the source
+  timestamp and the rectangle's velocity.
+- RoiScheduler: in the detector, picks each frame's detection window: the
+  latest viewport rectangle moved on by its velocity to the frame's
+  timestamp and padded by `padding` of its size on every side.
+
+A full-frame scan runs every `full_scan_interval` frames, when a window that
+had motion loses it for `lost_frames` frames, and whenever the feedback is
+missing or more than `max_lag` seconds behind. Frame differencing needs the
+previous frame over the same area, so a full scan takes two consecutive
+full-frame windows; the first one still differences the previous window.
+"""
+
+import multiprocessing
+from typing import Optional
+
+from hometeamproj.config import PipelineConfig
+
+
+# Window edges snap outwards to this many full-frame pixels, a multiple of
+# 1/detection_scale for the usual scales, so a window's proxy lines up with
+# the full-frame proxy
+GRID = 16
+
+# Windows covering more of the frame than this are not worth cropping
+MAX_WINDOW_FRACTION = 0.8
+
+
+def intersect(a: tuple, b: tuple) -> Optional[tuple]:
+    """Overlap of two (x1, y1, x2, y2) rectangles, or None."""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return (x1, y1, x2, y2)
+
+
+def snap_rect(rect: tuple, frame_w: int, frame_h: int, grid: int = GRID) -> tuple:
+    """rect grown outwards to the grid and clipped to the frame."""
+    x1, y1, x2, y2 = rect
+    x1 = max(0, int(x1) // grid * grid)
+    y1 = max(0, int(y1) // grid * grid)
+    x2 = min(frame_w, -(-int(x2) // grid) * grid)
+    y2 = min(frame_h, -(-int(y2) // grid) * grid)
+    return (x1, y1, x2, y2)
+
+
+class ViewportFeedback:
+    """Latest viewport rectangle, shared from the viewport stage to the detector."""
+
+    def __init__(self):
+        # timestamp, x1, y1, x2, y2, vx, vy; timestamp < 0 = nothing published
+        self._values = multiprocessing.Array("d", [-1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0])
+        self._last = None  # publisher side only: (timestamp, center)
+
+    def publish(self, timestamp: float, rect: tuple):
+        """Record the viewports' rectangle after the frame at `timestamp` (viewport stage)."""
+        cx, cy = (rect[0] + rect[2]) / 2.0, (rect[1] + rect[3]) / 2.0
+        vx = vy = 0.0
+        if self._last is not None and timestamp > self._last[0]:
+            dt = timestamp - self._last[0]
+            vx = (cx - self._last[1][0]) / dt
+            vy = (cy - self._last[1][1]) / dt
+        self._last = (timestamp, (cx, cy))
+        with self._values.get_lock():
+            self._values[:] = [float(timestamp), *map(float, rect), vx, vy]
+
+    def latest(self) -> Optional[tuple]:
+        """(timestamp, rect, velocity in px/s), or None before the first publish."""
+        with self._values.get_lock():
+            values = self._values[:]
+        if values[0] < 0:
+            return None
+        return values[0], tuple(values[1:5]), (values[5], values[6])
+
+    def reset(self):
+        """Forget the viewport (start of a new clip)."""
+        self._last = None
+        with self._values.get_lock():
+            self._values[0] = -1.0
+
+
+class RoiScheduler:
+    """Chooses the detection window for each frame from the viewport feedback."""
+
+    def __init__(self, config: PipelineConfig, feedback: ViewportFeedback):
+        self.feedback = feedback
+        self.padding = max(0.0, float(getattr(config, "roi_padding", 0.1)))
+        self.full_scan_interval = max(2, int(getattr(config, "roi_full_scan_interval", 30)))
+        self.lost_frames = max(1, int(getattr(config, "roi_lost_frames", 3)))
+        self.max_lag = float(getattr(config, "roi_max_lag", 1.0))
+        self.full_frames = 0
+        self.window_frames = 0
+        self.reset()
+
+    def reset(self):
+        self._full_left = 2  # full-frame windows still to run for the current scan
+        self._since_full = 0
+        self._empty = 0
+        self._had_motion = False
+
+    def _predicted(self, timestamp: float, frame_w: int, frame_h: int) -> Optional[tuple]:
+        latest = self.feedback.latest()
+        if latest is None:
+            return None
+        published, (x1, y1, x2, y2), (vx, vy) = latest
+        lag = timestamp - published
+        if lag < 0 or lag > self.max_lag:
+            return None  # Another clip, or the viewport stage is too far behind
+        dx, dy = vx * lag, vy * lag
+        pad_x, pad_y = self.padding * (x2 - x1), self.padding * (y2 - y1)
+        rect = snap_rect((x1 + dx - pad_x, y1 + dy - pad_y, x2 + dx + pad_x, y2 + dy + pad_y), frame_w, frame_h)
+        if (rect[2] - rect[0]) * (rect[3] - rect[1]) > MAX_WINDOW_FRACTION * frame_w * frame_h:
+            return None
+        return rect if rect[2] > rect[0] and rect[3] > rect[1] else None
+
+    def window(self, timestamp: float, frame_shape: tuple) -> tuple:
+        """(x1, y1, x2, y2) to scan for the frame at `timestamp`; the whole frame for full scans."""
+        frame_h, frame_w = frame_shape[:2]
+        full = (0, 0, frame_w, frame_h)
+
+        if not self._full_left and (
+            self._since_full >= self.full_scan_interval or (self._had_motion and self._empty >= self.lost_frames)
+        ):
+            self._full_left = 2
+
+        rect = None if self._full_left else self._predicted(timestamp, frame_w, frame_h)
+        if rect is None:
+            self._full_left = max(0, self._full_left - 1)
+            self._since_full = 0
+            self._empty = 0
+            self._had_motion = False
+            self.full_frames += 1
+            return full
+
+        self._since_full += 1
+        self.window_frames += 1
+        return rect
+
+    def observe(self, rect: tuple, boxes: list, frame_shape: tuple):
+        """Feed back what the window found, to spot a window that lost its motion."""
+        if rect == (0, 0, frame_shape[1], frame_shape[0]):
+            return
+        if boxes:
+            self._had_motion = True
+            self._empty = 0
+        else:
+            self._empty += 1
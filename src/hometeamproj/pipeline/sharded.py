@@ -0,0 +1,268 @@
+# pipeline/sharded.py
+"""
+Time-sharded processing of one long video.
+
+1. Tracking pass: the clip is split into time ranges, each run by its own
+   reader -> detection -> ViewportCalculatorProcess pipeline in parallel.
+   Every shard after the first starts reading a warm-up period early so
+   prev_frame, the smoothing buffers and the state machine are primed by
+   the time its own range begins.
+2. Stitch: per-shard trajectories are joined, cross-fading from the
+   previous shard's path to the next one across each warm-up overlap, so
+   the viewport does not jump at shard boundaries.
+3. Render pass: each range is rendered from the stitched trajectory in
+   parallel (FrameReaderProcess -> TrajectoryRenderProcess ->
+   OutputWriterProcess into shards/NN/), then the shard videos are
+   concatenated and the stills moved into the output directory.
+"""
+
+import math
+import os
+import shutil
+import time
+from dataclasses import dataclass, replace
+from queue import Empty
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.detector_pool import create_detection_stage
+from hometeamproj.pipeline.frame_reader import FrameReaderProcess
+from hometeamproj.pipeline.offline import TrajectoryRenderProcess, save_trajectory
+from hometeamproj.pipeline.output_writer import OutputWriterProcess
+from hometeamproj.pipeline.profiling import profile_stages
+from hometeamproj.pipeline.queue_manager import QueueManager
+from hometeamproj.pipeline.viewport_worker import ViewportCalculatorProcess
+from hometeamproj.pipeline.writer_engine import concat_videos
+
+
+@dataclass
+class Shard:
+    """Source frames [start, end) are this shard's output; reading begins at warmup_start."""
+
+    index: int
+    start: int
+    end: Optional[int]  # None = to the end of the clip
+    warmup_start: int
+
+
+def plan_shards(frame_count: int, video_fps: float, config: PipelineConfig) -> list:
+    """Split frame_count source frames into shards, per [shards] settings."""
+    video_fps = video_fps if video_fps and video_fps > 0 else 30.0
+    skip = max(1, int(video_fps / max(1, int(config.target_fps))))
+
+    count = int(config.shard_count) or os.cpu_count() or 1
+    min_frames = max(1, int(float(config.shard_min_seconds) * video_fps))
+    count = max(1, min(count, frame_count // min_frames if frame_count > 0 else 1))
+
+    # Boundaries and warm-up start on kept frames, so shards sample the same
+    # frames an unsharded run would
+    warmup = int(math.ceil(float(config.shard_warmup_seconds) * video_fps / skip)) * skip
+    length = int(math.ceil(frame_count / count / skip)) * skip
+
+    shards = []
+    for i in range(count):
+        start = i * length
+        if frame_count > 0 and start >= frame_count:
+            break
+        end = None if i == count - 1 else (i + 1) * length
+        shards.append(Shard(index=i, start=start, end=end, warmup_start=max(0, start - warmup)))
+    return shards
+
+
+def _drain(runs: list) -> None:
+    """
+    Poll every run's output queue until each has sent its sentinel.
+    runs: (queue, transport, processes, sink) with sink(item) called per item.
+    """
+    open_runs = set(range(len(runs)))
+    while open_runs:
+        idle = True
+        for i in list(open_runs):
+            out_queue, transport, processes, sink = runs[i]
+            try:
+                item = out_queue.get_nowait()
+            except Empty:
+                if not any(p.is_alive() for p in processes):
+                    open_runs.discard(i)
+                continue
+            idle = False
+            if item is None:
+                open_runs.discard(i)
+                continue
+            sink(item)
+            transport.release(item)
+        if idle:
+            time.sleep(0.005)
+
+
+def track_shards(config: PipelineConfig, video_path: str, shards: list, output_dir: str = ".") -> list:
+    """Tracking pass: returns one {frame_id: (x, y)} trajectory per shard (warm-up included)."""
+    trajectories = [{} for _ in shards]
+    managers, runs, processes = [], [], []
+    try:
+        for shard, trajectory in zip(shards, trajectories):
+            queues = QueueManager(config)
+            managers.append(queues)
+            transport = queues.frame_transport
+            shard_processes = profile_stages([
+                FrameReaderProcess(
+                    video_path, queues.raw_frames_queue, config, transport=transport,
+                    start_frame=shard.warmup_start, end_frame=shard.end,
+                ),
+                *create_detection_stage(
+                    queues.raw_frames_queue, queues.detections_queue, config, transport=transport, queues=queues
+                ),
+                ViewportCalculatorProcess(queues.detections_queue, queues.viewport_queue, config, transport=transport),
+            ], config, output_dir)
+            processes += shard_processes
+
+            def sink(vp, trajectory=trajectory):
+                trajectory[vp.frame_id] = tuple(vp.viewport_center)
+
+            runs.append((queues.viewport_queue, transport, shard_processes, sink))
+
+        for p in processes:
+            p.start()
+        _drain(runs)
+        for p in processes:
+            p.join()
+    finally:
+        for queues in managers:
+            queues.close()
+    return trajectories
+
+
+def stitch_trajectories(shards: list, trajectories: list) -> tuple:
+    """
+    Join per-shard trajectories into (frame_ids, centers).
+
+    Each shard owns [start, end). Across the warm-up overlap before a shard's
+    start, the previous shard's path is cross-faded into the new shard's
+    (whose state has converged by then), so both sides agree at the boundary.
+    """
+    merged = {}
+    for shard, trajectory in zip(shards, trajectories):
+        overlap = sorted(f for f in trajectory if f < shard.start and f in merged)
+        for k, f in enumerate(overlap):
+            w = (k + 1) / (len(overlap) + 1)
+            prev = np.asarray(merged[f], dtype=np.float64)
+            cur = np.asarray(trajectory[f], dtype=np.float64)
+            merged[f] = tuple(np.rint((1.0 - w) * prev + w * cur).astype(np.int64))
+
+        for f, center in trajectory.items():
+            if f >= shard.start and (shard.end is None or f < shard.end):
+                merged[f] = center
+
+    frame_ids = sorted(merged)
+    centers = np.array([merged[f] for f in frame_ids], dtype=np.int64).reshape(-1, 2)
+    return frame_ids, centers
+
+
+def render_shards(
+    config: PipelineConfig, video_path: str, shards: list, frame_ids, centers, shard_dirs: list, output_dir: str = "."
+):
+    """Render pass: every shard's own range, in parallel, into its shard directory."""
+    managers, processes = [], []
+    try:
+        for shard, shard_dir in zip(shards, shard_dirs):
+            queues = QueueManager(config)
+            managers.append(queues)
+            transport = queues.frame_transport
+            processes += profile_stages([
+                FrameReaderProcess(
+                    video_path, queues.raw_frames_queue, config, transport=transport,
+                    start_frame=shard.start, end_frame=shard.end,
+                ),
+                TrajectoryRenderProcess(
+                    queues.raw_frames_queue, queues.viewport_queue, config, frame_ids, centers, transport=transport
+                ),
+                OutputWriterProcess(queues.viewport_queue, shard_dir, config, transport=transport),
+            ], config, output_dir)
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+    finally:
+        for queues in managers:
+            queues.close()
+
+
+def merge_shard_outputs(shard_dirs: list, output_dir: str, config: PipelineConfig) -> None:
+    """
+    Concatenate the shard videos and move their stills into output_dir.
+    Merged files are removed from the shard directories; anything else is
+    left there.
+    """
+    names = sorted({
+        name for d in shard_dirs if os.path.isdir(d)
+        for name in os.listdir(d) if name.startswith("output_") and name.endswith(".mp4")
+    })
+    for name in names:
+        parts = [os.path.join(d, name) for d in shard_dirs]
+        merged = os.path.join(output_dir, name)
+        concat_videos(parts, merged, config)
+        if os.path.exists(merged):
+            for part in parts:
+                if os.path.exists(part):
+                    os.remove(part)
+
+    for d in shard_dirs:
+        if not os.path.isdir(d):
+            continue
+        for sub in sorted(os.listdir(d)):
+            src = os.path.join(d, sub)
+            if not os.path.isdir(src):
+                continue
+            dst = os.path.join(output_dir, sub)
+            os.makedirs(dst, exist_ok=True)
+            for name in os.listdir(src):
+                if not os.path.exists(os.path.join(dst, name)):
+                    os.replace(os.path.join(src, name), os.path.join(dst, name))
+
+
+def remove_merged_shards(shards_root: str) -> None:
+    """Delete the shard directories, unless something in them was not merged."""
+    leftovers = [os.path.join(root, f) for root, _, files in os.walk(shards_root) for f in files]
+    if leftovers:
+        print(f"Sharded: {len(leftovers)} shard files were not merged, keeping {shards_root}")
+        return
+    shutil.rmtree(shards_root, ignore_errors=True)
+
+
+def run_sharded(config: PipelineConfig, video_path: str, output_dir: str):
+    """Track, stitch and render a long clip as parallel time shards."""
+    cap = cv2.VideoCapture(video_path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    video_fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+
+    if int(config.viewport_count) > 1 or config.viewport_wide:
+        # The trajectory and the render pass follow one viewport
+        print("Sharded: [viewport] count > 1 and wide are not supported, rendering the primary viewport only")
+        config = replace(config, viewport_count=1, viewport_wide=False)
+
+    shards = plan_shards(frame_count, video_fps, config)
+    for shard in shards:
+        print(f"Sharded: shard {shard.index} frames [{shard.start}, {shard.end}) warm-up from {shard.warmup_start}")
+
+    start = time.time()
+    print(f"Sharded: tracking pass on {len(shards)} shards")
+    trajectories = track_shards(config, video_path, shards, output_dir)
+    frame_ids, centers = stitch_trajectories(shards, trajectories)
+    save_trajectory(os.path.join(output_dir, "trajectory.csv"), frame_ids, centers)
+    print(f"Sharded: stitched trajectory for {len(frame_ids)} frames ({time.time() - start:.1f}s)")
+
+    if str(config.output_segment).lower() not in ("", "none"):
+        print("Sharded: segmented (HLS) output is not supported here, writing single files per shard")
+        config = replace(config, output_segment="none")
+
+    shards_root = os.path.join(output_dir, "shards")
+    shard_dirs = [os.path.join(shards_root, f"{shard.index:02d}") for shard in shards]
+    print("Sharded: render pass")
+    render_shards(config, video_path, shards, frame_ids, centers, shard_dirs, output_dir)
+    merge_shard_outputs(shard_dirs, output_dir, config)
+    remove_merged_shards(shards_root)
+    print(f"Sharded: finished in {time.time() - start:.1f}s")
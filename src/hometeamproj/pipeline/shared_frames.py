@@ -0,0 +1,183 @@
+# pipeline/shared_frames.py
+"""
+Frame transports: how frame pixels travel between pipeline stages.
+
+- InlineFrameTransport: the numpy frame rides inside the queue item and is
+  pickled on every hop (the original behaviour).
+- SharedFrameRing: frames live in a fixed ring of slots backed by
+  multiprocessing.shared_memory. Queue items only carry the slot index; each
+  queued reference owns one refcount and the slot is recycled once the last
+  holder (normally OutputWriterProcess) releases it.
+"""
+
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+from queue import Full
+
+import numpy as np
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.memory_budget import MB
+
+
+class InlineFrameTransport:
+    """Frames are carried in the `frame` field of each queue item."""
+
+    def store(self, frame, timeout=None):
+        return frame, None
+
+    def reserve(self, shape, dtype=np.uint8, timeout=None):
+        """(buffer, payload, slot): fill buffer, then queue payload/slot as store() would."""
+        frame = np.empty(shape, dtype=dtype)
+        return frame, frame, None
+
+    def load(self, item):
+        return item.frame
+
+    def retain(self, item):
+        pass
+
+    def release(self, item):
+        pass
+
+    def close(self):
+        pass
+
+
+class SharedFrameRing:
+    """Reference-counted ring of fixed-size frame slots in shared memory."""
+
+    def __init__(self, slots: int, frame_shape: tuple, dtype=np.uint8):
+        self.slots = max(1, int(slots))
+        self.frame_shape = tuple(int(v) for v in frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.slot_nbytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slot_nbytes * self.slots)
+        self._refcounts = multiprocessing.Array("i", self.slots)
+        self._available = multiprocessing.Condition(self._refcounts.get_lock())
+        self._owner = True
+        self._frames = None
+        self._cursor = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_owner"] = False
+        state["_frames"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def _array(self):
+        if self._frames is None:
+            self._frames = np.ndarray(
+                (self.slots,) + self.frame_shape, dtype=self.dtype, buffer=self._shm.buf
+            )
+        return self._frames
+
+    def acquire(self, timeout=None):
+        """Reserve a free slot (refcount 1). Returns None if none frees up in time."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        counts = self._refcounts.get_obj()
+
+        with self._available:
+            while True:
+                for i in range(self.slots):
+                    slot = (self._cursor + i) % self.slots
+                    if counts[slot] == 0:
+                        counts[slot] = 1
+                        self._cursor = (slot + 1) % self.slots
+                        return slot
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._available.wait(remaining)
+
+    def store(self, frame, timeout=None):
+        """Copy frame into a free slot. Raises queue.Full if the ring stays full."""
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"SharedFrameRing: frame shape {frame.shape} != slot shape {self.frame_shape}")
+
+        slot = self.acquire(timeout)
+        if slot is None:
+            raise Full("no free frame slot")
+
+        np.copyto(self._array()[slot], frame)
+        return None, slot
+
+    def reserve(self, shape, dtype=np.uint8, timeout=None):
+        """
+        (buffer, payload, slot) with buffer a free slot to fill in place, which
+        saves store()'s copy. Raises queue.Full if the ring stays full.
+        """
+        if tuple(shape) != self.frame_shape or np.dtype(dtype) != self.dtype:
+            raise ValueError(f"SharedFrameRing: frame shape {tuple(shape)} != slot shape {self.frame_shape}")
+
+        slot = self.acquire(timeout)
+        if slot is None:
+            raise Full("no free frame slot")
+        return self._array()[slot], None, slot
+
+    def load(self, item):
+        slot = getattr(item, "slot", None)
+        if slot is None:
+            return item.frame
+        return self._array()[slot]
+
+    def retain(self, item):
+        slot = getattr(item, "slot", None)
+        if slot is None:
+            return
+        with self._available:
+            self._refcounts.get_obj()[slot] += 1
+
+    def release(self, item):
+        slot = getattr(item, "slot", None)
+        if slot is None:
+            return
+        with self._available:
+            counts = self._refcounts.get_obj()
+            counts[slot] = max(0, counts[slot] - 1)
+            if counts[slot] == 0:
+                self._available.notify_all()
+
+    def in_use(self) -> int:
+        with self._available:
+            return sum(1 for c in self._refcounts.get_obj() if c > 0)
+
+    def close(self):
+        self._frames = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # A view into the buffer is still alive in this process; the OS
+            # reclaims the mapping when the process exits.
+            pass
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def create_frame_transport(config: PipelineConfig):
+    """Build the frame transport selected by [transport] mode in config.ini."""
+    mode = str(getattr(config, "frame_transport", "queue")).lower()
+
+    if mode in ("shared_memory", "shm"):
+        frame_shape = (int(config.frame_resize_height), int(config.frame_resize_width), 3)
+        slots = int(getattr(config, "ring_slots", 32))
+        total_bytes = float(getattr(config, "queue_total_mb", 0)) * MB
+        if total_bytes > 0:
+            fit = max(1, int(total_bytes // int(np.prod(frame_shape))))
+            if fit < slots:
+                print(f"create_frame_transport: ring_slots={slots} exceeds [queues] total_mb, using {fit} slots")
+                slots = fit
+        return SharedFrameRing(slots, frame_shape)
+
+    if mode != "queue":
+        print(f"create_frame_transport: unknown transport '{mode}', falling back to queue")
+    return InlineFrameTransport()
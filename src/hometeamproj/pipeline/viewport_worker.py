@@ -1,16 +1,25 @@
 # pipeline/viewport_calculator.py
 """
 Viewport calculation process with state machine and smoothing.
+
+With [viewport] count > 1 the motion boxes are clustered and each cluster
+is followed by its own ViewportTracker (state machine + smoothing), main
+action first. [viewport] wide adds a larger view that follows all motion.
 """
 
+import math
+import time
 import numpy as np
 from multiprocessing import Process
 from collections import deque
 from enum import Enum
 from queue import Empty, Full
 
-from hometeamproj.pipeline.queue_manager import DetectionData, ViewportData
+from hometeamproj.pipeline.queue_manager import ClipMarker, DetectionData, ViewportData, ViewportView
+from hometeamproj.pipeline.detection_cache import frames_lost
 from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.shared_frames import InlineFrameTransport
+from hometeamproj.pipeline.metrics import StageMetrics
 
 
 class ViewportState(Enum):
@@ -19,81 +28,60 @@ class ViewportState(Enum):
     STEADY = "steady"      # Maintaining position, minimal motion
 
 
-class ViewportCalculatorProcess(Process):
-    """Process that calculates viewport position with state machine and smoothing."""
+class ViewportTracker:
+    """One viewport's state machine, smoothing and current position."""
 
-    def __init__(self, input_queue, output_queue, config: PipelineConfig):
-        super().__init__()
-        self.input_queue = input_queue
-        self.output_queue = output_queue
+    def __init__(self, config: PipelineConfig, name: str = "viewport", size=None, fit_frame: bool = False, metrics=None):
         self.config = config
-
+        self.name = name
+        self.metrics = metrics or StageMetrics("viewport")  # fine timers (smooth_viewport)
+        self.size = size or (int(config.viewport_width), int(config.viewport_height))
+        self.fit_frame = fit_frame  # Shrink size to the frame, keeping its aspect ratio
+        self.reset()
+
+    def reset(self):
+        """Forget all tracking state (start of a new clip)."""
         self.state = ViewportState.STEADY
         self.current_viewport_center = None
-        self.smoothing_buffer = deque(maxlen=int(getattr(config, "smoothing_window_size", 5)))
+        self.last_roi = None  # Where this viewport last saw its motion
+        self.smoothing_buffer = deque(maxlen=int(getattr(self.config, "smoothing_window_size", 5)))
 
-        
         self._motion_on_count = 0
         self._motion_off_count = 0
 
-
         self._ema_center = None
 
-
-    def _get_motion_boxes(self, detection_data):
-
-        boxes = getattr(detection_data, "boxes", None)
-        if boxes is None:
-            boxes = getattr(detection_data, "motion_boxes", None)
-        return boxes or []
-
-    def _get_frame_shape(self, detection_data):
-         frame = detection_data.frame
-         frame_id = detection_data.frame_id
-         frame_shape = frame.shape if frame is not None and hasattr(frame, "shape") else None
-         return frame_shape, frame_id, frame
-
-
-
-    def calculate_roi(self, motion_boxes, frame_shape):
-        """
-        Calculate region of interest from motion boxes.
-
-        Strategy implemented:
-        - If no boxes: center of frame
-        - Otherwise: weighted centroid of all boxes by area
-          (falls back to largest box if something is off)
-        """
-        if frame_shape is None:
-            return self.current_viewport_center or (0, 0)
-
-        height, width = frame_shape[:2]
-
-        if not motion_boxes:
-            return (width // 2, height // 2)
-
-        areas = []
-        centers = []
-        for (x, y, w, h) in motion_boxes:
-            w = max(1, int(w))
-            h = max(1, int(h))
-            area = w * h
-            cx = int(x + w / 2)
-            cy = int(y + h / 2)
-            areas.append(area)
-            centers.append((cx, cy))
-
-        total_area = sum(areas)
-        if total_area <= 0:
-
-            i = int(np.argmax(np.array(areas))) if areas else 0
-            return centers[i] if centers else (width // 2, height // 2)
-
-        wx = sum(c[0] * a for c, a in zip(centers, areas)) / total_area
-        wy = sum(c[1] * a for c, a in zip(centers, areas)) / total_area
-
-        return (int(round(wx)), int(round(wy)))
-
+    def snapshot(self) -> dict:
+        """JSON-serialisable tracking state, for checkpoints."""
+        def point(p):
+            return None if p is None else [int(v) for v in p]
+
+        return {
+            "size": list(self.size),
+            "state": self.state.value,
+            "center": point(self.current_viewport_center),
+            "last_roi": point(self.last_roi),
+            "smoothing_buffer": [point(p) for p in self.smoothing_buffer],
+            "ema_center": None if self._ema_center is None else [float(v) for v in self._ema_center],
+            "motion_on": self._motion_on_count,
+            "motion_off": self._motion_off_count,
+        }
+
+    def restore(self, state: dict):
+        """Continue from a snapshot() taken by an earlier run."""
+        def point(p):
+            return None if p is None else tuple(int(v) for v in p)
+
+        self.size = tuple(state["size"])
+        self.state = ViewportState(state["state"])
+        self.current_viewport_center = point(state["center"])
+        self.last_roi = point(state["last_roi"])
+        self.smoothing_buffer.clear()
+        self.smoothing_buffer.extend(point(p) for p in state["smoothing_buffer"])
+        ema = state["ema_center"]
+        self._ema_center = None if ema is None else np.array(ema, dtype=np.float32)
+        self._motion_on_count = int(state["motion_on"])
+        self._motion_off_count = int(state["motion_off"])
 
     def update_state(self, motion_boxes):
         """
@@ -156,7 +144,7 @@ class ViewportCalculatorProcess(Process):
     def clamp_viewport(self, viewport_center, frame_shape):
         x, y = viewport_center
         height, width = frame_shape[:2]
-        vp_w, vp_h = int(self.config.viewport_width), int(self.config.viewport_height)
+        vp_w, vp_h = min(self.size[0], width), min(self.size[1], height)
 
         # Clamp so that the viewport rectangle stays fully inside the frame
         x = max(vp_w // 2, min(int(x), width - vp_w // 2))
@@ -164,6 +152,280 @@ class ViewportCalculatorProcess(Process):
 
         return (x, y)
 
+    def update(self, motion_boxes, roi_center, frame_shape):
+        """Advance one frame with this viewport's motion boxes and ROI; returns the new center."""
+        if self.current_viewport_center is None:
+            if frame_shape is not None:
+                h, w = frame_shape[:2]
+                self.current_viewport_center = (w // 2, h // 2)
+                if self.fit_frame:
+                    scale = min(1.0, w / self.size[0], h / self.size[1])
+                    self.size = (int(self.size[0] * scale), int(self.size[1] * scale))
+            else:
+                self.current_viewport_center = (0, 0)
+
+        self.update_state(motion_boxes)
+        if motion_boxes:
+            self.last_roi = roi_center
+
+        if self.state == ViewportState.TRACKING:
+            raw_center = roi_center
+        else:
+            raw_center = self.current_viewport_center
+
+        with self.metrics.timer("smooth_viewport"):
+            smoothed_center = self.smooth_viewport(raw_center)
+
+        if frame_shape is not None:
+            clamped_center = self.clamp_viewport(smoothed_center, frame_shape)
+        else:
+            clamped_center = smoothed_center
+
+        self.current_viewport_center = clamped_center
+        return clamped_center
+
+
+def cluster_motion_boxes(motion_boxes, k: int, span: tuple, iterations: int = 10) -> list:
+    """
+    Split motion boxes into at most k spatial clusters.
+
+    Area-weighted k-means on box centers, in units of span (the viewport
+    size), seeded farthest-first from the largest box. A box only seeds a
+    new cluster if it falls outside a span-sized window around every
+    existing seed, so action one viewport can frame is not split. Returns
+    (boxes, (cx, cy)) per cluster, largest total area first.
+    """
+    if not motion_boxes or k < 1:
+        return []
+
+    flat = np.asarray(motion_boxes, dtype=np.float64).reshape(-1, 4)
+    w = np.maximum(1, flat[:, 2].astype(np.int64))
+    h = np.maximum(1, flat[:, 3].astype(np.int64))
+    areas = (w * h).astype(np.float64)
+    centers = np.stack([(flat[:, 0] + w / 2).astype(np.int64), (flat[:, 1] + h / 2).astype(np.int64)], axis=1)
+    points = centers / np.maximum(1.0, np.asarray(span, dtype=np.float64))
+
+    seeds = [int(np.argmax(areas))]
+    # Chebyshev distance: > 0.5 means outside a span-sized window around the seed
+    nearest = np.abs(points - points[seeds[0]]).max(axis=1)
+    while len(seeds) < k:
+        i = int(np.argmax(nearest))
+        if nearest[i] <= 0.5:
+            break
+        seeds.append(i)
+        nearest = np.minimum(nearest, np.abs(points - points[i]).max(axis=1))
+
+    means = points[seeds]
+    labels = np.zeros(len(points), dtype=np.int64)
+    for _ in range(iterations):
+        labels = ((points[:, None, :] - means[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        weight = np.bincount(labels, weights=areas, minlength=len(means))
+        updated = means.copy()
+        for axis in range(2):
+            sums = np.bincount(labels, weights=points[:, axis] * areas, minlength=len(means))
+            updated[:, axis] = np.where(weight > 0, sums / np.maximum(weight, 1e-12), means[:, axis])
+        if np.allclose(updated, means):
+            break
+        means = updated
+
+    clusters = []
+    for j in range(len(means)):
+        members = np.flatnonzero(labels == j)
+        if len(members) == 0:
+            continue
+        total = areas[members].sum()
+        cx = int(round(float(centers[members, 0] @ areas[members]) / total))
+        cy = int(round(float(centers[members, 1] @ areas[members]) / total))
+        clusters.append((total, [motion_boxes[i] for i in members], (cx, cy)))
+    clusters.sort(key=lambda c: -c[0])
+    return [(boxes, center) for _, boxes, center in clusters]
+
+
+class ViewportCalculatorProcess(Process):
+    """Process that calculates viewport position with state machine and smoothing."""
+
+    def __init__(
+        self,
+        input_queue,
+        output_queue,
+        config: PipelineConfig,
+        transport=None,
+        recorder=None,
+        metrics=None,
+        checkpoint_interval: float = 0.0,
+        resume=None,
+        feedback=None,
+    ):
+        super().__init__()
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.config = config
+        self.transport = transport or InlineFrameTransport()
+        self.recorder = recorder  # Optional DetectionRecorder (detection cache)
+        self.metrics = metrics or StageMetrics("viewport")
+        self.feedback = feedback  # ViewportFeedback for viewport-guided detection ([roi] enabled)
+        # Checkpoints: attach tracking state to a frame every checkpoint_interval source seconds
+        self.checkpoint_interval = float(checkpoint_interval)
+        self._next_checkpoint = None
+        self.reset()
+        # Resuming from a Checkpoint: frames up to resume_frame_id are already written
+        self.resume_frame_id = None
+        if resume is not None:
+            self.restore(resume.viewport)
+            self.resume_frame_id = resume.frame_id
+
+    def reset(self):
+        """Forget all tracking state (start of a new clip)."""
+        count = max(1, int(getattr(self.config, "viewport_count", 1)))
+        self.trackers = [
+            ViewportTracker(self.config, "viewport" if i == 0 else f"viewport_{i}", metrics=self.metrics)
+            for i in range(count)
+        ]
+        self.wide = None
+        if getattr(self.config, "viewport_wide", False):
+            size = (
+                int(self.config.wide_width) or 2 * int(self.config.viewport_width),
+                int(self.config.wide_height) or 2 * int(self.config.viewport_height),
+            )
+            self.wide = ViewportTracker(self.config, "wide", size, fit_frame=True, metrics=self.metrics)
+        if self.feedback is not None:
+            self.feedback.reset()
+
+    def snapshot(self) -> dict:
+        """Every tracker's state, for checkpoints."""
+        return {
+            "trackers": [t.snapshot() for t in self.trackers],
+            "wide": self.wide.snapshot() if self.wide is not None else None,
+        }
+
+    def restore(self, state: dict):
+        for tracker, tracker_state in zip(self.trackers, state.get("trackers", [])):
+            tracker.restore(tracker_state)
+        if self.wide is not None and state.get("wide") is not None:
+            self.wide.restore(state["wide"])
+
+    def _checkpoint_due(self, timestamp: float) -> bool:
+        """
+        True on the first frame at or past each multiple of checkpoint_interval
+        in source time; anchored at 0 so a resumed run keeps the same boundaries.
+        """
+        if self.checkpoint_interval <= 0:
+            return False
+        if self._next_checkpoint is None:
+            self._next_checkpoint = (math.floor(timestamp / self.checkpoint_interval) + 1) * self.checkpoint_interval
+            return False
+        if timestamp < self._next_checkpoint:
+            return False
+        while self._next_checkpoint <= timestamp:
+            self._next_checkpoint += self.checkpoint_interval
+        return True
+
+    def assign_clusters(self, motion_boxes) -> list:
+        """
+        Motion boxes for each tracker. Clusters go to the tracker whose last
+        ROI is nearest (so each viewport keeps following the same action);
+        trackers that have not seen motion yet take what is left, largest
+        cluster first.
+        """
+        if len(self.trackers) == 1:
+            return [motion_boxes]
+        primary = self.trackers[0]
+        with self.metrics.timer("cluster"):
+            clusters = cluster_motion_boxes(motion_boxes, len(self.trackers), primary.size)
+
+        assigned = [[] for _ in self.trackers]
+        pairs = sorted(
+            (np.hypot(center[0] - t.last_roi[0], center[1] - t.last_roi[1]), ti, ci)
+            for ti, t in enumerate(self.trackers) if t.last_roi is not None
+            for ci, (_, center) in enumerate(clusters)
+        )
+        taken_t, taken_c = set(), set()
+        for _, ti, ci in pairs:
+            if ti in taken_t or ci in taken_c:
+                continue
+            assigned[ti] = clusters[ci][0]
+            taken_t.add(ti)
+            taken_c.add(ci)
+
+        free = [ci for ci in range(len(clusters)) if ci not in taken_c]
+        for ti, t in enumerate(self.trackers):
+            if free and t.last_roi is None:
+                assigned[ti] = clusters[free.pop(0)][0]
+        return assigned
+
+    def _get_motion_boxes(self, detection_data):
+
+        boxes = getattr(detection_data, "boxes", None)
+        if boxes is None:
+            boxes = getattr(detection_data, "motion_boxes", None)
+        return boxes or []
+
+    def _get_frame_shape(self, detection_data):
+         frame = self.transport.load(detection_data)
+         frame_id = detection_data.frame_id
+         frame_shape = frame.shape if frame is not None and hasattr(frame, "shape") else None
+         return frame_shape, frame_id, frame
+
+
+
+    def heatmap_centroid(self, heatmap, width: int, height: int):
+        """Energy-weighted centroid of a MotionHeatmap's cell centers, or None without motion."""
+        energy = np.asarray(heatmap.energy, dtype=np.float64)
+        total = energy.sum()
+        if total <= 0:
+            return None
+        rows, cols = energy.shape
+        x0, y0 = getattr(heatmap, "origin", (0, 0))
+        xs = np.minimum(x0 + (np.arange(cols) + 0.5) * heatmap.cell_width, width - 1)
+        ys = np.minimum(y0 + (np.arange(rows) + 0.5) * heatmap.cell_height, height - 1)
+        wx = energy.sum(axis=0) @ xs / total
+        wy = energy.sum(axis=1) @ ys / total
+        return (int(round(wx)), int(round(wy)))
+
+    def calculate_roi(self, motion_boxes, frame_shape, heatmap=None, fallback=None):
+        """
+        Calculate region of interest from motion boxes.
+
+        Strategy implemented:
+        - If a motion heatmap is given: centroid of its motion energy
+        - If no boxes: center of frame
+        - Otherwise: weighted centroid of all boxes by area
+          (falls back to largest box if something is off)
+        """
+        if frame_shape is None:
+            return fallback or (0, 0)
+
+        height, width = frame_shape[:2]
+
+        if heatmap is not None:
+            center = self.heatmap_centroid(heatmap, width, height)
+            return center if center is not None else (width // 2, height // 2)
+
+        if not motion_boxes:
+            return (width // 2, height // 2)
+
+        areas = []
+        centers = []
+        for (x, y, w, h) in motion_boxes:
+            w = max(1, int(w))
+            h = max(1, int(h))
+            area = w * h
+            cx = int(x + w / 2)
+            cy = int(y + h / 2)
+            areas.append(area)
+            centers.append((cx, cy))
+
+        total_area = sum(areas)
+        if total_area <= 0:
+
+            i = int(np.argmax(np.array(areas))) if areas else 0
+            return centers[i] if centers else (width // 2, height // 2)
+
+        wx = sum(c[0] * a for c, a in zip(centers, areas)) / total_area
+        wy = sum(c[1] * a for c, a in zip(centers, areas)) / total_area
+
+        return (int(round(wx)), int(round(wy)))
+
 
     def run(self):
         """
@@ -182,52 +444,63 @@ class ViewportCalculatorProcess(Process):
 
         while True:
             try:
-                detection_data = self.input_queue.get(timeout=self.config.queue_timeout)
+                detection_data = self.metrics.get(self.input_queue, timeout=self.config.queue_timeout)
                 
             except Empty:
                 continue
             # print(detection_data)
 
             if detection_data is None:
+                if self.recorder is not None:
+                    self.recorder.finish(lost=frames_lost(self.input_queue))
                 try:
                     self.output_queue.put(None, timeout=self.config.queue_timeout)
                 except Exception:
                     pass
                 break
 
-            motion_boxes = self._get_motion_boxes(detection_data)
-            frame_shape , frame_id , frame = self._get_frame_shape(detection_data)
-
-
-            if self.current_viewport_center is None:
-                if frame_shape is not None:
-                    h, w = frame_shape[:2]
-                    self.current_viewport_center = (w // 2, h // 2)
-                else:
-                    self.current_viewport_center = (0, 0)
-
-     
-            self.update_state(motion_boxes)
-
+            if isinstance(detection_data, ClipMarker):
+                self.reset()
+                self.metrics.put(self.output_queue, detection_data)
+                continue
 
-            roi_center = self.calculate_roi(motion_boxes, frame_shape)
+            if self.resume_frame_id is not None and detection_data.frame_id <= self.resume_frame_id:
+                # Written before the restart; it only primed the detector
+                self.transport.release(detection_data)
+                continue
 
+            if self.recorder is not None:
+                self.recorder.record(detection_data)
 
-            if self.state == ViewportState.TRACKING:
-                raw_center = roi_center
-            else:
-                raw_center = self.current_viewport_center
+            start = time.perf_counter()
+            motion_boxes = self._get_motion_boxes(detection_data)
+            frame_shape , frame_id , frame = self._get_frame_shape(detection_data)
 
 
-            smoothed_center = self.smooth_viewport(raw_center)
+            heatmap = getattr(detection_data, "motion_heatmap", None)
+            views = []
+            # The motion heatmap covers all motion, so only a single viewport can use it
+            for tracker, boxes in zip(self.trackers, self.assign_clusters(motion_boxes)):
+                roi_center = self.calculate_roi(
+                    boxes, frame_shape, heatmap if len(self.trackers) == 1 else None, tracker.current_viewport_center
+                )
+                views.append(ViewportView(tracker.name, tracker.update(boxes, roi_center, frame_shape), tracker.size))
 
+            if self.wide is not None:
+                roi_center = self.calculate_roi(motion_boxes, frame_shape, heatmap, self.wide.current_viewport_center)
+                views.append(ViewportView(self.wide.name, self.wide.update(motion_boxes, roi_center, frame_shape), self.wide.size))
 
-            if frame_shape is not None:
-                clamped_center = self.clamp_viewport(smoothed_center, frame_shape)
-            else:
-                clamped_center = smoothed_center
+            clamped_center = views[0].center
 
-            self.current_viewport_center = clamped_center
+            if self.feedback is not None:
+                # Tell the detector where to look next: the box around the tracked viewports
+                tracked = views[:len(self.trackers)]
+                self.feedback.publish(detection_data.timestamp, (
+                    min(v.center[0] - v.size[0] / 2 for v in tracked),
+                    min(v.center[1] - v.size[1] / 2 for v in tracked),
+                    max(v.center[0] + v.size[0] / 2 for v in tracked),
+                    max(v.center[1] + v.size[1] / 2 for v in tracked),
+                ))
 
 
             frame_id = getattr(detection_data, "frame_id", None)
@@ -235,28 +508,25 @@ class ViewportCalculatorProcess(Process):
 
             vp = ViewportData(
             frame_id=frame_id,
-            frame=frame,
+            frame=detection_data.frame,
             viewport_center=clamped_center,  # (x, y)
             viewport_size=(int(self.config.viewport_width), int(self.config.viewport_height)),
+            slot=detection_data.slot,
+            created_at=detection_data.created_at,
+            viewports=views if len(views) > 1 else None,
+            checkpoint=self.snapshot() if self._checkpoint_due(detection_data.timestamp) else None,
+            seq=getattr(detection_data, "seq", None),
+            timestamp=detection_data.timestamp,
             )
-            
-            try:
-                self.output_queue.put(vp, timeout=self.config.queue_timeout)
-            except Full:
-                pass
-            
-            if vp is None:
 
-                try:
-                    vp = ViewportData(frame_id,frame , clamped_center[0], clamped_center[1])
-                except Exception as e:
-                    print("ViewportCalculatorProcess: ERROR creating ViewportData:", e)
-                    continue
+            self.metrics.observe("processing", time.perf_counter() - start)
 
+            # vp takes over detection_data's shared-memory reference; it is queued exactly once
             try:
-                self.output_queue.put(vp, timeout=self.config.queue_timeout)
+                self.metrics.put(self.output_queue, vp, timeout=self.config.queue_timeout)
             except Full:
-    
-                pass
+                self.transport.release(vp)
+                self.metrics.drop("queue_full")
 
+        self.metrics.close()
         print("ViewportCalculatorProcess: Finished viewport calculation")
@@ -0,0 +1,415 @@
+# pipeline/writer_engine.py
+"""
+Asynchronous output encoding for OutputWriterProcess.
+
+JPEG stills are encoded on a thread pool (cv2.imwrite releases the GIL) with a
+bound on the number of writes in flight. Video frames go through a single
+dedicated thread so every MP4 stays in frame order. Videos are encoded with
+cv2.VideoWriter (mp4v) or, with the ffmpeg backend, streamed as raw frames
+to an ffmpeg subprocess (x264/x265/..., optionally as HLS segments).
+
+With a StageMetrics, every cv2.imwrite and video frame write is timed
+("imwrite", "video_write") once the process has fine timers enabled.
+
+With checkpointing, videos are written as numbered part files that flush()
+closes at each checkpoint, so everything up to the checkpoint is a playable
+file even if the process is killed; concat_videos joins them at the end.
+
+With fill_gaps, the video thread holds on to each video's last frame (its
+done() is deferred until the next frame replaces it), so write_video can
+repeat it to fill output slots the source skipped and keep video timing
+fixed while the backpressure controller lowers the frame rate.
+"""
+
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from hometeamproj.pipeline.metrics import StageMetrics
+
+
+@dataclass(frozen=True)
+class OutputProfile:
+    """Which outputs OutputWriterProcess produces."""
+
+    viewport_video: bool = True
+    overlay_video: bool = False  # full frame with the viewport rectangle drawn on
+    viewport_stills: bool = False
+    overlay_stills: bool = False
+
+    @property
+    def needs_overlay(self) -> bool:
+        return self.overlay_video or self.overlay_stills
+
+
+OUTPUT_PROFILES = {
+    # Production: just the cropped viewport video
+    "viewport": OutputProfile(),
+    # Viewport video plus a JPEG per cropped frame
+    "stills": OutputProfile(viewport_stills=True),
+    # Everything, including the full-frame overlay video and stills
+    "debug": OutputProfile(overlay_video=True, viewport_stills=True, overlay_stills=True),
+}
+
+
+# Most to least expensive; the backpressure controller steps down this ladder
+PROFILE_LADDER = ("debug", "stills", "viewport")
+
+
+def degrade_output_profile(name: str, steps: int) -> str:
+    """Profile `steps` rungs cheaper than `name` (never past the cheapest)."""
+    name = str(name).lower()
+    if steps <= 0 or name not in PROFILE_LADDER:
+        return name
+    return PROFILE_LADDER[min(len(PROFILE_LADDER) - 1, PROFILE_LADDER.index(name) + steps)]
+
+
+def resolve_output_profile(name: str) -> OutputProfile:
+    profile = OUTPUT_PROFILES.get(str(name).lower())
+    if profile is None:
+        print(f"resolve_output_profile: unknown profile '{name}', using debug")
+        profile = OUTPUT_PROFILES["debug"]
+    return profile
+
+
+@dataclass(frozen=True)
+class FfmpegOptions:
+    """Encoder settings for the ffmpeg video backend ([output] ffmpeg_*, segment*)."""
+
+    binary: str = "ffmpeg"
+    codec: str = "libx264"
+    preset: str = "veryfast"
+    crf: int = 23
+    threads: int = 0  # 0 = let ffmpeg decide
+    segment: str = ""  # "" = single file, "hls" = playlist + segments
+    segment_seconds: float = 2.0
+    segment_type: str = "fmp4"  # fmp4 | mpegts
+
+    @classmethod
+    def from_config(cls, config) -> "FfmpegOptions":
+        segment = str(getattr(config, "output_segment", "")).lower()
+        return cls(
+            binary=getattr(config, "ffmpeg_bin", "ffmpeg"),
+            codec=config.ffmpeg_codec,
+            preset=config.ffmpeg_preset,
+            crf=int(config.ffmpeg_crf),
+            threads=int(config.ffmpeg_threads),
+            segment="" if segment in ("", "none") else segment,
+            segment_seconds=float(config.segment_seconds),
+            segment_type=config.segment_type,
+        )
+
+
+class FfmpegVideoWriter:
+    """cv2.VideoWriter look-alike that pipes raw BGR frames into ffmpeg's stdin."""
+
+    def __init__(self, path: str, fps: float, size: tuple, options: FfmpegOptions):
+        w, h = size
+        cmd = [
+            options.binary, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", f"{fps:g}", "-i", "-",
+            # yuv420p needs even dimensions
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-c:v", options.codec, "-preset", options.preset, "-crf", str(options.crf), "-pix_fmt", "yuv420p",
+        ]
+        if options.threads > 0:
+            cmd += ["-threads", str(options.threads)]
+
+        if options.segment == "hls":
+            # Playlist and segments appear as encoding progresses, so readers can start early
+            os.makedirs(path, exist_ok=True)
+            ext = "m4s" if options.segment_type == "fmp4" else "ts"
+            cmd += [
+                "-f", "hls", "-hls_time", f"{options.segment_seconds:g}", "-hls_list_size", "0",
+                "-hls_playlist_type", "event", "-hls_segment_type", options.segment_type,
+                "-hls_segment_filename", os.path.join(path, f"segment_%05d.{ext}"),
+            ]
+            if options.segment_type == "fmp4":
+                cmd += ["-hls_fmp4_init_filename", "init.mp4"]
+            cmd.append(os.path.join(path, "index.m3u8"))
+        elif options.segment:
+            raise ValueError(f"unknown output segment format '{options.segment}' (expected none or hls)")
+        else:
+            cmd += ["-movflags", "+faststart", path]
+
+        self.path = path
+        try:
+            self._process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        except OSError:
+            if options.segment and not os.listdir(path):
+                os.rmdir(path)  # Don't leave an empty playlist directory behind
+            raise
+        self._broken = False
+
+    def isOpened(self) -> bool:
+        return not self._broken and self._process.poll() is None
+
+    def write(self, image):
+        if self._broken:
+            return
+        try:
+            self._process.stdin.write(np.ascontiguousarray(image).data)
+        except (BrokenPipeError, OSError) as e:
+            print(f"FfmpegVideoWriter: ffmpeg exited while writing {self.path}: {e}")
+            self._broken = True
+
+    def release(self):
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        code = self._process.wait()
+        if code != 0:
+            print(f"FfmpegVideoWriter: ffmpeg exited with status {code} for {self.path}")
+
+
+class WriterEngine:
+    """Thread-pooled JPEG writes and ordered video writes for one output directory."""
+
+    def __init__(
+        self,
+        output_dir: str,
+        fps: float,
+        encode_threads: int = 4,
+        max_inflight: int = 16,
+        ffmpeg: FfmpegOptions = None,
+        part: int = None,
+        metrics=None,
+        fill_gaps: bool = False,
+    ):
+        self.output_dir = output_dir
+        self.fps = max(1.0, float(fps))
+        self.fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+        self.ffmpeg = ffmpeg  # None = cv2.VideoWriter
+        self.part = part  # None = one file per video, else the current part number
+        self.metrics = metrics or StageMetrics("writer")  # fine timers; observe() is thread-safe
+
+        self._pool = ThreadPoolExecutor(max_workers=max(1, encode_threads), thread_name_prefix="jpeg")
+        self._inflight = threading.BoundedSemaphore(max(1, max_inflight))
+
+        self._video_items = queue.Queue(maxsize=max(1, max_inflight))
+        self._video_writers = {}
+        self.fill_gaps = fill_gaps
+        self._last_frames = {}  # fill_gaps: name -> (image, done) of the last frame written
+        self._video_thread = threading.Thread(target=self._video_loop, name="video-writer", daemon=True)
+        self._video_thread.start()
+
+        self._lock = threading.Lock()
+        self._stills_done = threading.Condition(self._lock)
+        self._pending_stills = 0
+        self.stills_written = 0
+        self.stills_failed = 0
+        self.video_frames_written = 0
+        self.video_frames_dropped = 0
+        self.video_frames_repeated = 0
+        self.video_failed = False  # set by the video thread; later frames are dropped
+
+    def video_path(self, name: str) -> str:
+        """output_<name>.mp4, or the output_<name>/ playlist directory for HLS."""
+        if self.ffmpeg is not None and self.ffmpeg.segment:
+            return os.path.join(self.output_dir, f"output_{name}")
+        if self.part is not None:
+            return video_part_path(self.output_dir, name, self.part)
+        return os.path.join(self.output_dir, f"output_{name}.mp4")
+
+    def _open_video(self, name: str, size: tuple):
+        if self.ffmpeg is not None:
+            try:
+                return FfmpegVideoWriter(self.video_path(name), self.fps, size, self.ffmpeg)
+            except OSError as e:
+                print(f"WriterEngine: could not start {self.ffmpeg.binary} ({e}), falling back to OpenCV")
+                self.ffmpeg = None
+        return cv2.VideoWriter(self.video_path(name), self.fourcc, self.fps, size)
+
+    def write_still(self, path: str, image, done=None):
+        """
+        Queue a JPEG write. Blocks while max_inflight writes are pending.
+        done(image) is called once the write no longer needs the image.
+        """
+        self._inflight.acquire()
+        with self._lock:
+            self._pending_stills += 1
+        try:
+            self._pool.submit(self._imwrite, path, image, done)
+        except Exception:
+            self._inflight.release()
+            with self._lock:
+                self._pending_stills -= 1
+            raise
+
+    def write_video(self, name: str, image, done=None, repeat: int = 0):
+        """
+        Append a frame to output_<name>.mp4, in submission order; done(image)
+        as for write_still. With fill_gaps, the video's previous frame is
+        written `repeat` more times first.
+        """
+        if self.video_failed:
+            with self._lock:
+                self.video_frames_dropped += 1
+            if done is not None:
+                done(image)
+            return
+        self._video_items.put((name, image, done, repeat))
+
+    def _imwrite(self, path, image, done=None):
+        try:
+            with self.metrics.timer("imwrite"):
+                ok = cv2.imwrite(path, image)
+        except cv2.error:
+            ok = False
+        finally:
+            self._inflight.release()
+            if done is not None:
+                done(image)
+            with self._lock:
+                self._pending_stills -= 1
+                self._stills_done.notify_all()
+
+        with self._lock:
+            if ok:
+                self.stills_written += 1
+            else:
+                self.stills_failed += 1
+        if not ok:
+            print("WriterEngine: imwrite failed:", path)
+
+    def _video_loop(self):
+        # Keeps draining after a failure, so write_video() and flush() never block on a dead thread
+        while True:
+            item = self._video_items.get()
+            if item is None:
+                break
+            name, image, done, repeat = item
+            try:
+                if name is None:
+                    # flush(): close this part's files and start the next part
+                    self._release_videos()
+                    self.part += 1
+                elif self.video_failed:
+                    with self._lock:
+                        self.video_frames_dropped += 1
+                else:
+                    self._write_video(name, image, repeat)
+            except Exception as e:
+                print(f"WriterEngine: video output failed, dropping further video frames: {e!r}")
+                self.video_failed = True
+                if name is not None:
+                    with self._lock:
+                        self.video_frames_dropped += 1
+            finally:
+                if name is not None and self.fill_gaps and not self.video_failed:
+                    # Keep this frame for the next gap and let go of the one it replaces
+                    held = (image, done)
+                    image, done = self._last_frames.get(name, (None, None))
+                    self._last_frames[name] = held
+                if done is not None:
+                    done(image)
+
+        self._release_videos()
+        for image, done in self._last_frames.values():
+            if done is not None:
+                done(image)
+        self._last_frames = {}
+
+    def _write_video(self, name: str, image, repeat: int = 0):
+        writer = self._video_writers.get(name)
+        if writer is None:
+            h, w = image.shape[:2]
+            writer = self._open_video(name, (w, h))
+            print(f"WriterEngine: {name} writer opened =", writer.isOpened())
+            self._video_writers[name] = writer
+
+        previous = self._last_frames.get(name, (None, None))[0]
+        repeat = repeat if previous is not None else 0
+        with self.metrics.timer("video_write"):
+            for _ in range(repeat):
+                writer.write(previous)
+            writer.write(image)
+        self.video_frames_written += 1
+        self.video_frames_repeated += repeat
+
+    def _release_videos(self):
+        writers, self._video_writers = self._video_writers, {}
+        for writer in writers.values():
+            try:
+                writer.release()
+            except Exception as e:
+                print(f"WriterEngine: could not finish {getattr(writer, 'path', 'video')}: {e!r}")
+
+    def flush(self):
+        """
+        Wait for every pending still and, when writing parts, finish the
+        current video part files. Everything submitted so far is on disk
+        once this returns.
+        """
+        with self._lock:
+            while self._pending_stills:
+                self._stills_done.wait()
+        if self.part is not None:
+            rolled = threading.Event()
+            self._video_items.put((None, None, lambda _: rolled.set(), 0))
+            rolled.wait()
+
+    def close(self):
+        """Wait for all pending writes and release the video writers."""
+        self._pool.shutdown(wait=True)
+        self._video_items.put(None)
+        self._video_thread.join()
+        print(
+            f"WriterEngine: {self.stills_written} stills written, {self.stills_failed} failed, "
+            f"{self.video_frames_written} video frames written ({self.video_frames_repeated} repeats to fill gaps), "
+            f"{self.video_frames_dropped} dropped"
+        )
+
+
+def video_part_path(output_dir: str, name: str, part: int) -> str:
+    """output_<name>.partNNNN.mp4: one checkpointed stretch of a video."""
+    return os.path.join(output_dir, f"output_{name}.part{part:04d}.mp4")
+
+
+def concat_videos(paths: list, out_path: str, config) -> None:
+    """Join videos end to end: ffmpeg stream copy when available, else re-encode with OpenCV."""
+    paths = [p for p in paths if os.path.exists(p)]
+    if not paths:
+        return
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        for p in paths:
+            f.write(f"file '{os.path.abspath(p)}'\n")
+        list_path = f.name
+    try:
+        cmd = [
+            config.ffmpeg_bin, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", out_path,
+        ]
+        try:
+            if subprocess.run(cmd).returncode == 0:
+                return
+            print(f"concat_videos: ffmpeg concat failed for {out_path}, re-encoding with OpenCV")
+        except OSError:
+            pass
+    finally:
+        os.remove(list_path)
+
+    writer = None
+    for p in paths:
+        cap = cv2.VideoCapture(p)
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if writer is None:
+                h, w = frame.shape[:2]
+                fps = cap.get(cv2.CAP_PROP_FPS) or float(config.target_fps)
+                writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+            writer.write(frame)
+        cap.release()
+    if writer is not None:
+        writer.release()
@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+from hometeamproj.pipeline.delivery import SequenceTracker
+
+
+def _item(seq):
+    return SimpleNamespace(seq=seq)
+
+
+def _seqs(items):
+    return [getattr(i, "seq", i) for i in items]
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.released = []
+
+    def release(self, item):
+        self.released.append(item.seq)
+
+
+def test_in_order_frames_pass_straight_through():
+    tracker = SequenceTracker("q")
+    assert [_seqs(tracker.accept(_item(s))) for s in (5, 6, 7)] == [[5], [6], [7]]
+    assert (tracker.delivered, tracker.missing, tracker.gaps) == (3, 0, 0)
+
+
+def test_duplicates_and_late_frames_are_dropped_and_released():
+    transport = RecordingTransport()
+    tracker = SequenceTracker("q", transport=transport)
+    tracker.accept(_item(0))
+    tracker.accept(_item(1))
+
+    assert tracker.accept(_item(1)) == []
+    assert tracker.accept(_item(0)) == []
+    assert tracker.duplicates == 2
+    assert transport.released == [1, 0]
+
+
+def test_gap_is_reported_at_once_without_a_window():
+    tracker = SequenceTracker("q")
+    tracker.accept(_item(0))
+    assert _seqs(tracker.accept(_item(3))) == [3]
+    assert (tracker.missing, tracker.gaps) == (2, 1)
+    # The skipped frames count as late if they turn up after all
+    assert tracker.accept(_item(1)) == []
+
+
+def test_window_reorders_frames_that_arrive_out_of_order():
+    tracker = SequenceTracker("q", window=2)
+    tracker.accept(_item(0))
+    assert tracker.accept(_item(2)) == []
+    assert _seqs(tracker.accept(_item(1))) == [1, 2]
+    assert (tracker.missing, tracker.max_waiting) == (0, 1)
+
+
+def test_window_gives_up_once_it_is_exceeded():
+    tracker = SequenceTracker("q", window=2)
+    tracker.accept(_item(0))
+    assert tracker.accept(_item(2)) == []
+    assert tracker.accept(_item(3)) == []
+    assert _seqs(tracker.accept(_item(4))) == [2, 3, 4]
+    assert (tracker.missing, tracker.gaps) == (1, 1)
+
+
+def test_flush_releases_everything_waiting_in_order():
+    tracker = SequenceTracker("q", window=5)
+    tracker.accept(_item(0))
+    for s in (4, 2):
+        tracker.accept(_item(s))
+    assert _seqs(tracker.flush()) == [2, 4]
+    assert (tracker.missing, tracker.gaps) == (2, 2)
+
+
+def test_items_without_seq_flush_but_keep_the_sequence():
+    tracker = SequenceTracker("q", window=5)
+    tracker.accept(_item(0))
+    tracker.accept(_item(2))
+    batch = SimpleNamespace(frames=[])
+    assert _seqs(tracker.accept(batch)) == [2, batch]
+    assert tracker.accept(_item(1)) == []  # still the same sequence: late
+
+
+def test_clip_marker_and_sentinel_start_a_new_sequence(capsys):
+    tracker = SequenceTracker("q")
+    tracker.accept(_item(10))
+    marker = SimpleNamespace(clip_id=1)
+    assert tracker.accept(marker) == [marker]
+    assert _seqs(tracker.accept(_item(0))) == [0]
+
+    assert tracker.accept(None) == [None]
+    assert "SequenceTracker[q]: 2 frames delivered" in capsys.readouterr().out
+    assert _seqs(tracker.accept(_item(0))) == [0]
+    assert tracker.duplicates == 0
@@ -0,0 +1,111 @@
+from dataclasses import replace
+from types import SimpleNamespace
+
+import pytest
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline import detection_cache
+from hometeamproj.pipeline.detection_cache import (
+    DetectionCache,
+    DetectionRecorder,
+    detection_cache_key,
+    frames_lost,
+    uncacheable_reason,
+)
+from hometeamproj.pipeline.queue_manager import DetectionData
+
+
+@pytest.fixture
+def config():
+    return PipelineConfig.from_file("missing.ini")
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"not really a video")
+    return str(path)
+
+
+def test_key_is_stable_for_the_same_video_and_settings(config, video):
+    assert detection_cache_key(video, config) == detection_cache_key(video, replace(config))
+
+
+def test_key_ignores_viewport_settings(config, video):
+    assert detection_cache_key(video, config) == detection_cache_key(video, replace(config, viewport_width=99))
+
+
+def test_key_changes_with_detection_settings(config, video):
+    key = detection_cache_key(video, config)
+    assert detection_cache_key(video, replace(config, detection_threshold=40.0)) != key
+    assert detection_cache_key(video, replace(config, detection_scale=0.5)) != key
+    assert detection_cache_key(video, replace(config, detection_backend="blocks")) != key
+
+
+def test_key_ignores_the_unused_blur_size(config, video):
+    assert detection_cache_key(video, config) == detection_cache_key(video, replace(config, gaussian_blur_size=21))
+
+
+def test_key_follows_the_resolved_decode_mode(config, video):
+    # 30 fps fallback at target_fps 5: skip interval 6
+    grab = replace(config, target_fps=5, decode_mode="grab")
+    assert detection_cache_key(video, grab) != detection_cache_key(video, replace(grab, decode_mode="seek"))
+    # auto resolves to grab below seek_min_skip
+    assert detection_cache_key(video, grab) == detection_cache_key(video, replace(grab, decode_mode="auto"))
+
+
+def test_key_follows_the_resolved_backend(config, video, monkeypatch):
+    mv = replace(config, detection_backend="motion_vectors")
+    # Stream mode (or no PyAV) falls back to contours and must share its entry
+    assert detection_cache_key(video, mv) == detection_cache_key(video, config)
+    monkeypatch.setattr(detection_cache, "motion_vectors_available", lambda: False)
+    assert detection_cache_key(video, mv, offline=True) == detection_cache_key(video, config, offline=True)
+    monkeypatch.setattr(detection_cache, "motion_vectors_available", lambda: True)
+    assert detection_cache_key(video, mv, offline=True) != detection_cache_key(video, config, offline=True)
+
+
+def test_key_changes_with_video_content(config, video, tmp_path):
+    other = tmp_path / "other.mp4"
+    other.write_bytes(b"different bytes")
+    assert detection_cache_key(video, config) != detection_cache_key(str(other), config)
+
+
+def test_save_load_round_trip(tmp_path):
+    cache = DetectionCache(str(tmp_path / "cache"), "k")
+    assert not cache.exists()
+    cache.save([(0, 0.0, []), (6, 0.2, [(1, 2, 3, 4), (5, 6, 7, 8)]), (12, 0.4, [(0, 0, 10, 10)])])
+
+    assert cache.exists()
+    assert cache.load() == {
+        0: (0.0, []),
+        6: (0.2, [(1, 2, 3, 4), (5, 6, 7, 8)]),
+        12: (0.4, [(0, 0, 10, 10)]),
+    }
+
+
+def test_recorder_saves_a_complete_run(tmp_path):
+    cache = DetectionCache(str(tmp_path), "complete")
+    recorder = DetectionRecorder(cache)
+    recorder.record(DetectionData(frame_id=6, frame=None, motion_boxes=[(1, 1, 2, 2)], timestamp=0.2))
+    recorder.finish()
+    assert cache.load() == {6: (0.2, [(1, 1, 2, 2)])}
+
+
+def test_recorder_refuses_a_run_that_lost_frames(tmp_path):
+    cache = DetectionCache(str(tmp_path), "lossy")
+    recorder = DetectionRecorder(cache)
+    recorder.record(DetectionData(frame_id=6, frame=None, motion_boxes=[], timestamp=0.2))
+    recorder.finish(lost=3)
+    assert not cache.exists()
+
+
+def test_frames_lost_reads_the_queue_tracker():
+    assert frames_lost(object()) == 0
+    assert frames_lost(SimpleNamespace(delivery=SimpleNamespace(missing=2))) == 2
+
+
+def test_runtime_dependent_runs_are_not_cacheable(config):
+    assert uncacheable_reason(config) is None
+    assert uncacheable_reason(replace(config, adaptive_enabled=True))
+    assert uncacheable_reason(replace(config, roi_enabled=True))
+    assert uncacheable_reason(replace(config, detection_heatmap=True))
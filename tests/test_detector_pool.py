@@ -0,0 +1,73 @@
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.detector_pool import DetectionBatch, DetectionReorderProcess
+from hometeamproj.pipeline.queue_manager import ClipMarker, DetectionData
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.released = []
+
+    def release(self, item):
+        self.released.append(item.frame_id)
+
+
+def make_batch(index, frame_ids=None, marker=None):
+    frame_ids = [index] if frame_ids is None else frame_ids
+    detections = [DetectionData(frame_id=i, frame=None, motion_boxes=[]) for i in frame_ids]
+    return DetectionBatch(index=index, detections=detections, marker=marker)
+
+
+def make_reorder(workers=1, transport=None):
+    config = PipelineConfig.from_file("missing.ini")
+    return DetectionReorderProcess(None, None, config, workers=workers, transport=transport)
+
+
+def indices(batches):
+    return [b.index for b in batches]
+
+
+def test_batches_come_out_in_index_order():
+    reorder = make_reorder(workers=2)
+    assert indices(reorder.accept(make_batch(1))) == []
+    assert indices(reorder.accept(make_batch(2))) == []
+    assert indices(reorder.accept(make_batch(0))) == [0, 1, 2]
+    assert indices(reorder.accept(make_batch(3))) == [3]
+    assert reorder.flush() == []
+
+
+def test_slow_chunk_is_waited_for_however_many_are_pending():
+    reorder = make_reorder(workers=1)
+    for index in range(1, 50):
+        assert reorder.accept(make_batch(index)) == []
+    assert indices(reorder.accept(make_batch(0))) == list(range(50))
+    assert reorder.next_index == 50
+    assert "late" not in reorder.metrics.drops
+
+
+def test_repeated_batch_is_dropped_and_released():
+    transport = RecordingTransport()
+    reorder = make_reorder(workers=1, transport=transport)
+    for index in range(3):
+        reorder.accept(make_batch(index))
+
+    assert reorder.accept(make_batch(1, frame_ids=[10, 11])) == []
+    assert transport.released == [10, 11]
+    assert reorder.metrics.drops["late"] == 2
+    assert reorder.flush() == []
+
+
+def test_repeated_batch_still_forwards_its_clip_marker():
+    reorder = make_reorder(workers=1, transport=RecordingTransport())
+    reorder.accept(make_batch(0))
+
+    marker = ClipMarker("clip", "out", end=True)
+    ready = reorder.accept(make_batch(0, marker=marker))
+    assert [b.marker for b in ready] == [marker]
+    assert ready[0].detections == []
+
+
+def test_flush_emits_leftovers_in_order():
+    reorder = make_reorder(workers=4)
+    reorder.accept(make_batch(3))
+    reorder.accept(make_batch(1))
+    assert indices(reorder.flush()) == [1, 3]
@@ -0,0 +1,93 @@
+import time
+from queue import Full
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from hometeamproj.pipeline.delivery import SequenceTracker
+from hometeamproj.pipeline.memory_budget import BudgetedQueue, MemoryBudget, item_nbytes
+
+
+def _frame(nbytes=100, seq=None):
+    return SimpleNamespace(frame=np.zeros(nbytes, dtype=np.uint8), seq=seq)
+
+
+def test_item_nbytes_counts_inline_frames_slots_and_batches():
+    assert item_nbytes(None) == 0
+    assert item_nbytes(_frame(100)) == 100
+    assert item_nbytes(SimpleNamespace(frame=None, slot=3), slot_nbytes=64) == 64
+    assert item_nbytes(SimpleNamespace(frames=[_frame(10), _frame(20)])) == 30
+
+
+def test_acquire_and_release_track_bytes_and_peaks():
+    budget = MemoryBudget(["a", "b"])
+    budget.acquire(0, 100)
+    budget.acquire(1, 50)
+    budget.release(0, 100)
+
+    assert budget.buffered() == {"a": (0, 100), "b": (50, 50), "total": (50, 150)}
+
+
+def test_queue_budget_rejects_once_the_deadline_passes():
+    budget = MemoryBudget(["a"], queue_bytes=150)
+    budget.acquire(0, 100)
+    with pytest.raises(Full):
+        budget.acquire(0, 100, timeout=0.05)
+    assert budget.buffered()["a"] == (100, 100)
+
+
+def test_total_budget_covers_all_queues():
+    budget = MemoryBudget(["a", "b"], total_bytes=150, policy="drop")
+    budget.acquire(0, 100)
+    with pytest.raises(Full):
+        budget.acquire(1, 100, timeout=1.0)
+
+
+def test_drop_policy_does_not_wait_out_the_timeout():
+    budget = MemoryBudget(["a"], queue_bytes=150, policy="drop")
+    budget.acquire(0, 100)
+    start = time.monotonic()
+    with pytest.raises(Full):
+        budget.acquire(0, 100, timeout=5.0)
+    assert time.monotonic() - start < 1.0
+
+
+def test_empty_queue_admits_an_item_larger_than_the_budget():
+    budget = MemoryBudget(["a"], queue_bytes=10, total_bytes=10)
+    budget.acquire(0, 1000)
+    assert budget.buffered()["a"] == (1000, 1000)
+
+
+def test_unknown_policy_falls_back_to_block():
+    assert MemoryBudget(["a"], policy="spill").policy == "block"
+
+
+def test_budgeted_queue_charges_put_and_credits_get():
+    budget = MemoryBudget(["a"], queue_bytes=250, policy="drop")
+    queue = BudgetedQueue("a", budget)
+    queue.put(_frame(100))
+    queue.put(_frame(100))
+    with pytest.raises(Full):
+        queue.put(_frame(100), timeout=0.1)
+    assert budget.buffered()["a"] == (200, 200)
+
+    queue.get(timeout=1.0)
+    queue.get(timeout=1.0)
+    queue.put(None)  # sentinels carry no frame bytes
+    assert queue.get(timeout=1.0) is None
+    assert budget.buffered()["a"] == (0, 200)
+
+
+def test_budgeted_queue_delivers_in_sequence_order():
+    budget = MemoryBudget(["a"])
+    queue = BudgetedQueue("a", budget, delivery=SequenceTracker("a", window=2))
+    for seq in (0, 2, 1, 1):
+        queue.put(_frame(10, seq=seq))
+    queue.put(None)
+
+    got = [queue.get(timeout=1.0) for _ in range(4)]
+    assert [item.seq for item in got[:3]] == [0, 1, 2]
+    assert got[3] is None
+    assert queue.delivery.duplicates == 1
+    assert budget.buffered()["a"] == (0, 40)  # all four were queued before the first get
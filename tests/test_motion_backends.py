@@ -0,0 +1,43 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.buffer_pool import BufferPool
+from hometeamproj.pipeline.motion_backends import BlockMotionBackend, ContourMotionBackend
+
+
+@pytest.fixture
+def config():
+    return replace(PipelineConfig.from_file("missing.ini"), min_motion_area=10)
+
+
+def _frames(shape=(100, 100), change=30):
+    prev = np.zeros(shape, dtype=np.uint8)
+    cur = prev.copy()
+    cur[40:60, 40:60] = change
+    return prev, cur
+
+
+@pytest.mark.parametrize("threshold, expected", [(20.0, 1), (40.0, 0)])
+def test_contours_use_the_configured_threshold(config, threshold, expected):
+    backend = ContourMotionBackend(replace(config, detection_threshold=threshold))
+    boxes, _ = backend.detect(*_frames())
+    assert len(boxes) == expected
+
+
+def test_block_padding_is_cleared_when_the_proxy_shrinks(config):
+    backend = BlockMotionBackend(config, pool=BufferPool())
+    block, rows, cols = backend._grid(np.zeros((100, 100), dtype=np.uint8), 1.0, 1.0)
+
+    prev = np.zeros((100, 100), dtype=np.uint8)
+    cur = prev.copy()
+    cur[96:100, :] = 255
+    assert backend.block_counts(prev, cur, block, rows, cols).sum() == 4 * 100
+
+    # Same padded grid, but rows 97-99 are now padding and must not count
+    still = np.zeros((97, 100), dtype=np.uint8)
+    assert backend._grid(still, 1.0, 1.0) == (block, rows, cols)
+    assert backend.block_counts(still, still, block, rows, cols).sum() == 0
+    assert backend.detect(still, still)[0] == []
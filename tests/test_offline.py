@@ -0,0 +1,36 @@
+import numpy as np
+
+from hometeamproj.pipeline.offline import smooth_trajectory
+
+
+def test_constant_path_is_unchanged():
+    raw = np.tile([[320.0, 180.0]], (50, 1))
+    np.testing.assert_allclose(smooth_trajectory(raw, 5, 0.3), raw)
+
+
+def test_no_smoothing_is_identity():
+    raw = np.random.default_rng(0).uniform(0, 100, size=(20, 2))
+    np.testing.assert_allclose(smooth_trajectory(raw, 1, 1.0), raw)
+
+
+def test_empty_path():
+    assert smooth_trajectory(np.empty((0, 2)), 5, 0.3).shape == (0, 2)
+
+
+def test_smoothing_is_zero_phase():
+    # A symmetric bump stays centred: no lag behind the action
+    x = np.zeros(61)
+    x[25:36] = 100.0
+    raw = np.column_stack([x, x])
+    out = smooth_trajectory(raw, 5, 0.3)
+    np.testing.assert_allclose(out[:, 0], out[::-1, 0], atol=1e-9)
+    assert int(np.argmax(out[:, 0])) == 30
+
+
+def test_smoothing_reduces_jitter_and_keeps_the_mean_level():
+    rng = np.random.default_rng(1)
+    raw = 200.0 + rng.normal(0, 10, size=(200, 2))
+    out = smooth_trajectory(raw, 5, 0.3)
+    assert out.shape == raw.shape
+    assert np.std(np.diff(out, axis=0)) < np.std(np.diff(raw, axis=0)) / 3
+    np.testing.assert_allclose(out.mean(axis=0), raw.mean(axis=0), atol=1.0)
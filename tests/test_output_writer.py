@@ -0,0 +1,28 @@
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.output_writer import OutputWriterProcess
+from hometeamproj.pipeline.queue_manager import ViewportData
+
+
+def make_writer(controls=None):
+    return OutputWriterProcess(None, None, PipelineConfig.from_file("missing.ini"), controls=controls)
+
+
+def repeats(writer, timestamps, fps=5.0):
+    frames = [ViewportData(frame_id=0, frame=None, viewport_center=(0, 0), viewport_size=(1, 1), timestamp=t) for t in timestamps]
+    return [writer._video_repeats(vp, fps) for vp in frames]
+
+
+def test_no_repeats_without_adaptive_control():
+    assert repeats(make_writer(), [0.0, 0.8, 2.0]) == [0, 0, 0]
+
+
+def test_stepped_down_stretches_are_filled_to_the_output_rate():
+    writer = make_writer(controls=object())
+    # 5 fps, then the controller steps down to 2.5 fps, then back up
+    assert repeats(writer, [10.0, 10.2, 10.4, 10.8, 11.2, 11.4]) == [0, 0, 0, 1, 1, 0]
+
+
+def test_frames_faster_than_the_output_rate_are_never_repeated():
+    writer = make_writer(controls=object())
+    # 29.97 fps source at skip 5: slightly faster than 5 fps
+    assert sum(repeats(writer, [k * 5 / 29.97 for k in range(100)])) == 0
@@ -0,0 +1,135 @@
+from dataclasses import replace
+
+import cv2
+import numpy as np
+import pytest
+
+from hometeamproj.config import PipelineConfig
+from hometeamproj.pipeline.sharded import (
+    Shard,
+    merge_shard_outputs,
+    plan_shards,
+    remove_merged_shards,
+    stitch_trajectories,
+)
+
+
+@pytest.fixture
+def config():
+    # 30 fps source at target_fps 5: every 6th frame is kept
+    return replace(
+        PipelineConfig.from_file("missing.ini"),
+        target_fps=5,
+        shard_count=4,
+        shard_warmup_seconds=1.0,
+        shard_min_seconds=10.0,
+    )
+
+
+def test_shards_cover_the_clip_without_overlap(config):
+    shards = plan_shards(3000, 30.0, config)
+
+    assert [s.index for s in shards] == [0, 1, 2, 3]
+    assert shards[0].start == 0 and shards[-1].end is None
+    for prev, cur in zip(shards, shards[1:]):
+        assert prev.end == cur.start
+
+
+def test_boundaries_and_warmup_start_on_kept_frames(config):
+    for shard in plan_shards(3001, 30.0, config):
+        assert shard.start % 6 == 0
+        assert shard.warmup_start % 6 == 0
+        assert shard.warmup_start == max(0, shard.start - 30)
+
+
+def test_short_clips_get_fewer_shards(config):
+    assert len(plan_shards(600, 30.0, config)) == 2
+    assert len(plan_shards(100, 30.0, config)) == 1
+
+
+def test_unknown_length_gets_a_single_shard(config):
+    assert plan_shards(0, 30.0, config) == [Shard(index=0, start=0, end=None, warmup_start=0)]
+
+
+def test_stitch_keeps_each_shards_own_frames():
+    shards = [Shard(0, 0, 12, 0), Shard(1, 12, None, 6)]
+    first = {0: (10, 10), 6: (20, 20), 12: (99, 99)}  # 12 belongs to the second shard
+    second = {12: (30, 30), 18: (40, 40)}
+
+    frame_ids, centers = stitch_trajectories(shards, [first, second])
+
+    assert frame_ids == [0, 6, 12, 18]
+    assert centers.tolist() == [[10, 10], [20, 20], [30, 30], [40, 40]]
+
+
+def test_stitch_cross_fades_the_warmup_overlap():
+    shards = [Shard(0, 0, 18, 0), Shard(1, 18, None, 6)]
+    first = {0: (0, 0), 6: (0, 0), 12: (0, 0)}
+    second = {6: (90, 90), 12: (90, 90), 18: (90, 90)}
+
+    frame_ids, centers = stitch_trajectories(shards, [first, second])
+
+    assert frame_ids == [0, 6, 12, 18]
+    # Weights 1/3 and 2/3 towards the new shard across the two overlap frames
+    assert centers.tolist() == [[0, 0], [30, 30], [60, 60], [90, 90]]
+    assert centers.dtype == np.int64
+
+
+def test_stitch_of_nothing_is_empty():
+    frame_ids, centers = stitch_trajectories([], [])
+    assert frame_ids == [] and centers.shape == (0, 2)
+
+
+def _write_video(path, frames):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 5.0, (16, 16))
+    for _ in range(frames):
+        writer.write(np.zeros((16, 16, 3), dtype=np.uint8))
+    writer.release()
+
+
+def _frame_count(path):
+    cap = cv2.VideoCapture(str(path))
+    count = 0
+    while cap.read()[0]:
+        count += 1
+    cap.release()
+    return count
+
+
+def _shard_outputs(root, names):
+    dirs = []
+    for i in range(2):
+        d = root / f"{i:02d}"
+        for name in names:
+            (d / name).mkdir(parents=True)
+            (d / name / f"{name}_{i:06d}.jpg").write_bytes(b"jpg")
+            _write_video(d / f"output_{name}.mp4", 2)
+        dirs.append(str(d))
+    return dirs
+
+
+def test_merge_joins_every_view_and_removes_the_shards(tmp_path, config):
+    config = replace(config, ffmpeg_bin="no-such-ffmpeg")  # OpenCV re-encode
+    root = tmp_path / "shards"
+    dirs = _shard_outputs(root, ["viewport", "viewport_1"])
+
+    merge_shard_outputs(dirs, str(tmp_path), config)
+    remove_merged_shards(str(root))
+
+    for name in ("viewport", "viewport_1"):
+        assert _frame_count(tmp_path / f"output_{name}.mp4") == 4
+        assert sorted(p.name for p in (tmp_path / name).iterdir()) == [f"{name}_000000.jpg", f"{name}_000001.jpg"]
+    assert not root.exists()
+
+
+def test_unmerged_shard_output_is_kept(tmp_path, config):
+    config = replace(config, ffmpeg_bin="no-such-ffmpeg")
+    root = tmp_path / "shards"
+    dirs = _shard_outputs(root, ["viewport"])
+    (root / "00" / "notes.txt").write_text("not a shard output")
+
+    merge_shard_outputs(dirs, str(tmp_path), config)
+    remove_merged_shards(str(root))
+
+    assert (root / "00" / "notes.txt").exists()
+    assert not (root / "00" / "output_viewport.mp4").exists()
@@ -0,0 +1,65 @@
+from queue import Full
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from hometeamproj.pipeline.shared_frames import SharedFrameRing
+
+
+@pytest.fixture
+def ring():
+    ring = SharedFrameRing(2, (4, 6, 3))
+    yield ring
+    ring.close()
+
+
+def test_store_and_load_round_trip(ring):
+    frame = np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+    payload, slot = ring.store(frame)
+    assert payload is None
+    np.testing.assert_array_equal(ring.load(SimpleNamespace(slot=slot, frame=None)), frame)
+
+
+def test_slot_is_reused_only_after_last_release(ring):
+    frame = np.zeros((4, 6, 3), dtype=np.uint8)
+    _, first = ring.store(frame)
+    _, second = ring.store(frame)
+    assert first != second
+    assert ring.in_use() == 2
+
+    item = SimpleNamespace(slot=first)
+    ring.retain(item)  # A second queued reference
+    ring.release(item)
+    with pytest.raises(Full):
+        ring.store(frame, timeout=0.01)
+
+    ring.release(item)
+    assert ring.in_use() == 1
+    _, reused = ring.store(frame, timeout=0.01)
+    assert reused == first
+
+
+def test_release_never_goes_negative(ring):
+    _, slot = ring.store(np.zeros((4, 6, 3), dtype=np.uint8))
+    item = SimpleNamespace(slot=slot)
+    ring.release(item)
+    ring.release(item)
+    assert ring.in_use() == 0
+    assert ring.acquire(timeout=0) is not None
+    assert ring.acquire(timeout=0) is not None
+    assert ring.acquire(timeout=0) is None
+
+
+def test_items_without_slot_are_ignored(ring):
+    frame = np.ones((4, 6, 3), dtype=np.uint8)
+    item = SimpleNamespace(slot=None, frame=frame)
+    ring.retain(item)
+    ring.release(item)
+    assert ring.load(item) is frame
+    assert ring.in_use() == 0
+
+
+def test_reserve_rejects_wrong_shape(ring):
+    with pytest.raises(ValueError):
+        ring.reserve((2, 2, 3))
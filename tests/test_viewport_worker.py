@@ -0,0 +1,37 @@
+from hometeamproj.pipeline.viewport_worker import cluster_motion_boxes
+
+SPAN = (100, 100)
+
+
+def test_no_boxes_or_no_clusters():
+    assert cluster_motion_boxes([], 2, SPAN) == []
+    assert cluster_motion_boxes([(0, 0, 10, 10)], 0, SPAN) == []
+
+
+def test_action_one_viewport_can_frame_stays_together():
+    boxes = [(0, 0, 10, 10), (40, 40, 10, 10)]  # centers 40 px apart, inside half a span
+    [(members, center)] = cluster_motion_boxes(boxes, 3, SPAN)
+    assert members == boxes
+    assert center == (25, 25)
+
+
+def test_distant_groups_split_largest_first():
+    small = [(500, 0, 10, 10)]
+    large = [(0, 0, 20, 20), (20, 0, 20, 20)]
+    clusters = cluster_motion_boxes(small + large, 2, SPAN)
+
+    assert [members for members, _ in clusters] == [large, small]
+    assert [center for _, center in clusters] == [(20, 10), (505, 5)]
+
+
+def test_at_most_k_clusters():
+    boxes = [(x, 0, 10, 10) for x in (0, 300, 600, 900)]
+    clusters = cluster_motion_boxes(boxes, 2, SPAN)
+    assert len(clusters) == 2
+    assert sorted(b for members, _ in clusters for b in members) == boxes
+
+
+def test_center_is_area_weighted():
+    boxes = [(0, 0, 30, 30), (40, 0, 10, 10)]  # areas 900 and 100
+    [(_, (cx, cy))] = cluster_motion_boxes(boxes, 1, SPAN)
+    assert (cx, cy) == (round((15 * 900 + 45 * 100) / 1000), round((15 * 900 + 5 * 100) / 1000))
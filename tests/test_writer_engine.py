@@ -0,0 +1,71 @@
+import numpy as np
+
+from hometeamproj.pipeline.writer_engine import WriterEngine
+
+
+class BrokenWriter:
+    def __init__(self):
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def write(self, image):
+        raise ValueError("frame shape does not match the writer")
+
+    def release(self):
+        self.released = True
+
+
+def test_video_failure_drops_frames_instead_of_hanging(tmp_path):
+    engine = WriterEngine(str(tmp_path), fps=5, max_inflight=1, part=0)
+    writer = BrokenWriter()
+    engine._open_video = lambda name, size: writer
+
+    done = []
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+    # More frames than the bounded queue holds: a dead video thread would block here
+    for _ in range(5):
+        engine.write_video("viewport", image, done=done.append)
+    engine.flush()
+    engine.close()
+
+    assert len(done) == 5
+    assert engine.video_failed
+    assert engine.video_frames_written == 0
+    assert engine.video_frames_dropped == 5
+    assert writer.released
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.frames = []
+
+    def isOpened(self):
+        return True
+
+    def write(self, image):
+        self.frames.append(int(image[0, 0, 0]))
+
+    def release(self):
+        pass
+
+
+def test_fill_gaps_repeats_the_previous_frame(tmp_path):
+    engine = WriterEngine(str(tmp_path), fps=5, part=0, fill_gaps=True)
+    writer = RecordingWriter()
+    engine._open_video = lambda name, size: writer
+
+    done = []
+    frames = [np.full((4, 4, 3), value, dtype=np.uint8) for value in (1, 2, 3)]
+    engine.write_video("viewport", frames[0], done=done.append, repeat=3)  # nothing to repeat yet
+    engine.write_video("viewport", frames[1], done=done.append)
+    engine.write_video("viewport", frames[2], done=done.append, repeat=2)
+    engine.flush()
+    # The last frame is held for the next gap until the engine closes
+    assert [int(image[0, 0, 0]) for image in done] == [1, 2]
+    engine.close()
+
+    assert writer.frames == [1, 2, 2, 2, 3]
+    assert len(done) == 3
+    assert (engine.video_frames_written, engine.video_frames_repeated) == (3, 2)